@@ -2,18 +2,68 @@
 
 
 import sys
+from typing import List
 
-from forge.cli import forge_cli, inject_forge_plugins
+from forge import completion, dispatch, forge, profiling
 from forge.exceptions import (PluginManagementFatalException,
                               PluginManagementWarnException)
 
 
-def main() -> None:
-    """ Error-handled entry point for cli entry point """
+def complete() -> None:
+    """ Answers a completion script from the completion cache, without loading the CLI """
+    names = completion.filter_names(forge.get_completion_names(), sys.argv[1:])
+    sys.stdout.write(''.join(f'{name}\n' for name in names))
+
+
+def run_from_dispatch_table(args: List[str]) -> None:
+    """ Runs a plugin straight from the dispatch table, returns if it is not listed there """
+    with profiling.phase('dispatch_table'):
+        executable = dispatch.lookup_executable(
+            forge.get_dispatch_table_path(), forge.PLUGIN_PATH, args[0]
+        )
+    if executable:
+        dispatch.run_plugin(args, executable, forge.get_zygote_socket_path(args[0]),
+                            forge.get_stats_path())
+
+
+def print_cached_help(command_name: str) -> bool:
+    """ Prints a plugin's cached help, False if it has not been captured yet """
+    text = forge.get_plugin_help(command_name)
+    if text is not None:
+        sys.stdout.write(text)
+    return text is not None
+
+
+def run_without_cli(args: List[str]) -> bool:
+    """ Serves a command line without loading the CLI where possible, False if it needs it """
+    if dispatch.is_plugin_invocation(args):
+        run_from_dispatch_table(args)
+    if dispatch.is_plugin_help_request(args) and print_cached_help(args[0]):
+        return True
+    from forge import daemon  # pylint: disable=import-outside-toplevel
+    return daemon.run_client(args)
+
+
+def run_cli() -> None:
+    """ Runs the click CLI, mapping plugin management exceptions to exit codes """
+    with profiling.phase('imports'):
+        from forge.cli import forge_cli  # pylint: disable=import-outside-toplevel
     try:
-        inject_forge_plugins()
-        forge_cli()  # pylint: disable=no-value-for-parameter
+        with profiling.phase('cli'):
+            forge_cli()  # pylint: disable=no-value-for-parameter
     except PluginManagementFatalException:
         sys.exit(1)
     except PluginManagementWarnException:
         sys.exit(0)
+    finally:
+        profiling.report()
+
+
+def main() -> None:
+    """ Error-handled entry point for cli entry point """
+    if completion.is_requested():
+        complete()
+    elif run_without_cli(sys.argv[1:]):
+        profiling.report()
+    else:
+        run_cli()
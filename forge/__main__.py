@@ -0,0 +1,6 @@
+""" Allows running Forge with python -m forge """
+
+from forge import main
+
+if __name__ == '__main__':
+    main()
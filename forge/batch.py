@@ -0,0 +1,173 @@
+""" Concurrent plugin operations with a combined progress display """
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, NamedTuple, Optional, TextIO
+
+from halo import Halo
+from tabulate import tabulate
+
+from . import forge, process
+from .exceptions import (PluginManagementFatalException,
+                         PluginManagementWarnException)
+from .package_index import UpdateCheck, check_updates, get_index_url
+from .pipx_wrapper import make_spinner, uninstall_plugin, upgrade_plugin
+from .util import is_plain_requirement
+
+SUCCEEDED = 'succeeded'
+WARNED = 'warned'
+FAILED = 'failed'
+
+
+class BatchResult(NamedTuple):
+    """ Outcome of a single plugin operation within a batch """
+    name: str
+    status: str
+    message: str
+
+
+def run_operation(operation: Callable[[str], str], name: str) -> BatchResult:
+    """ Runs one plugin operation, capturing its outcome instead of raising
+
+    Unexpected errors fail only their own plugin, so the rest of the batch and its summary go on.
+    """
+    try:
+        status, message = SUCCEEDED, operation(name)
+    except PluginManagementWarnException as warning:
+        status, message = WARNED, str(warning)
+    except PluginManagementFatalException as err:
+        status, message = FAILED, str(err)
+    except Exception as err:  # pylint: disable=broad-except
+        status, message = FAILED, f'{type(err).__name__}: {err}'
+
+    return BatchResult(name=name, status=status, message=message.strip())
+
+
+def run_batch(operation: Callable[[str], str], names: List[str], jobs: int, label: str,
+              stream: Optional[TextIO] = None) -> List[BatchResult]:
+    """ Runs an operation over plugins on a bounded worker pool, in input order """
+    results = {}
+    with make_spinner(text=f'{label} [0/{len(names)}]...', stream=stream) as spinner, \
+            ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_operation, operation, name) for name in names]
+
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.name] = result
+                pretty_name = result.name.replace('forge-', '', 1)
+                persist = {SUCCEEDED: spinner.succeed, WARNED: spinner.warn, FAILED: spinner.fail}
+                persist[result.status](f'[{pretty_name}] {summarize_message(result.message)}')
+                spinner.start(f'{label} [{len(results)}/{len(names)}]...')
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            process.stop_all()
+            raise
+
+    return [results[name] for name in names]
+
+
+def summarize_message(message: str) -> str:
+    """ Last meaningful line of a possibly multi-line pipx message """
+    lines = [line.strip() for line in message.splitlines() if line.strip()]
+    return lines[-1] if lines else ''
+
+
+def print_summary(results: List[BatchResult], stream: Optional[TextIO] = None) -> None:
+    """ Prints a table of each plugin's outcome, on stdout unless given another stream """
+    tabulated_data = [
+        (result.name.replace('forge-', '', 1), result.status, summarize_message(result.message))
+        for result in results
+    ]
+    print(tabulate(tabulated_data, ['plugin', 'result', 'details']), end='\n\n', file=stream)
+
+
+def raise_for_results(results: List[BatchResult]) -> None:
+    """ Raises the exception matching the worst outcome in the batch """
+    statuses = {result.status for result in results}
+    if FAILED in statuses:
+        raise PluginManagementFatalException(
+            f'{sum(result.status == FAILED for result in results)} plugin(s) failed'
+        )
+    if WARNED in statuses:
+        raise PluginManagementWarnException(
+            f'{sum(result.status == WARNED for result in results)} plugin(s) had warnings'
+        )
+
+
+def process_plugins(operation: Callable[[str], str], names: List[str],
+                    jobs: int, label: str) -> List[BatchResult]:
+    """ Runs a batch, prints its summary and raises for its worst outcome """
+    results = run_batch(operation, names, jobs, label)
+    if results:
+        print_summary(results)
+    raise_for_results(results)
+    return results
+
+
+def update_plugins(names: List[str], extra_args: List[str], jobs: int) -> List[BatchResult]:
+    """ Updates plugins concurrently """
+    return process_plugins(
+        lambda name: upgrade_plugin(name, extra_args), names, jobs, 'Updating plugins'
+    )
+
+
+def uninstall_plugins(names: List[str], extra_args: List[str], jobs: int) -> List[BatchResult]:
+    """ Uninstalls plugins concurrently """
+    return process_plugins(
+        lambda name: uninstall_plugin(name, extra_args), names, jobs, 'Removing plugins'
+    )
+
+
+def check_plugin_updates(names: List[str], jobs: int) -> List[UpdateCheck]:
+    """ Compares installed plugins with the latest versions on the package index
+
+    Only plugins installed from a plain requirement are looked up, on the index pip installs them
+    from. The index knows nothing about a git or path install that happens to share its name with
+    a project, and an install whose index forge can't tell is not compared with PyPI either. Those
+    come back with an unknown latest version, so an update still runs pipx upgrade for them.
+    """
+    packages = {config['main_package']['package']: config['main_package']
+                for config in forge.get_plugins()}
+    installed_versions = {
+        name: packages.get(name, {}).get('package_version', '') for name in names
+    }
+    index_urls = {
+        name: get_index_url(packages.get(name, {}).get('pip_args', [])) for name in names
+        if is_plain_requirement(packages.get(name, {}).get('package_or_url', name))
+    }
+    indexed = {
+        check.package: check for check in check_updates(
+            {name: installed_versions[name] for name, index_url in index_urls.items() if index_url},
+            forge.get_cache_path('index'),
+            jobs,
+            {name: index_url for name, index_url in index_urls.items() if index_url}
+        )
+    }
+    return [indexed.get(name) or UpdateCheck(name, installed_versions[name], None)
+            for name in names]
+
+
+def print_update_checks(checks: List[UpdateCheck]) -> None:
+    """ Prints a table of what an update would change """
+    tabulated_data = [
+        (
+            check.package.replace('forge-', '', 1),
+            check.installed,
+            check.latest or 'unknown',
+            'unknown' if check.latest is None else
+            'update available' if check.needs_update else 'up to date'
+        )
+        for check in checks
+    ]
+    print(tabulate(tabulated_data, ['plugin', 'installed', 'latest', 'status']), end='\n\n')
+
+
+def skip_up_to_date(names: List[str], jobs: int) -> List[str]:
+    """ Drops the plugins the package index says are current, announcing each one """
+    checks = check_plugin_updates(names, jobs)
+    for check in checks:
+        if not check.needs_update:
+            pretty_name = check.package.replace('forge-', '', 1)
+            Halo().succeed(f'[{pretty_name}] is already up to date ({check.installed})')
+    return [check.package for check in checks if check.needs_update]
@@ -0,0 +1,109 @@
+""" Precompiling plugin venvs so their first run doesn't have to write .pyc files """
+
+import importlib.util
+import os
+import py_compile
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from subprocess import TimeoutExpired
+from typing import List, Optional
+
+from .inprocess import get_venv_python_version
+from .process import get_timeout, run
+from .util import get_python_path, get_site_packages
+
+COMPILE_ENV_VAR = 'FORGE_COMPILE'
+MIN_POOL_SOURCES = 32
+HEADER_SIZE = 16
+
+
+def is_enabled() -> bool:
+    """ Whether add and update precompile the venvs they touch, FORGE_COMPILE=0 turns it off """
+    return os.environ.get(COMPILE_ENV_VAR) != '0'
+
+
+def find_sources(root: str) -> List[str]:
+    """ Python source files below a directory """
+    sources: List[str] = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if name != '__pycache__']
+        sources.extend(os.path.join(directory, name) for name in files if name.endswith('.py'))
+    return sorted(sources)
+
+
+def read_header(path: str) -> bytes:
+    """ First bytes of a bytecode file, empty if there is none """
+    try:
+        with open(path, 'rb') as cache_file:
+            return cache_file.read(HEADER_SIZE)
+    except OSError:
+        return b''
+
+
+def get_source_stamp(source: str) -> bytes:
+    """ Modification time and size of a source as a timestamp based .pyc header records them """
+    try:
+        source_stat = os.stat(source)
+    except OSError:
+        return b''
+    return (int(source_stat.st_mtime) & 0xFFFFFFFF).to_bytes(4, 'little') + \
+        (source_stat.st_size & 0xFFFFFFFF).to_bytes(4, 'little')
+
+
+def is_stale(source: str) -> bool:
+    """ Whether a source has no bytecode yet, or bytecode of another source revision or Python """
+    header = read_header(importlib.util.cache_from_source(source))
+    if len(header) < HEADER_SIZE or header[:4] != importlib.util.MAGIC_NUMBER:
+        return True
+    hash_based = bool(int.from_bytes(header[4:8], 'little') & 1)
+    return not hash_based and header[8:16] != get_source_stamp(source)
+
+
+def compile_source(source: str) -> bool:
+    """ Writes the bytecode of one source, False if it doesn't compile or can't be written """
+    try:
+        py_compile.compile(source, doraise=True,
+                           invalidation_mode=py_compile.PycInvalidationMode.TIMESTAMP)
+    except (py_compile.PyCompileError, OSError, ValueError):
+        return False
+    return True
+
+
+def compile_sources(sources: List[str], workers: Optional[int] = None) -> int:
+    """ Compiles sources across a process pool, serially when there are too few to be worth it
+
+    Batch workers compile serially too: forking the multithreaded forge process for the pool can
+    deadlock on a lock another thread held at the time.
+    """
+    if len(sources) < MIN_POOL_SOURCES or workers == 1 \
+            or threading.current_thread() is not threading.main_thread():
+        return sum(map(compile_source, sources))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunk_size = max(1, len(sources) // (4 * (workers or os.cpu_count() or 1)))
+        return sum(executor.map(compile_source, sources, chunksize=chunk_size))
+
+
+def compile_with_venv_python(venv_path: str, site_packages: str, force: bool) -> int:
+    """ Compiles with the venv's own interpreter when it isn't forge's Python version """
+    command = [get_python_path(venv_path), '-m', 'compileall', '-j', '0', site_packages]
+    try:
+        process = run(command + (['-f'] if force else []), timeout=get_timeout('compile'))
+    except (OSError, TimeoutExpired):
+        return 0
+    return sum(line.startswith('Compiling ') for line in process.stdout.splitlines())
+
+
+def compile_venv(venv_path: str, force: bool = False, workers: Optional[int] = None) -> int:
+    """ Compiles a venv's stale or missing bytecode, every file when forced, returns the count """
+    site_packages = get_site_packages(venv_path)
+    if site_packages is None:
+        return 0
+    if get_venv_python_version(venv_path) not in (None, sys.version_info[:2]):
+        compiled = compile_with_venv_python(venv_path, site_packages, force)
+    else:
+        sources = find_sources(site_packages)
+        compiled = compile_sources(sources if force else [
+            source for source in sources if is_stale(source)
+        ], workers)
+    return compiled
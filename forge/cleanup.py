@@ -0,0 +1,235 @@
+""" Finding and removing what forge and pipx left behind under FORGE_PATH """
+
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .doctor import find_orphaned_links
+from .inprocess import get_venv_python_version
+from .registry import try_read_entry
+
+MAX_AGE_ENV_VAR = 'FORGE_GC_MAX_AGE_DAYS'
+DEFAULT_MAX_AGE_DAYS = 30
+CACHE_SIZE_ENV_VAR = 'FORGE_GC_CACHE_MB'
+DEFAULT_CACHE_SIZE_MB = 512
+ORPHAN_MIN_AGE = 3600
+PIPX_TRASH_DIR_NAME = '.trash'
+MEASURE_JOBS = 8
+
+CacheUnit = Tuple[str, int, float]
+
+
+class Reclaimable(NamedTuple):
+    """ A file or directory that can be removed and the disk space it takes """
+    path: str
+    size: int
+    reason: str
+
+
+class VenvScan(NamedTuple):
+    """ Disk usage of a venv and the bytecode in it no Python would load anymore """
+    size: int
+    stale_bytecode: List[Tuple[str, int]]
+
+
+def get_env_number(env_var: str, default: int) -> int:
+    """ Non-negative integer setting from the environment, the default if unset or invalid """
+    value = os.environ.get(env_var, '')
+    return int(value) if value.isdigit() else default
+
+
+def get_size(entry: os.DirEntry) -> int:
+    """ Bytes a directory entry takes, links counted as themselves """
+    try:
+        return entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        return 0
+
+
+def is_stale_bytecode(cache_dir: str, file_name: str, cache_tag: Optional[str]) -> bool:
+    """ Whether a .pyc in a __pycache__ belongs to a removed source or another Python """
+    parts = file_name.split('.')
+    if len(parts) < 3 or parts[-1] != 'pyc':
+        return False
+    source = os.path.join(os.path.dirname(cache_dir), f'{parts[0]}.py')
+    return not os.path.exists(source) or (cache_tag is not None and parts[1] != cache_tag)
+
+
+def scan_tree(root: str, cache_tag: Optional[str] = None) -> VenvScan:
+    """ Walks a tree with os.scandir, adding up its size and collecting stale bytecode """
+    size = 0
+    stale: List[Tuple[str, int]] = []
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+                continue
+            entry_size = get_size(entry)
+            size += entry_size
+            if os.path.basename(directory) == '__pycache__' and \
+                    is_stale_bytecode(directory, entry.name, cache_tag):
+                stale.append((entry.path, entry_size))
+    return VenvScan(size=size, stale_bytecode=stale)
+
+
+def get_cache_tag(venv_path: str) -> Optional[str]:
+    """ Bytecode cache tag of a venv's interpreter, e.g. cpython-39 """
+    version = get_venv_python_version(venv_path)
+    return f'cpython-{version[0]}{version[1]}' if version else None
+
+
+def scan_venvs(venv_paths: Dict[str, str]) -> Dict[str, VenvScan]:
+    """ Scans many venvs concurrently """
+    if not venv_paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(MEASURE_JOBS, len(venv_paths))) as executor:
+        scans = executor.map(lambda path: scan_tree(path, get_cache_tag(path)),
+                             venv_paths.values())
+        return dict(zip(venv_paths, scans))
+
+
+def find_orphaned_venvs(venv_paths: Dict[str, str], scans: Dict[str, VenvScan],
+                        now: float) -> List[Reclaimable]:
+    """ Venvs without usable pipx metadata, left alone while they may still be installing """
+    orphans = []
+    for venv_name, venv_path in sorted(venv_paths.items()):
+        entry, _ = try_read_entry(venv_path)
+        try:
+            settled = now - os.stat(venv_path).st_mtime >= ORPHAN_MIN_AGE
+        except OSError:
+            settled = False
+        if entry is None and settled:
+            orphans.append(Reclaimable(venv_path, scans[venv_name].size,
+                                       'orphaned venv without usable pipx metadata'))
+    return orphans
+
+
+def list_entries(root: str) -> List[CacheUnit]:
+    """ Top level entries of a directory with their whole size and last use """
+    with os.scandir(root) as entries:
+        return [(entry.path, scan_tree(entry.path).size if entry.is_dir() else get_size(entry),
+                 entry.stat(follow_symlinks=False).st_mtime) for entry in entries]
+
+
+def list_files(root: str) -> List[CacheUnit]:
+    """ Every file below a directory with its size and last use, read or written """
+    units = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            try:
+                file_stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            units.append((os.path.join(directory, name), file_stat.st_size,
+                          max(file_stat.st_atime, file_stat.st_mtime)))
+    return units
+
+
+def list_cache_units(root: str, whole_entries: bool) -> List[CacheUnit]:
+    """ Removable units of a cache, its files or its top level entries """
+    if not os.path.isdir(root):
+        return []
+    return list_entries(root) if whole_entries else list_files(root)
+
+
+def plan_caches(units: List[CacheUnit], keep: Set[str], now: float,
+                max_age_days: int, max_bytes: int) -> List[Reclaimable]:
+    """ Cache units older than the age limit, then the least recently used beyond the size limit """
+    candidates = sorted((unit for unit in units if unit[0] not in keep), key=lambda unit: unit[2])
+    total = sum(unit[1] for unit in units)
+    plan = []
+    for path, size, mtime in candidates:
+        if now - mtime > max_age_days * 86400:
+            reason = f'cache unused for over {max_age_days} days'
+        elif total > max_bytes:
+            reason = f'cache over {max_bytes // 1000000} MB'
+        else:
+            continue
+        plan.append(Reclaimable(path, size, reason))
+        total -= size
+    return plan
+
+
+def remove(item: Reclaimable) -> bool:
+    """ Removes a planned file or directory, False if it couldn't be """
+    try:
+        if os.path.isdir(item.path) and not os.path.islink(item.path):
+            shutil.rmtree(item.path)
+        else:
+            os.remove(item.path)
+    except OSError:
+        return False
+    return True
+
+
+def get_cache_plan(cache_roots: Dict[str, bool], keep: Set[str],
+                   capped_dirs: Optional[Dict[str, int]] = None) -> List[Reclaimable]:
+    """ Cache units to prune under the FORGE_GC_MAX_AGE_DAYS and FORGE_GC_CACHE_MB policies
+
+    Directories in capped_dirs, below a cache root or not, are held to their own size limit
+    in bytes instead, the age limit still applies to them.
+    """
+    capped_dirs = capped_dirs or {}
+    units = [unit for root, whole_entries in cache_roots.items()
+             for unit in list_cache_units(root, whole_entries)
+             if not any(unit[0].startswith(directory + os.sep) for directory in capped_dirs)]
+    now, max_age_days = time.time(), get_env_number(MAX_AGE_ENV_VAR, DEFAULT_MAX_AGE_DAYS)
+    plan = plan_caches(units, keep, now, max_age_days,
+                       get_env_number(CACHE_SIZE_ENV_VAR, DEFAULT_CACHE_SIZE_MB) * 1000000)
+    for directory, max_bytes in sorted(capped_dirs.items()):
+        plan.extend(plan_caches(list_cache_units(directory, whole_entries=False), keep, now,
+                                max_age_days, max_bytes))
+    return plan
+
+
+def find_orphaned_snapshots(snapshots_root: str, venv_paths: Dict[str, str]) -> List[Reclaimable]:
+    """ Snapshots kept for plugin venvs that are gone, e.g. after a pipx uninstall """
+    return [Reclaimable(path, size, 'snapshots of a removed plugin')
+            for path, size, _ in list_cache_units(snapshots_root, whole_entries=True)
+            if os.path.basename(path) not in venv_paths]
+
+
+def make_plan(venv_paths: Dict[str, str], plugin_path: str,
+              bin_dir: str) -> Tuple[Dict[str, int], List[Reclaimable]]:
+    """ Size of every venv and what can be reclaimed from the venvs, pipx's trash and bin dir """
+    scans = scan_venvs(venv_paths)
+    plan = find_orphaned_venvs(venv_paths, scans, time.time())
+    orphaned = {item.path for item in plan}
+    plan.extend(
+        Reclaimable(path, size, 'bytecode of a removed source or another Python')
+        for venv_name, scan in sorted(scans.items()) if venv_paths[venv_name] not in orphaned
+        for path, size in scan.stale_bytecode
+    )
+    plan.extend(Reclaimable(os.path.join(bin_dir, app), 0, 'console script of a removed venv')
+                for app in find_orphaned_links(bin_dir, plugin_path))
+    plan.extend(Reclaimable(path, size, 'pipx trash') for path, size, _ in list_cache_units(
+        os.path.join(os.path.dirname(plugin_path), PIPX_TRASH_DIR_NAME), whole_entries=True
+    ))
+    return {venv_name: scan.size for venv_name, scan in scans.items()}, plan
+
+
+def format_size(size: int) -> str:
+    """ Human readable size in MB """
+    return f'{size / 1e6:.1f} MB'
+
+
+def format_report(venv_sizes: Dict[str, int], plan: List[Reclaimable], dry_run: bool) -> str:
+    """ Size of every venv, what is reclaimable and the total """
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
+    venvs = tabulate([(name.replace('forge-', '', 1), format_size(size))
+                      for name, size in sorted(venv_sizes.items())], ['plugin', 'size'])
+    items = tabulate([(format_size(item.size), item.reason, item.path) for item in plan],
+                     ['size', 'reason', 'path'])
+    total = format_size(sum(item.size for item in plan))
+    return f'{venvs}\n\n{items}\n\n' + \
+        (f'Would reclaim {total}, run without --dry-run to remove it\n' if dry_run
+         else f'Reclaimed {total}\n')
@@ -1,19 +1,24 @@
 """ Forge CLI """
 
-from typing import List
-from subprocess import Popen
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+import os
 import sys
 import click
-import pkg_resources
 
-from forge import forge
-
-from .pipx_wrapper import install_to_pipx, uninstall_from_pipx, update_pipx
+from forge import completion, dispatch, forge, profiling, registry
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'],
                         ignore_unknown_options=True,
                         allow_extra_args=True)
 
+DEFAULT_JOBS = 4
+OWN_HELP_COMMANDS = ('list', 'update', 'remove', 'completion', 'daemon', 'shared', 'serve',
+                     'compile', 'doctor', 'gc', 'stats', 'rollback')
+
+PLUGIN_NAMES_KEY = 'forge.plugin_command_names'
+PLUGIN_LOOKUPS_KEY = 'forge.plugin_lookups'
+
 
 def print_cmd_help(ctx: click.Context, param, value) -> None:  # type: ignore # pylint: disable=unused-argument
     """ Command help handler for dealing with nested commands """
@@ -28,23 +33,104 @@ def print_cmd_help(ctx: click.Context, param, value) -> None:  # type: ignore #
         name, cmd, args = group.resolve_command(ctx, args)  # type: ignore
         help_names = cmd.get_help_option_names(ctx)
 
-        if (set(args) & help_names) and name not in ('list', 'update', 'remove'):
-            if name in forge.get_forge_plugin_command_names():
-                run_forge_plugin([name, '-h'])
+        if (set(args) & help_names) and name not in OWN_HELP_COMMANDS:
+            if isinstance(cmd, PluginCommand):
+                print_plugin_help(ctx, name)
             else:
                 cmd_ctx = click.Context(cmd, info_name=cmd.name, parent=ctx)
                 click.echo(cmd_ctx.get_help())
                 cmd_ctx.exit()
 
 
-@click.group(invoke_without_command=True, context_settings=CONTEXT_SETTINGS)
+def print_plugin_help(ctx: click.Context, name: str) -> None:
+    """ Prints a plugin's help from the cache, only starting the plugin if it has to """
+    text = forge.get_plugin_help(name, capture=True)
+    if text is None:
+        run_forge_plugin([name, '-h'])
+    click.echo(text, nl=False)
+    ctx.exit()
+
+
+def get_version() -> str:
+    """ Installed version of forge, resolved without scanning every distribution """
+    try:
+        from importlib.metadata import version  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        from pkg_resources import get_distribution  # pylint: disable=import-outside-toplevel
+        return str(get_distribution('tele-forge').version)
+    return version('tele-forge')
+
+
+def print_version(ctx: click.Context, param, value: bool) -> None:  # type: ignore # pylint: disable=unused-argument
+    """ Version option handler, only looks the version up when asked for """
+    if value and not ctx.resilient_parsing:
+        click.echo(f'{ctx.find_root().info_name}, version {get_version()}')
+        ctx.exit()
+
+
+def enable_profiling(ctx: click.Context, param, value: bool) -> None:  # type: ignore # pylint: disable=unused-argument
+    """ Profile option handler """
+    if value:
+        profiling.enable()
+
+
+class PluginCommand(click.Command):
+    """ Click command that hands the raw command line over to a forge plugin """
+
+
+class ForgeGroup(click.Group):
+    """ Click group that only looks plugins up when they are asked for """
+
+    def get_plugin_command_names(self, ctx: click.Context) -> List[str]:
+        """ Plugin command names, scanned at most once per invocation """
+        if PLUGIN_NAMES_KEY not in ctx.meta:
+            ctx.meta[PLUGIN_NAMES_KEY] = forge.get_forge_plugin_command_names()
+        return list(ctx.meta[PLUGIN_NAMES_KEY])
+
+    def is_plugin_command(self, ctx: click.Context, cmd_name: str) -> bool:
+        """ Check a single command name against the installed plugins """
+        if PLUGIN_NAMES_KEY in ctx.meta:
+            return cmd_name in ctx.meta[PLUGIN_NAMES_KEY]
+
+        lookups: Dict[str, bool] = ctx.meta.setdefault(PLUGIN_LOOKUPS_KEY, {})
+        if cmd_name not in lookups:
+            lookups[cmd_name] = forge.find_plugin(cmd_name) is not None
+        return lookups[cmd_name]
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        return sorted(set(super().list_commands(ctx)) | set(self.get_plugin_command_names(ctx)))
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        with profiling.phase('command_resolve'):
+            command = super().get_command(ctx, cmd_name)
+            if command is None and self.is_plugin_command(ctx, cmd_name):
+                command = make_plugin_command(plugin_name=cmd_name)
+        return command
+
+
+@click.group(cls=ForgeGroup, invoke_without_command=True, context_settings=CONTEXT_SETTINGS)
 @click.option(
     "-h",
     "--help",
     callback=print_cmd_help,
     is_flag=True
 )
-@click.version_option(pkg_resources.require("tele-forge")[0].version)
+@click.option(
+    "--version",
+    callback=print_version,
+    is_flag=True,
+    expose_value=False,
+    is_eager=True,
+    help='Show the version and exit.'
+)
+@click.option(
+    "--profile",
+    callback=enable_profiling,
+    is_flag=True,
+    expose_value=False,
+    is_eager=True,
+    help=f'Print startup phase timings as JSON on stderr, same as {profiling.PROFILE_ENV_VAR}=1.'
+)
 def forge_cli(help: str) -> None:  # pylint: disable=redefined-builtin, unused-argument
     """ Command Line Interface for Forge """
     if click.get_current_context().invoked_subcommand is None:
@@ -56,42 +142,79 @@ def forge_cli(help: str) -> None:  # pylint: disable=redefined-builtin, unused-a
 @click.option('-s', '--source',
               type=str,
               help='Source of plugin to install',
-              metavar='PLUGIN_SOURCE',
-              required=True)
-def add_plugin(source: str, pipx_args: List[str]) -> None:
-    """ Add plugin to Forge by providing source to be passed to PIPX """
-    install_to_pipx(source=source, extra_args=list(pipx_args))
+              metavar='PLUGIN_SOURCE')
+@click.option('-m', '--manifest',
+              type=click.Path(exists=True, dir_okay=False),
+              help='TOML or JSON file listing plugins to install',
+              metavar='MANIFEST')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=DEFAULT_JOBS, show_default=True,
+              help='Number of manifest plugins to install at once')
+@click.option('--report',
+              type=click.Path(dir_okay=False),
+              help='Write a JSON report of a manifest install to this file, - for stdout',
+              metavar='REPORT')
+def add_plugin(source: str, manifest: str, jobs: int, report: str, pipx_args: List[str]) -> None:
+    """ Add plugin(s) to Forge from a source or manifest to be passed to PIPX """
+    if bool(source) == bool(manifest):
+        raise click.UsageError('Provide exactly one of --source or --manifest')
+
+    if manifest:
+        from .manifest import install_manifest  # pylint: disable=import-outside-toplevel
+        install_manifest(path=manifest, extra_args=list(pipx_args), jobs=jobs, report_path=report)
+    else:
+        from .pipx_wrapper import install_to_pipx  # pylint: disable=import-outside-toplevel
+        install_to_pipx(source=source, extra_args=list(pipx_args))
 
 
 @forge_cli.command(name='update')
 @click.argument('pipx_args', nargs=-1, type=click.UNPROCESSED)
 @click.option('-n', '--name', type=str, help='Name of plugin(s) to update', metavar='PLUGIN_NAME')
-def update_plugin(name: str, pipx_args: List[str]) -> None:
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=DEFAULT_JOBS, show_default=True,
+              help='Number of plugins to update at once')
+@click.option('--check', is_flag=True, help='Only report which plugins have updates available')
+@click.option('--force', is_flag=True, help='Run pipx upgrade even for plugins that are up to date')
+def update_plugin(name: str, jobs: int, check: bool, force: bool, pipx_args: List[str]) -> None:
     """ Update plugin(s) """
+    from .pipx_wrapper import update_pipx  # pylint: disable=import-outside-toplevel
+    from . import batch  # pylint: disable=import-outside-toplevel
+    if name and not name.startswith('forge-'):
+        name = f'forge-{name}'
+    names = [name] if name else [
+        plugin['main_package']['package'] for plugin in forge.get_plugins()
+    ]
+
+    if check:
+        batch.print_update_checks(batch.check_plugin_updates(names, jobs))
+        return
+    if not force:
+        names = batch.skip_up_to_date(names, jobs)
+
     if name:
-        if not name.startswith('forge-'):
-            name = f'forge-{name}'
-        update_pipx(name=name, extra_args=list(pipx_args))
+        if names:
+            update_pipx(name=name, extra_args=list(pipx_args))
     else:
-        for plugin in forge.get_plugins():
-            update_pipx(name=plugin['main_package']['package'], extra_args=list(pipx_args))
+        batch.update_plugins(names=names, extra_args=list(pipx_args), jobs=jobs)
 
 
 @forge_cli.command(name='remove')
 @click.argument('pipx_args', nargs=-1, type=click.UNPROCESSED)
 @click.option('-n', '--name', type=str, help='Name of plugin(s) to remove', metavar='PLUGIN_NAME')
-def remove_plugin(name: str, pipx_args: List[str]) -> None:
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=DEFAULT_JOBS, show_default=True,
+              help='Number of plugins to remove at once')
+def remove_plugin(name: str, jobs: int, pipx_args: List[str]) -> None:
     """ Remove plugin(s) """
+    from .pipx_wrapper import uninstall_from_pipx  # pylint: disable=import-outside-toplevel
+    from .batch import uninstall_plugins  # pylint: disable=import-outside-toplevel
     if name:
         if not name.startswith('forge-'):
             name = f'forge-{name}'
         uninstall_from_pipx(plugin_name=name, extra_args=list(pipx_args))
     else:
-        for plugin in forge.get_plugins():
-            uninstall_from_pipx(
-                plugin_name=plugin['main_package']['package'],
-                extra_args=list(pipx_args)
-            )
+        uninstall_plugins(
+            names=[plugin['main_package']['package'] for plugin in forge.get_plugins()],
+            extra_args=list(pipx_args),
+            jobs=jobs
+        )
 
 
 @forge_cli.command(name='list')
@@ -100,34 +223,184 @@ def list_forge_plugins() -> None:
     forge.list_plugins()
 
 
-def run_forge_plugin(command: List[str]) -> None:
-    """ Forge Plugin """
-    process = Popen(command)
+@forge_cli.command(name='reindex')
+def reindex_forge_plugins() -> None:
+    """ Rebuild the plugin registry index """
+    plugin_count = forge.reindex_plugins()
+    click.echo(f'Indexed {plugin_count} forge plugin(s)')
+
+
+@forge_cli.command(name='completion')
+@click.argument('shell', type=click.Choice(completion.SHELLS))
+def print_completion(shell: str) -> None:
+    """ Print a bash, zsh or fish completion script """
+    click.echo(completion.make_script(shell, forge.get_completion_cache_path()), nl=False)
+
+
+def get_help_text() -> str:
+    """ Output of forge --help """
+    return forge_cli.get_help(click.Context(forge_cli, info_name='forge')) + '\n'
+
+
+@forge_cli.command(name='help')
+@click.argument('plugin_name', required=False)
+@click.option('--all', 'show_all', is_flag=True,
+              help='Print the usage of every plugin from the help cache')
+def print_help(plugin_name: str, show_all: bool) -> None:
+    """ Show help for forge or a plugin """
+    if show_all:
+        click.echo(forge.format_all_plugin_help(), nl=False)
+    elif plugin_name:
+        text = forge.get_plugin_help(plugin_name, capture=True)
+        if text is None:
+            raise click.ClickException(f'No help available for {plugin_name}')
+        click.echo(text, nl=False)
+    else:
+        click.echo(get_help_text(), nl=False)
+
+
+@forge_cli.command(name='daemon')
+@click.option('--stop', is_flag=True, help='Stop the running daemon')
+@click.option('--status', is_flag=True, help='Report whether a daemon is running')
+def run_daemon(stop: bool, status: bool) -> None:
+    """ Serve plugin lookups from a resident process """
+    from . import daemon  # pylint: disable=import-outside-toplevel
+    socket_path = forge.get_daemon_socket_path()
+
+    if stop or status:
+        response = daemon.send_request(socket_path, {'op': 'stop' if stop else 'ping'})
+        if response is None:
+            raise click.ClickException(f'No forge daemon is running at {socket_path}')
+        click.echo('Stopped forge daemon' if stop else
+                   f'forge daemon is running at {socket_path} ({response["plugins"]} plugin(s))')
+    else:
+        daemon.serve(socket_path, get_help_text)
+
+
+@forge_cli.command(name='shared')
+@click.option('--min-plugins', type=click.IntRange(min=1), default=2, show_default=True,
+              help='Share dependencies held by at least this many plugins')
+@click.option('--report', 'show_report', is_flag=True,
+              help='Only print the disk space and install time saved so far')
+def sync_shared_layer(min_plugins: int, show_report: bool) -> None:
+    """ Move dependencies plugins have in common into a shared layer """
+    if not show_report:
+        added = forge.sync_shared_layer(min_plugins)
+        click.echo(f'Added {len(added)} package(s) to the shared layer')
+    click.echo(forge.format_shared_savings())
+
 
-    stdout, stderr = process.communicate()
-    if stdout:
-        click.echo(stdout.decode())
+@forge_cli.command(name='compile')
+@click.option('-n', '--name', type=str, help='Name of plugin to compile', metavar='PLUGIN_NAME')
+@click.option('--force', is_flag=True,
+              help='Recompile every file, not just those with stale or missing bytecode')
+def compile_plugin_bytecode(name: str, force: bool) -> None:
+    """ Precompile the bytecode of installed plugins """
+    if name and not name.startswith('forge-'):
+        name = f'forge-{name}'
+    compiled = forge.compile_plugins([name] if name else [], force=force)
+    if name and name not in compiled:
+        raise click.ClickException(f'No plugin named {name} is installed')
+    click.echo(f'Compiled {sum(compiled.values())} file(s) in {len(compiled)} plugin(s)')
 
-    if stderr:
-        click.echo(stderr.decode())
 
-    raise SystemExit(process.returncode)
+@forge_cli.command(name='doctor')
+@click.option('--refresh', is_flag=True, help='Check every plugin again, ignoring cached results')
+def diagnose_plugins(refresh: bool) -> None:
+    """ Check installed plugin venvs for problems """
+    problems = forge.diagnose_plugins(refresh)
+    from .doctor import format_report  # pylint: disable=import-outside-toplevel
+    click.echo(format_report(problems), nl=False)
+    unhealthy = sum(bool(venv_problems) for venv_problems in problems.values())
+    if unhealthy:
+        raise click.ClickException(f'{unhealthy} plugin(s) need attention')
 
 
-def bind_plugin_command(plugin_name: str) -> None:
-    """ Binds plugin command to click cli """
-    @forge_cli.command(name=plugin_name,
-                       context_settings=dict(
-                           ignore_unknown_options=True,
-                           allow_extra_args=True
-                       ))  # pylint: disable=unused-variable
+@forge_cli.command(name='gc')
+@click.option('--dry-run', is_flag=True, help='Only show what would be removed')
+def collect_garbage(dry_run: bool) -> None:
+    """ Reclaim disk space from plugin venvs and caches """
+    from . import cleanup  # pylint: disable=import-outside-toplevel
+    with nullcontext() if dry_run else forge.lock_all_plugins():
+        venv_sizes, plan = forge.plan_cleanup()
+        removed = plan if dry_run else [item for item in plan if cleanup.remove(item)]
+    click.echo(cleanup.format_report(venv_sizes, removed, dry_run), nl=False)
+
+
+@forge_cli.command(name='rollback')
+@click.option('-n', '--name', type=str, required=True, help='Name of plugin to roll back',
+              metavar='PLUGIN_NAME')
+@click.option('--list', 'list_snapshots', is_flag=True,
+              help='Only list the versions to roll back to')
+def rollback_plugin(name: str, list_snapshots: bool) -> None:
+    """ Restore a plugin to the version it had before its last update """
+    if not name.startswith('forge-'):
+        name = f'forge-{name}'
+    if list_snapshots:
+        for snapshot_version in forge.list_plugin_snapshots(name):
+            click.echo(snapshot_version)
+        return
+    try:
+        version = forge.rollback_plugin(name)
+    except OSError as err:
+        raise click.ClickException(f'Could not roll back {name}: {err}') from None
+    if version is None:
+        raise click.ClickException(f'No snapshot of {name} to roll back to')
+    click.echo(f'Rolled back {name} to {version}')
+
+
+@forge_cli.command(name='stats')
+@click.option('-n', '--name', type=str, help='Name of plugin to show', metavar='PLUGIN_NAME')
+def show_plugin_stats(name: str) -> None:
+    """ Show how long plugin runs take and how much they use, per plugin version """
+    from .stats import format_report  # pylint: disable=import-outside-toplevel
+    runs = forge.get_plugin_runs(name.replace('forge-', '', 1) if name else None)
+    click.echo(format_report(runs), nl=False)
+
+
+@forge_cli.command(name='serve')
+@click.argument('plugin_name')
+@click.option('--stop', is_flag=True, help='Stop the running zygote')
+@click.option('--status', is_flag=True, help='Report whether a zygote is running')
+def serve_plugin(plugin_name: str, stop: bool, status: bool) -> None:
+    """ Keep a plugin imported and fork it for each run """
+    from . import zygote  # pylint: disable=import-outside-toplevel
+    socket_path = forge.get_zygote_socket_path(plugin_name)
+
+    if stop or status:
+        response = zygote.send_request(socket_path, {'op': 'stop' if stop else 'ping'})
+        if response is None:
+            raise click.ClickException(f'No zygote is running for {plugin_name}')
+        click.echo(f'Stopped zygote for {plugin_name}' if stop else
+                   f'Zygote for {plugin_name} is running ({response["runs"]} run(s))')
+        return
+
+    executable = forge.get_plugin_executable(plugin_name)
+    if executable is None:
+        raise click.ClickException(f'No plugin named {plugin_name} is installed')
+    zygote.serve(socket_path, plugin_name, executable, os.path.join(
+        os.path.dirname(os.path.dirname(executable)), registry.METADATA_FILE_NAME
+    ))
+
+
+def run_forge_plugin(command: List[str]) -> None:
+    """ Forge Plugin """
+    with profiling.phase('dispatch'):
+        dispatch.run_plugin(command, zygote_path=forge.get_zygote_socket_path(command[0]),
+                            stats_path=forge.get_stats_path())
+
+
+def make_plugin_command(plugin_name: str) -> click.Command:
+    """ Builds the click command for a plugin """
+    @click.command(name=plugin_name,
+                   cls=PluginCommand,
+                   context_settings=dict(
+                       ignore_unknown_options=True,
+                       allow_extra_args=True
+                   ))
     def command() -> None:
         """ Plugin Entrypoint """
         args = sys.argv[2:] if len(sys.argv) > 2 else []
         run_forge_plugin([sys.argv[1]] + args)
 
-
-def inject_forge_plugins() -> None:
-    """ Inject all plugin command names into the click CLI """
-    for command in forge.get_forge_plugin_command_names():
-        bind_plugin_command(plugin_name=command)
+    return command
@@ -0,0 +1,94 @@
+""" Shell completion for forge, answered from a precomputed list of command names """
+
+import os
+from typing import List, Optional
+
+from .storage import atomic_write
+
+COMPLETE_ENV_VAR = '_FORGE_COMPLETE'
+CACHE_FILE_NAME = 'completion.txt'
+SHELLS = ('bash', 'zsh', 'fish')
+BUILTIN_COMMANDS = (
+    'add', 'compile', 'completion', 'daemon', 'doctor', 'gc', 'help', 'list', 'reindex',
+    'remove', 'rollback', 'serve', 'shared', 'stats', 'update'
+)
+GLOBAL_OPTIONS = ('--help', '--profile', '--version', '-h')
+
+BASH_SCRIPT = """_forge_completion() {
+    local names
+    if [ "$COMP_CWORD" -ne 1 ]; then
+        return 0
+    fi
+    if [ -r '%(cache_path)s' ]; then
+        names="$(< '%(cache_path)s')"
+    else
+        names="$(%(env_var)s=bash forge)"
+    fi
+    COMPREPLY=( $(compgen -W "$names" -- "${COMP_WORDS[COMP_CWORD]}") )
+}
+complete -o default -F _forge_completion forge
+"""
+
+ZSH_SCRIPT = """#compdef forge
+_forge() {
+    local -a names
+    if (( CURRENT != 2 )); then
+        _files
+        return
+    fi
+    if [[ -r '%(cache_path)s' ]]; then
+        names=(${(f)"$(< '%(cache_path)s')"})
+    else
+        names=(${(f)"$(%(env_var)s=zsh forge)"})
+    fi
+    compadd -- $names
+}
+compdef _forge forge
+"""
+
+FISH_SCRIPT = """function __forge_command_names
+    if test -r '%(cache_path)s'
+        cat '%(cache_path)s'
+    else
+        env %(env_var)s=fish forge
+    end
+end
+complete -c forge -n 'test (count (commandline -opc)) -eq 1' -f -a '(__forge_command_names)'
+"""
+
+SCRIPTS = {'bash': BASH_SCRIPT, 'zsh': ZSH_SCRIPT, 'fish': FISH_SCRIPT}
+
+
+def make_script(shell: str, cache_path: str) -> str:
+    """ Completion script for a shell, reading the cache file without starting forge """
+    return SCRIPTS[shell] % {'cache_path': cache_path, 'env_var': COMPLETE_ENV_VAR}
+
+
+def make_names(plugin_command_names: List[str]) -> List[str]:
+    """ Every name completed after forge: built-in commands, plugins and global options """
+    return sorted(set(BUILTIN_COMMANDS) | set(plugin_command_names)) + list(GLOBAL_OPTIONS)
+
+
+def read_cache(cache_path: str) -> Optional[List[str]]:
+    """ Completion names from the cache file, None if it has not been written yet """
+    try:
+        with open(cache_path) as cache_file:
+            return cache_file.read().split()
+    except OSError:
+        return None
+
+
+def write_cache(cache_path: str, plugin_command_names: List[str]) -> None:
+    """ Writes the completion names for the given plugin commands """
+    atomic_write(cache_path, '\n'.join(make_names(plugin_command_names)) + '\n')
+
+
+def is_requested() -> bool:
+    """ Whether forge was started by a completion script """
+    return bool(os.environ.get(COMPLETE_ENV_VAR))
+
+
+def filter_names(names: List[str], args: List[str]) -> List[str]:
+    """ Names matching the word being completed, if any was given """
+    prefix = args[-1] if args else ''
+    return [name for name in names if name.startswith(prefix)]
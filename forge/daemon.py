@@ -0,0 +1,179 @@
+""" Resident forge process answering plugin lookups over a Unix domain socket """
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from . import dispatch, forge, profiling, registry
+from .exceptions import (PluginManagementFatalException,
+                         PluginManagementWarnException)
+
+DAEMON_ENV_VAR = 'FORGE_DAEMON'
+PROTOCOL_VERSION = 1
+CLIENT_TIMEOUT = 2.0
+
+
+class DaemonState:
+    """ Plugin lookups kept warm in memory, rebuilt after the watcher reports a change """
+
+    def __init__(self, get_help_text: Callable[[], str]) -> None:
+        self.get_help_text = get_help_text
+        self.lock = threading.Lock()
+        self.dirty = True
+        self.plugins: Dict[str, Dict] = {}
+        self.texts: Dict[str, str] = {}
+
+    def invalidate(self) -> None:
+        """ Marks the lookups stale, the next request rebuilds them """
+        self.dirty = True
+
+    def refresh(self) -> None:
+        """ Rebuilds the lookups if anything changed since they were built """
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            plugin_configs = forge.get_plugins()
+            self.plugins = {
+                forge.get_command_from_config(config): config
+                for config in plugin_configs if config['main_package']['apps']
+            }
+            self.texts = {
+                'list': forge.format_plugin_table(plugin_configs) if plugin_configs else '',
+                'help': self.get_help_text()
+            }
+
+
+def handle_request(state: DaemonState, request: Dict[str, Any]) -> Dict[str, Any]:
+    """ Answers a single client request from the in-memory lookups """
+    state.refresh()
+    operation = request.get('op')
+    if operation == 'resolve':
+        plugin = state.plugins.get(str(request.get('name')))
+        response: Dict[str, Any] = {'ok': plugin is not None, 'plugin': plugin}
+    else:
+        text = state.texts.get(str(operation), '')
+        response = {'ok': bool(text) or operation == 'ping', 'text': text,
+                    'plugins': len(state.plugins)}
+    response['protocol'] = PROTOCOL_VERSION
+    return response
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """ Reads one JSON request line and writes one JSON response line """
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline().decode())
+        except ValueError:
+            request = {}
+
+        server: Any = self.server
+        if request.get('op') == 'stop':
+            threading.Thread(target=server.shutdown, daemon=True).start()
+            response = {'ok': True, 'protocol': PROTOCOL_VERSION}
+        else:
+            response = handle_request(server.state, request)
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+def get_watched_paths() -> List[str]:
+    """ Directories whose changes can affect the installed plugins """
+    if not os.path.isdir(forge.PLUGIN_PATH):
+        return [forge.FORGE_PATH] if os.path.isdir(forge.FORGE_PATH) else []
+    return [forge.PLUGIN_PATH] + list(registry.scan_forge_venvs(forge.PLUGIN_PATH).values())
+
+
+def make_server(socket_path: str, state: DaemonState) -> socketserver.BaseServer:
+    """ Binds the daemon socket, replacing a stale one, readable by the current user only """
+    if send_request(socket_path, {'op': 'ping'}):
+        raise PluginManagementWarnException(f'forge daemon is already running at {socket_path}')
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    previous_umask = os.umask(0o177)
+    try:
+        server: Any = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    finally:
+        os.umask(previous_umask)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def serve(socket_path: str, get_help_text: Callable[[], str]) -> None:
+    """ Runs the daemon in the foreground until stopped or sent SIGTERM """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise PluginManagementFatalException('forge daemon needs Unix domain socket support')
+
+    from . import watcher  # pylint: disable=import-outside-toplevel
+
+    state = DaemonState(get_help_text)
+    stop = threading.Event()
+    server = make_server(socket_path, state)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    threading.Thread(
+        target=watcher.watch, args=(get_watched_paths, state.invalidate, stop), daemon=True
+    ).start()
+
+    try:
+        state.refresh()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def send_request(socket_path: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ One request and response exchange with the daemon, None if it is not reachable """
+    response = None
+    if hasattr(socket, 'AF_UNIX') and os.path.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(CLIENT_TIMEOUT)
+                client.connect(socket_path)
+                client.sendall((json.dumps(request) + '\n').encode())
+                with client.makefile('rb') as reader:
+                    response = json.loads(reader.readline().decode())
+        except (OSError, ValueError):
+            response = None
+    return response if isinstance(response, dict) else None
+
+
+def make_request(args: List[str]) -> Optional[Dict[str, Any]]:
+    """ Daemon request answering a command line, None when it needs the full CLI """
+    request: Optional[Dict[str, Any]] = None
+    if not args or args == ['list']:
+        request = {'op': 'list'}
+    elif len(args) == 1 and args[0] in dispatch.HELP_FLAGS:
+        request = {'op': 'help'}
+    elif dispatch.is_plugin_invocation(args):
+        request = {'op': 'resolve', 'name': args[0]}
+    return request
+
+
+def run_client(args: List[str]) -> bool:
+    """ Serves a command line through a running daemon, False if it has to run in process """
+    request = make_request(args)
+    response = None
+    if request is not None and os.environ.get(DAEMON_ENV_VAR) != '0':
+        with profiling.phase('daemon'):
+            response = send_request(forge.get_daemon_socket_path(), request)
+
+    served = bool(response and response.get('ok') and response.get('protocol') == PROTOCOL_VERSION)
+    if served and request and response:
+        if request['op'] == 'resolve':
+            dispatch.run_plugin(args, zygote_path=forge.get_zygote_socket_path(args[0]),
+                                stats_path=forge.get_stats_path())
+        sys.stdout.write(response['text'])
+    return served
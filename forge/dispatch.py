@@ -0,0 +1,178 @@
+""" Plugin process dispatch """
+
+import os
+import sys
+from json import dumps, loads
+from subprocess import Popen
+from typing import Callable, Dict, List, Optional
+
+from . import completion, profiling, stats
+from .registry import METADATA_FILE_NAME
+from .storage import atomic_write
+
+DISPATCH_ENV_VAR = 'FORGE_DISPATCH'
+EXEC_MODE = 'exec'
+SPAWN_MODE = 'spawn'
+INPROCESS_MODE = 'inprocess'
+
+DISPATCH_TABLE_FILE_NAME = 'dispatch.json'
+HELP_FLAGS = {'-h', '--help'}
+
+
+def get_dispatch_mode() -> str:
+    """ Dispatch mode to use, exec by default wherever the platform supports it """
+    mode = os.environ.get(DISPATCH_ENV_VAR, EXEC_MODE).lower()
+    if mode == INPROCESS_MODE:
+        return INPROCESS_MODE
+    return EXEC_MODE if mode == EXEC_MODE and os.name == 'posix' else SPAWN_MODE
+
+
+def exec_plugin(command: List[str], executable: Optional[str] = None) -> None:
+    """ Replace the forge process with the plugin, only returns if the exec failed """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        if executable:
+            os.execv(executable, command)
+        else:
+            os.execvp(command[0], command)
+    except OSError:
+        pass
+
+
+def spawn_plugin(command: List[str], executable: Optional[str] = None) -> int:
+    """ Run the plugin as a child process and wait for it to exit """
+    process = Popen(command, executable=executable) if executable else Popen(command)
+    process.communicate()
+    return process.returncode
+
+
+def start_plugin(command: List[str], executable: Optional[str], zygote_path: Optional[str],
+                 wait: bool = False, on_exec: Optional[Callable[[], None]] = None) -> None:
+    """ Runs a plugin the fastest way the dispatch mode allows, exiting with its return code
+
+    on_exec is called right before forge is replaced by the plugin, if it is.
+    """
+    if zygote_path and os.path.exists(zygote_path):
+        from . import zygote  # pylint: disable=import-outside-toplevel
+        code = zygote.run_client(zygote_path, command)
+        if code is not None:
+            raise SystemExit(code)
+    mode = get_dispatch_mode()
+    if mode == INPROCESS_MODE and executable:
+        from . import inprocess  # pylint: disable=import-outside-toplevel
+        inprocess.run_plugin(command, executable)
+    if mode != SPAWN_MODE and os.name == 'posix' and not wait:
+        if on_exec:
+            on_exec()
+        exec_plugin(command, executable)
+
+    raise SystemExit(spawn_plugin(command, executable))
+
+
+def run_plugin(command: List[str], executable: Optional[str] = None,
+               zygote_path: Optional[str] = None, stats_path: Optional[str] = None) -> None:
+    """ Hand control over to a plugin command, exiting with its return code """
+    profiling.report()
+    if stats_path and stats.is_enabled():
+        table_path = os.path.join(os.path.dirname(stats_path), DISPATCH_TABLE_FILE_NAME)
+        with stats.recording(stats_path, command[0],
+                             lambda: lookup_version(table_path, command[0])):
+            start_plugin(command, executable, zygote_path, stats.is_measuring_all(),
+                         lambda: stats.record_launch(stats_path, command[0],
+                                                     lookup_version(table_path, command[0])))
+    else:
+        start_plugin(command, executable, zygote_path)
+
+
+def names_plugin(args: List[str]) -> bool:
+    """ Whether a command line starts with something other than an option or built-in command """
+    return bool(args) and not args[0].startswith('-') and args[0] not in completion.BUILTIN_COMMANDS
+
+
+def is_plugin_invocation(args: List[str]) -> bool:
+    """ Whether a command line can only mean running a plugin, without asking for help """
+    return names_plugin(args) and not HELP_FLAGS & set(args[1:])
+
+
+def is_plugin_help_request(args: List[str]) -> bool:
+    """ Whether a command line asks for a plugin's help """
+    return names_plugin(args) and bool(HELP_FLAGS & set(args[1:]))
+
+
+def get_executable_path(venv_path: str, app: str) -> str:
+    """ Path of an app inside a pipx venv """
+    return os.path.join(venv_path, 'Scripts' if os.name == 'nt' else 'bin', app)
+
+
+def get_plugin_path_mtime(plugin_path: str) -> Optional[int]:
+    """ Modification time of the venvs directory, changed by every plugin install or removal """
+    try:
+        return os.stat(plugin_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_metadata_mtime(executable: str) -> Optional[int]:
+    """ Modification time of the pipx metadata next to an app, rewritten by pipx upgrades """
+    try:
+        return os.stat(os.path.join(os.path.dirname(os.path.dirname(executable)),
+                                    METADATA_FILE_NAME)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_table(table_path: str) -> Dict:
+    """ Dispatch table contents, empty if it is missing or unreadable """
+    try:
+        with open(table_path) as table_file:
+            table = loads(table_file.read())
+    except (OSError, ValueError):
+        table = {}
+    return table if isinstance(table, dict) else {}
+
+
+def write_table(table_path: str, plugin_path: str, executables: Dict[str, str],
+                versions: Optional[Dict[str, str]] = None) -> None:
+    """ Writes the command to executable table for the current venvs directory """
+    atomic_write(table_path, dumps(
+        {'plugin_path_mtime': get_plugin_path_mtime(plugin_path), 'commands': executables,
+         'metadata_mtimes': {command_name: get_metadata_mtime(executable)
+                             for command_name, executable in executables.items()},
+         'versions': versions or {}},
+        separators=(',', ':'),
+        sort_keys=True
+    ))
+
+
+def is_table_current(table: Dict, plugin_path: str,
+                     command_names: Optional[List[str]] = None) -> bool:
+    """ Whether no plugins were installed, removed or upgraded since a dispatch table was written
+
+    Upgrades, also those run with pipx directly, leave the venvs directory alone but rewrite the
+    venv's metadata, so that is compared too: for the given commands only, or all of them.
+    """
+    if 'commands' not in table \
+            or table.get('plugin_path_mtime') != get_plugin_path_mtime(plugin_path):
+        return False
+    metadata_mtimes = table.get('metadata_mtimes') or {}
+    return all(
+        metadata_mtimes.get(command_name) == get_metadata_mtime(table['commands'][command_name])
+        for command_name in (table['commands'] if command_names is None else command_names)
+        if command_name in table['commands']
+    )
+
+
+def lookup_executable(table_path: str, plugin_path: str, command_name: str) -> Optional[str]:
+    """ Executable of a plugin command from an up to date dispatch table, None if unknown """
+    table = load_table(table_path)
+    executable = None
+    if is_table_current(table, plugin_path, [command_name]):
+        executable = table['commands'].get(command_name)
+    return executable if executable and os.access(executable, os.X_OK) else None
+
+
+def lookup_version(table_path: str, command_name: str) -> str:
+    """ Package version of a plugin command from the dispatch table, empty if unknown """
+    versions = load_table(table_path).get('versions')
+    return str(versions.get(command_name, '')) if isinstance(versions, dict) else ''
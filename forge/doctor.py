@@ -0,0 +1,160 @@
+""" Health checks of installed plugin venvs, cached until something they look at changes """
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from json import dumps, loads
+from typing import Any, Dict, List, Optional, Tuple
+
+from .dispatch import get_executable_path
+from .registry import METADATA_FILE_NAME
+from .shared import read_distributions
+from .storage import atomic_write
+from .util import get_python_path, get_site_packages, normalize_name
+
+DOCTOR_CACHE_VERSION = 1
+DOCTOR_CACHE_FILE_NAME = 'doctor.json'
+CHECK_JOBS = 8
+
+
+def get_mtime(path: str, follow_symlinks: bool = True) -> Optional[int]:
+    """ Modification time of a path, None if it (or the target of a link to it) is gone """
+    try:
+        return os.stat(path, follow_symlinks=follow_symlinks).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_watched_paths(venv_path: str, apps: List[str], bin_dir: str) -> List[str]:
+    """ Files a venv's health depends on: its metadata, interpreter and console scripts """
+    return [venv_path, os.path.join(venv_path, METADATA_FILE_NAME), get_python_path(venv_path),
+            os.path.dirname(get_executable_path(venv_path, ''))] + \
+        [os.path.join(bin_dir, app) for app in apps]
+
+
+def get_stamp(venv_path: str, apps: List[str], bin_dir: str) -> List[Optional[int]]:
+    """ Modification times of the watched paths and of the links among them """
+    return [
+        mtime for path in get_watched_paths(venv_path, apps, bin_dir)
+        for mtime in (get_mtime(path), get_mtime(path, follow_symlinks=False))
+    ]
+
+
+def check_interpreter(venv_path: str) -> List[str]:
+    """ Problems with the interpreter a venv links to """
+    python_path = get_python_path(venv_path)
+    if os.path.exists(python_path):
+        return []
+    target = f'links to missing {os.readlink(python_path)}' if os.path.islink(python_path) \
+        else 'is missing'
+    return [f'interpreter {python_path} {target}']
+
+
+def check_console_scripts(venv_path: str, apps: List[str], bin_dir: str) -> List[str]:
+    """ Problems with the console scripts a plugin exposes, in its venv and the pipx bin dir """
+    problems = []
+    for app in apps:
+        if not os.path.exists(get_executable_path(venv_path, app)):
+            problems.append(f'console script {app} is missing from the venv')
+        if not os.path.exists(os.path.join(bin_dir, app)):
+            broken = os.path.islink(os.path.join(bin_dir, app))
+            problems.append(f'console script {app} is {"a broken link" if broken else "missing"}'
+                            f' in {bin_dir}')
+    return problems
+
+
+def check_package_metadata(venv_path: str, package: str, version: str) -> List[str]:
+    """ Problems with the installed package metadata of a plugin """
+    site_packages = get_site_packages(venv_path)
+    distribution = read_distributions(site_packages).get(normalize_name(package)) \
+        if site_packages else None
+    problems = []
+    if distribution is None:
+        problems.append(f'package {package} has no installed metadata')
+    elif version and distribution.version != version:
+        problems.append(f'package {package} is installed at {distribution.version}, '
+                        f'pipx metadata says {version}')
+    return problems
+
+
+def check_venv(venv_path: str, entry: Dict[str, Any], bin_dir: str) -> List[str]:
+    """ Every problem found in one plugin venv """
+    return check_interpreter(venv_path) + \
+        check_console_scripts(venv_path, entry['apps'], bin_dir) + \
+        check_package_metadata(venv_path, entry['package'], entry['package_version'])
+
+
+def load_cache(cache_path: str) -> Dict[str, Dict]:
+    """ Cached check results by venv name, empty if missing or outdated """
+    try:
+        with open(cache_path) as cache_file:
+            data = loads(cache_file.read())
+    except (OSError, ValueError):
+        data = None
+    if not isinstance(data, dict) or data.get('version') != DOCTOR_CACHE_VERSION:
+        return {}
+    return dict(data.get('venvs', {}))
+
+
+def check_venvs(venvs: Dict[str, Tuple[str, Dict[str, Any]]], bin_dir: str, cache_path: str,
+                refresh: bool = False) -> Dict[str, List[str]]:
+    """ Problems of each venv, re-checking concurrently only venvs whose stamp changed """
+    cached = {} if refresh else load_cache(cache_path)
+    results = {}
+    stale = {}
+    for venv_name, (venv_path, entry) in venvs.items():
+        stamp = get_stamp(venv_path, entry['apps'], bin_dir)
+        if cached.get(venv_name, {}).get('stamp') == stamp:
+            results[venv_name] = cached[venv_name]
+        else:
+            stale[venv_name] = (venv_path, entry, stamp)
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=min(CHECK_JOBS, len(stale))) as executor:
+            checked = executor.map(check_venv, [venv[0] for venv in stale.values()],
+                                   [venv[1] for venv in stale.values()], repeat(bin_dir))
+            for venv_name, problems in zip(stale, checked):
+                results[venv_name] = {'stamp': stale[venv_name][2], 'problems': problems}
+    if stale or set(results) != set(cached):
+        atomic_write(cache_path, dumps({'version': DOCTOR_CACHE_VERSION, 'venvs': results},
+                                       separators=(',', ':'), sort_keys=True))
+    return {venv_name: list(results[venv_name]['problems']) for venv_name in sorted(results)}
+
+
+def find_duplicates(entries: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """ Problems of venvs exposing a command another venv exposes too """
+    owners: Dict[str, List[str]] = {}
+    for venv_name in sorted(entries):
+        for app in entries[venv_name]['apps']:
+            owners.setdefault(app, []).append(venv_name)
+    problems: Dict[str, List[str]] = {}
+    for app, venv_names in owners.items():
+        for venv_name in venv_names[1:]:
+            problems.setdefault(venv_name, []).append(
+                f'duplicate of {venv_names[0]}, both provide {app}'
+            )
+    return problems
+
+
+def find_orphaned_links(bin_dir: str, plugin_path: str) -> List[str]:
+    """ Console scripts in the pipx bin dir pointing into venvs that no longer exist """
+    if not os.path.isdir(bin_dir):
+        return []
+    real_plugin_path = os.path.realpath(plugin_path) + os.sep
+    with os.scandir(bin_dir) as entries:
+        return sorted(
+            entry.name for entry in entries
+            if entry.is_symlink() and not os.path.exists(entry.path)
+            and os.path.realpath(entry.path).startswith(real_plugin_path)
+        )
+
+
+def format_report(problems: Dict[str, List[str]]) -> str:
+    """ One line per healthy venv and one per problem of the others """
+    lines: List[str] = []
+    for venv_name in sorted(problems):
+        if problems[venv_name]:
+            lines.extend(f'[{venv_name}] {problem}' for problem in problems[venv_name])
+        else:
+            lines.append(f'[{venv_name}] ok')
+    return ''.join(f'{line}\n' for line in lines)
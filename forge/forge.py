@@ -1,25 +1,19 @@
 """ Forge """
 
 import os
-from json import loads
+import re
+import sys
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Any
-
-from tabulate import tabulate
-from halo import Halo
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 
+from . import completion, dispatch, plugin_help, registry, stats, storage
 from .exceptions import PluginManagementFatalException
+from .util import get_python_path, is_plain_requirement, normalize_name
 
 FORGE_PATH = os.path.join(Path.home(), '.forge')
 PLUGIN_PATH = os.path.join(FORGE_PATH, 'venvs')
-
-
-def get_plugin_paths() -> List[str]:
-    """ Fet paths of installed plugins """
-    paths = []
-    for venv in os.listdir(PLUGIN_PATH):
-        paths.append(os.path.join(PLUGIN_PATH, venv))
-    return paths
+PLUGINS_LOCK_NAME = 'venvs'
 
 
 def get_forge_plugin_command_names() -> List[str]:
@@ -30,22 +24,6 @@ def get_forge_plugin_command_names() -> List[str]:
     ]
 
 
-def get_pipx_config(plugin_path: str) -> Dict[Any, Any]:
-    """ Return config data from pipx venv metadata file """
-    config_file_path = os.path.join(plugin_path, 'pipx_metadata.json')
-    try:
-        with open(config_file_path) as config_file:
-            raw_data = config_file.read()
-            if raw_data:
-                return loads(raw_data)
-            raise PluginManagementFatalException()
-
-    except:
-        raise PluginManagementFatalException(
-            f'Problem reading json file expected at {plugin_path}'
-        ) from None
-
-
 def filter_forge_plugins(plugin_configs: List[Dict]) -> List[Dict]:
     """ Filters out non-forge plugins """
     filtered_plugins = []
@@ -60,22 +38,479 @@ def get_command_from_config(plugin_config: Dict) -> str:
     return str(plugin_config['main_package']['apps'][0].replace('.exe', ''))
 
 
+def get_cache_path(*parts: str) -> str:
+    """ Path of a forge managed cache """
+    return os.path.join(FORGE_PATH, 'cache', *parts)
+
+
+def get_registry_path() -> str:
+    """ Path of the plugin registry index """
+    return os.path.join(FORGE_PATH, registry.REGISTRY_FILE_NAME)
+
+
+def warn_unreadable_plugin(venv_name: str, message: str) -> None:
+    """ Reports a plugin venv that could not be read, without failing the command """
+    from halo import Halo  # pylint: disable=import-outside-toplevel
+    Halo(stream=sys.stderr).warn(f'Skipping [{venv_name}]: {message}')
+
+
 def get_plugins() -> List[Dict]:
     """ Get installed forge plugins """
-    plugin_configs = []
-    for plugin_path in get_plugin_paths():
-        plugin_configs.append(get_pipx_config(plugin_path))
+    venvs = registry.refresh_registry(
+        PLUGIN_PATH, get_registry_path(), on_error=warn_unreadable_plugin
+    )
+    if not dispatch.is_table_current(dispatch.load_table(get_dispatch_table_path()), PLUGIN_PATH):
+        write_plugin_caches(venvs)
+    plugin_configs = [registry.to_plugin_config(venvs[name]) for name in sorted(venvs)]
 
     return filter_forge_plugins(plugin_configs=plugin_configs)
 
 
-def list_plugins() -> None:
-    """ List installed forge plugins """
+def find_plugin(command_name: str) -> Optional[Dict]:
+    """ Look up a single plugin by command name, only touching its own metadata """
+    for venv_name, entry in registry.load_registry(get_registry_path()).items():
+        config = registry.to_plugin_config(entry)
+        if filter_forge_plugins([config]) and entry['apps'] \
+                and get_command_from_config(config) == command_name:
+            if registry.is_current(entry, os.path.join(PLUGIN_PATH, venv_name)):
+                return config
+            break
+
+    matches = [
+        config for config in get_plugins()
+        if config['main_package']['apps'] and get_command_from_config(config) == command_name
+    ]
+    return matches[0] if matches else None
+
+
+def get_index_command_names(venvs: Dict[str, Dict]) -> List[str]:
+    """ Plugin command names held by registry index entries """
+    plugin_configs = [registry.to_plugin_config(venvs[name]) for name in sorted(venvs)]
+    return [
+        get_command_from_config(config) for config in filter_forge_plugins(plugin_configs)
+        if config['main_package']['apps']
+    ]
+
+
+def get_completion_cache_path() -> str:
+    """ Path of the shell completion cache """
+    return os.path.join(FORGE_PATH, completion.CACHE_FILE_NAME)
+
+
+def get_dispatch_table_path() -> str:
+    """ Path of the command to executable dispatch table """
+    return os.path.join(FORGE_PATH, dispatch.DISPATCH_TABLE_FILE_NAME)
+
+
+def get_plugin_executables(venvs: Dict[str, Dict]) -> Dict[str, str]:
+    """ Executable of each plugin command held by registry index entries """
+    executables = {}
+    for venv_name in sorted(venvs):
+        config = registry.to_plugin_config(venvs[venv_name])
+        if filter_forge_plugins([config]) and config['main_package']['apps']:
+            executables[get_command_from_config(config)] = dispatch.get_executable_path(
+                os.path.join(PLUGIN_PATH, venv_name), config['main_package']['apps'][0]
+            )
+    return executables
+
+
+def get_plugin_versions(venvs: Dict[str, Dict]) -> Dict[str, str]:
+    """ Package version of each plugin command held by registry index entries """
+    return {
+        get_command_from_config(config): config['main_package']['package_version']
+        for config in filter_forge_plugins([registry.to_plugin_config(venvs[venv_name])
+                                            for venv_name in sorted(venvs)])
+        if config['main_package']['apps']
+    }
+
+
+def write_plugin_caches(venvs: Dict[str, Dict]) -> None:
+    """ Rewrites the completion cache and dispatch table built on the registry index """
+    completion.write_cache(get_completion_cache_path(), get_index_command_names(venvs))
+    dispatch.write_table(get_dispatch_table_path(), PLUGIN_PATH, get_plugin_executables(venvs),
+                         get_plugin_versions(venvs))
+
+
+def get_completion_names() -> List[str]:
+    """ Names to complete after forge, rebuilding the completion cache if it is missing """
+    names = completion.read_cache(get_completion_cache_path())
+    if names is None:
+        venvs = registry.refresh_registry(PLUGIN_PATH, get_registry_path())
+        write_plugin_caches(venvs)
+        names = completion.make_names(get_index_command_names(venvs))
+    return names
+
+
+def reindex_plugins() -> int:
+    """ Rebuild the plugin registry index from scratch, returns forge plugin count """
+    venvs = registry.refresh_registry(
+        PLUGIN_PATH, get_registry_path(), rebuild=True, on_error=warn_unreadable_plugin
+    )
+    write_plugin_caches(venvs)
+    return len(get_index_command_names(venvs))
+
+
+def update_plugin_index(venv_name: str) -> None:
+    """ Refresh the registry index entry of a single plugin venv and the caches built on it """
+    venvs = registry.update_registry_entry(PLUGIN_PATH, get_registry_path(), venv_name)
+    write_plugin_caches(venvs)
+
+
+def get_daemon_socket_path() -> str:
+    """ Path of the forge daemon's Unix domain socket """
+    return os.path.join(FORGE_PATH, 'daemon.sock')
+
+
+def get_zygote_socket_path(command_name: str) -> str:
+    """ Path of the Unix domain socket a plugin's zygote listens on """
+    return os.path.join(FORGE_PATH, 'zygotes', f'{command_name}.sock')
+
+
+def get_lock_name(requirement: str) -> str:
+    """ Plugin a requirement, VCS URL or local path installs, as a lock file name """
+    egg = re.search(r'#egg=([\w.-]+)', requirement)
+    source = egg.group(1) if egg else requirement.split(' @ ')[0].split('#')[0].strip()
+    if '/' in source or os.sep in source:
+        source = re.sub(r'(\.git|-\d.*)$', '', os.path.basename(source.rstrip('/')).split('@')[0])
+    name = re.match(r'[\w.-]*', source)
+    return normalize_name(name.group(0) if name else '') or 'unnamed'
+
+
+def warn_waiting(subject: str) -> None:
+    """ Tells the user forge is queued behind another forge command """
+    sys.stderr.write(f'Waiting for another forge command to finish with {subject}...\n')
+
+
+@contextmanager
+def lock_plugin(requirement: str) -> Iterator[None]:
+    """ Holds the lock of a single plugin, so other plugins can be changed at the same time """
+    name = get_lock_name(requirement)
+    with storage.file_lock(storage.get_lock_path(FORGE_PATH, PLUGINS_LOCK_NAME), shared=True,
+                           on_wait=lambda: warn_waiting('all plugins')), \
+            storage.file_lock(storage.get_lock_path(FORGE_PATH, name),
+                              on_wait=lambda: warn_waiting(name)):
+        yield
+
+
+@contextmanager
+def lock_all_plugins() -> Iterator[None]:
+    """ Holds every plugin's lock, for changes that span venvs """
+    with storage.file_lock(storage.get_lock_path(FORGE_PATH, PLUGINS_LOCK_NAME),
+                           on_wait=lambda: warn_waiting('all plugins')):
+        yield
+
+
+def get_stats_path() -> str:
+    """ Path of the file plugin runs are recorded in """
+    return os.path.join(FORGE_PATH, stats.STATS_FILE_NAME)
+
+
+def get_plugin_runs(command_name: Optional[str] = None) -> List[Any]:
+    """ Recorded runs of every plugin, or of a single plugin command """
+    return [run for run in stats.read_runs(get_stats_path())
+            if command_name is None or run.name == command_name]
+
+
+def get_plugin_executable(command_name: str) -> Optional[str]:
+    """ Executable of a plugin command, from the dispatch table or the registry """
+    executable = dispatch.lookup_executable(get_dispatch_table_path(), PLUGIN_PATH, command_name)
+    plugin_config = None if executable else find_plugin(command_name)
+    if plugin_config:
+        package = plugin_config['main_package']
+        executable = dispatch.get_executable_path(
+            os.path.join(PLUGIN_PATH, package['package']), package['apps'][0]
+        )
+    return executable
+
+
+def format_plugin_table(plugin_configs: List[Dict]) -> str:
+    """ Table of plugin commands and versions, as printed by forge list """
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
     tabulated_data = [
         (get_command_from_config(config), config['main_package']['package_version'])
-        for config in get_plugins()]
+        for config in plugin_configs]
+    return tabulate(tabulated_data, ['plugin', 'version']) + '\n\n'
+
+
+def get_help_cache_dir() -> str:
+    """ Directory of cached plugin help output """
+    return get_cache_path('help')
+
+
+def capture_plugin_help(command_name: str, plugin_config: Dict) -> Optional[str]:
+    """ Runs a plugin's help command and caches the output under its package and version """
+    executable = dispatch.lookup_executable(get_dispatch_table_path(), PLUGIN_PATH, command_name)
+    text = plugin_help.capture_help([executable or command_name, '-h'])
+    if text is not None:
+        package = plugin_config['main_package']
+        plugin_help.write_help(
+            get_help_cache_dir(), package['package'], package.get('package_version', ''), text
+        )
+    return text
+
+
+def get_plugin_help(command_name: str, capture: bool = False) -> Optional[str]:
+    """ Help output of a plugin command from the cache, optionally capturing it on a miss """
+    plugin_config = find_plugin(command_name)
+    text = None
+    if plugin_config:
+        package = plugin_config['main_package']
+        text = plugin_help.read_help(
+            get_help_cache_dir(), package['package'], package.get('package_version', '')
+        )
+        if text is None and capture:
+            text = capture_plugin_help(command_name, plugin_config)
+    return text
+
+
+def cache_plugin_help(venv_name: str) -> None:
+    """ Captures the help of a freshly installed or upgraded plugin """
+    entry = registry.load_registry(get_registry_path()).get(venv_name)
+    plugin_config = registry.to_plugin_config(entry) if entry else None
+    if plugin_config and filter_forge_plugins([plugin_config]) \
+            and plugin_config['main_package']['apps']:
+        capture_plugin_help(get_command_from_config(plugin_config), plugin_config)
+
+
+def remove_plugin_help(package: str) -> None:
+    """ Drops the cached help of an uninstalled plugin """
+    plugin_help.remove_help(get_help_cache_dir(), package)
+
+
+def format_all_plugin_help() -> str:
+    """ Usage of every installed plugin, from the help cache only """
+    sections = []
+    for plugin_config in get_plugins():
+        if not plugin_config['main_package']['apps']:
+            continue
+        package = plugin_config['main_package']
+        command_name = get_command_from_config(plugin_config)
+        title = f'{command_name} ({package.get("package_version") or plugin_help.UNKNOWN_VERSION})'
+        text = plugin_help.read_help(
+            get_help_cache_dir(), package['package'], package.get('package_version', '')
+        )
+        sections.append(f'{title}\n{"=" * len(title)}\n'
+                        f'{text or f"No cached help yet, run forge {command_name} -h"}\n')
+    return '\n'.join(sections)
+
+
+def get_wheelhouse_path() -> str:
+    """ Directory of wheels add and update build once and install from afterwards """
+    return get_cache_path('wheels')
+
+
+def prepare_wheelhouse(requirement: str, python: str) -> Tuple[str, Dict[str, str]]:
+    """ What to hand pipx for a requirement and the pip settings that use the wheelhouse """
+    from . import wheelhouse  # pylint: disable=import-outside-toplevel
+
+    if not wheelhouse.is_enabled():
+        return requirement, {}
+    return wheelhouse.prepare(get_wheelhouse_path(), requirement, wheelhouse.is_offline(), python)
+
+
+def prepare_upgrade_wheelhouse(venv_name: str) -> Dict[str, str]:
+    """ pip settings that use the wheelhouse for upgrading a plugin
+
+    Wheels are only built ahead for plugins installed from a plain requirement. A git or path
+    install has no index project to build, the one with the same name may be unrelated.
+    """
+    from . import wheelhouse  # pylint: disable=import-outside-toplevel
+
+    source = get_plugin_source(venv_name) if wheelhouse.is_enabled() else ''
+    if is_plain_requirement(source):
+        python = get_python_path(os.path.join(PLUGIN_PATH, venv_name))
+        return prepare_wheelhouse(source, python)[1]
+    return wheelhouse.get_pip_env(get_wheelhouse_path(), wheelhouse.is_offline()) \
+        if wheelhouse.is_enabled() else {}
+
+
+def get_plugin_source(venv_name: str) -> str:
+    """ Requirement, URL or path pipx installed a plugin from, empty if it is not installed """
+    try:
+        return registry.read_entry(os.path.join(PLUGIN_PATH, venv_name))['package_or_url']
+    except PluginManagementFatalException:
+        return ''
+
+
+def get_shared_path() -> str:
+    """ Shared dependency layer plugin venvs link to in shared mode """
+    from . import shared  # pylint: disable=import-outside-toplevel
+
+    return os.path.join(FORGE_PATH, shared.SHARED_DIR_NAME)
+
+
+def is_shared_mode() -> bool:
+    """ Whether installs go through the shared dependency layer """
+    from . import shared  # pylint: disable=import-outside-toplevel
+
+    return shared.is_enabled(get_shared_path())
+
+
+def link_shared_layer(venv_name: str, pip_env: Dict[str, str]) -> None:
+    """ Finishes a shared mode install, fetching only dependencies the layer lacks """
+    from . import shared  # pylint: disable=import-outside-toplevel
+
+    shared.finish_install(get_shared_path(), os.path.join(PLUGIN_PATH, venv_name), venv_name,
+                          pip_env)
+
+
+def sync_shared_layer(min_plugins: int) -> List[str]:
+    """ Moves dependencies common to installed plugins into the shared layer """
+    from . import shared  # pylint: disable=import-outside-toplevel
+
+    with lock_all_plugins():
+        return shared.sync_layer(
+            get_shared_path(), registry.scan_forge_venvs(PLUGIN_PATH), min_plugins
+        )
+
+
+def format_shared_savings() -> str:
+    """ Disk space and install time the shared layer saved, per plugin """
+    from . import shared  # pylint: disable=import-outside-toplevel
+
+    return shared.format_savings(shared.load_savings(get_shared_path()))
+
+
+def compile_plugin_bytecode(venv_name: str) -> int:
+    """ Precompiles a freshly installed or upgraded plugin venv, unless FORGE_COMPILE=0 """
+    from . import bytecode  # pylint: disable=import-outside-toplevel
+
+    if not bytecode.is_enabled():
+        return 0
+    return bytecode.compile_venv(os.path.join(PLUGIN_PATH, venv_name))
+
+
+def compile_plugins(venv_names: List[str], force: bool) -> Dict[str, int]:
+    """ Number of files compiled per plugin venv, all of them when forced or just stale ones """
+    from . import bytecode  # pylint: disable=import-outside-toplevel
+
+    venvs = registry.scan_forge_venvs(PLUGIN_PATH)
+    return {
+        venv_name: bytecode.compile_venv(venvs[venv_name], force)
+        for venv_name in venv_names or sorted(venvs) if venv_name in venvs
+    }
+
+
+def get_pipx_bin_dir() -> str:
+    """ Directory pipx links plugin console scripts into """
+    return os.environ.get('PIPX_BIN_DIR') or os.path.join(FORGE_PATH, 'bin')
+
+
+def diagnose_plugins(refresh: bool = False) -> Dict[str, List[str]]:
+    """ Problems of every plugin venv by name, orphaned and duplicated ones included """
+    from . import doctor  # pylint: disable=import-outside-toplevel
+
+    problems: Dict[str, List[str]] = {}
+
+    def add_orphan(venv_name: str, message: str) -> None:
+        problems[venv_name] = [f'orphaned venv: {message}']
+
+    venvs = registry.refresh_registry(PLUGIN_PATH, get_registry_path(), on_error=add_orphan)
+    venvs = {
+        venv_name: entry for venv_name, entry in venvs.items()
+        if filter_forge_plugins([registry.to_plugin_config(entry)])
+    }
+    problems.update(doctor.check_venvs(
+        {venv_name: (os.path.join(PLUGIN_PATH, venv_name), entry)
+         for venv_name, entry in venvs.items()},
+        get_pipx_bin_dir(), get_cache_path(doctor.DOCTOR_CACHE_FILE_NAME), refresh
+    ))
+    for venv_name, duplicates in doctor.find_duplicates(venvs).items():
+        problems[venv_name] = problems[venv_name] + duplicates
+    for app in doctor.find_orphaned_links(get_pipx_bin_dir(), PLUGIN_PATH):
+        problems[app] = [f'orphaned console script in {get_pipx_bin_dir()}, its venv is gone']
+    return problems
+
+
+def plan_cleanup() -> Tuple[Dict[str, int], List[Any]]:
+    """ Size of every plugin venv and what forge gc can reclaim """
+    from . import cleanup, snapshot, wheelhouse  # pylint: disable=import-outside-toplevel
+
+    wheel_dir = get_wheelhouse_path()
+    keep = {os.path.join(wheel_dir, name) for name in
+            [wheelhouse.SOURCES_FILE_NAME] + list(wheelhouse.load_sources(wheel_dir).values())}
+    cache_roots = {
+        get_cache_path(): False,
+        os.path.join(FORGE_PATH, '.cache'): True,
+        os.path.join(FORGE_PATH, 'logs'): False
+    }
+    venv_paths = registry.scan_forge_venvs(PLUGIN_PATH)
+    venv_sizes, plan = cleanup.make_plan(venv_paths, PLUGIN_PATH, get_pipx_bin_dir())
+    plan.extend(cleanup.get_cache_plan(cache_roots, keep, {wheel_dir: wheelhouse.get_max_bytes()}))
+    plan.extend(cleanup.find_orphaned_snapshots(
+        os.path.join(FORGE_PATH, snapshot.SNAPSHOTS_DIR_NAME), venv_paths
+    ))
+    return venv_sizes, plan
+
+
+def get_snapshots_path(venv_name: str) -> str:
+    """ Directory holding the snapshots of a plugin venv """
+    from . import snapshot  # pylint: disable=import-outside-toplevel
+
+    return os.path.join(FORGE_PATH, snapshot.SNAPSHOTS_DIR_NAME, venv_name)
+
+
+def take_plugin_snapshot(venv_name: str) -> Optional[str]:
+    """ Snapshots a plugin venv before an upgrade, None if snapshots are off or it failed """
+    from . import snapshot  # pylint: disable=import-outside-toplevel
+
+    entry, _ = registry.try_read_entry(os.path.join(PLUGIN_PATH, venv_name))
+    snapshot_path = None
+    if entry is not None and snapshot.is_enabled():
+        try:
+            snapshot_path = snapshot.take(os.path.join(PLUGIN_PATH, venv_name),
+                                          get_snapshots_path(venv_name), entry['package_version'])
+        except OSError as err:
+            sys.stderr.write(f'Could not snapshot {venv_name}, rollback will not be possible: '
+                             f'{err}\n')
+    return snapshot_path
+
+
+def keep_plugin_snapshot(venv_name: str, snapshot_path: Optional[str]) -> None:
+    """ Keeps a snapshot taken before an upgrade if the version changed, pruning older ones """
+    from . import snapshot  # pylint: disable=import-outside-toplevel
+
+    if snapshot_path:
+        entry, _ = registry.try_read_entry(os.path.join(PLUGIN_PATH, venv_name))
+        if entry is not None and entry['package_version'] == snapshot.get_version(snapshot_path):
+            snapshot.remove(snapshot_path)
+    snapshot.prune(get_snapshots_path(venv_name), snapshot.get_keep())
+
+
+def remove_plugin_snapshots(venv_name: str) -> None:
+    """ Drops every snapshot of an uninstalled plugin """
+    from . import snapshot  # pylint: disable=import-outside-toplevel
+
+    snapshot.remove(get_snapshots_path(venv_name))
+
+
+def list_plugin_snapshots(venv_name: str) -> List[str]:
+    """ Versions a plugin can be rolled back to, newest first """
+    from . import snapshot  # pylint: disable=import-outside-toplevel
+
+    return [snapshot.get_version(path)
+            for path in snapshot.list_snapshots(get_snapshots_path(venv_name))]
+
+
+def rollback_plugin(venv_name: str) -> Optional[str]:
+    """ Restores the newest snapshot of a plugin venv, returns its version or None without one """
+    from . import snapshot  # pylint: disable=import-outside-toplevel
+
+    with lock_plugin(venv_name):
+        snapshots = snapshot.list_snapshots(get_snapshots_path(venv_name))
+        if snapshots:
+            snapshot.restore(snapshots[0], os.path.join(PLUGIN_PATH, venv_name))
+            update_plugin_index(venv_name)
+    return snapshot.get_version(snapshots[0]) if snapshots else None
+
+
+def list_plugins() -> None:
+    """ List installed forge plugins """
+    from halo import Halo  # pylint: disable=import-outside-toplevel
 
-    if len(tabulated_data) == 0:
+    plugin_configs = get_plugins()
+    if len(plugin_configs) == 0:
         Halo().warn('No forge plugins installed yet! - Run forge --help for help')
     else:
-        print(tabulate(tabulated_data, ['plugin', 'version']), end='\n\n')
+        print(format_plugin_table(plugin_configs), end='')
@@ -0,0 +1,109 @@
+""" Running pure-Python plugins inside the forge interpreter instead of a second process """
+
+import configparser
+import glob
+import importlib
+import os
+import site
+import sys
+import sysconfig
+from types import ModuleType
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from .util import get_site_packages
+
+ENTRY_POINT_GROUP = 'forge.inprocess'
+
+
+def get_venv_python_version(venv_path: str) -> Optional[Tuple[int, int]]:
+    """ major.minor version of the interpreter a venv was created with, from pyvenv.cfg """
+    parser = configparser.ConfigParser()
+    try:
+        with open(os.path.join(venv_path, 'pyvenv.cfg')) as config_file:
+            parser.read_string('[venv]\n' + config_file.read())
+    except (OSError, configparser.Error):
+        return None
+    version = parser.get('venv', 'version', fallback='')
+    parts = parser.get('venv', 'version_info', fallback=version).split('.')
+    return (int(parts[0]), int(parts[1])) if len(parts) > 1 and parts[1].isdigit() else None
+
+
+def find_entry_point(site_packages: str, command_name: str) -> Optional[str]:
+    """ Entry point a forge plugin declared safe to call in process for a command """
+    pattern = os.path.join(site_packages, '[Ff]orge[-_]*.dist-info', 'entry_points.txt')
+    for entry_points_path in glob.glob(pattern):
+        parser = configparser.ConfigParser(delimiters=('=',))
+        parser.optionxform = str  # type: ignore
+        try:
+            parser.read(entry_points_path)
+        except configparser.Error:
+            continue
+        if parser.has_option(ENTRY_POINT_GROUP, command_name):
+            return parser.get(ENTRY_POINT_GROUP, command_name)
+    return None
+
+
+def load_entry_point(entry_point: str) -> Callable[[], Any]:
+    """ Imports the callable an entry point like package.module:object.attribute names """
+    module_name, _, attributes = entry_point.split('[')[0].strip().partition(':')
+    target: Any = importlib.import_module(module_name.strip())
+    for attribute in attributes.strip().split('.') if attributes.strip() else []:
+        target = getattr(target, attribute)
+    return target
+
+
+def isolate_import_path(site_packages: str) -> None:
+    """ Limits imports to the standard library and the plugin venv, .pth files included """
+    forge_site_dirs = set(site.getsitepackages() + [site.getusersitepackages()])
+    sys.path[:] = [
+        path for path in sys.path
+        if path and path not in forge_site_dirs
+        and os.path.basename(path) not in ('site-packages', 'dist-packages')
+    ]
+    site.addsitedir(site_packages)
+
+
+def is_stdlib_module(module: ModuleType, stdlib_dirs: Set[str]) -> bool:
+    """ Whether an imported module is built in or comes from the standard library directories """
+    paths = [os.path.realpath(path) for path in
+             [getattr(module, '__file__', None)] + list(getattr(module, '__path__', None) or [])
+             if path]
+    return not paths or all(
+        any(path.startswith(stdlib_dir + os.sep) for stdlib_dir in stdlib_dirs)
+        and not {'site-packages', 'dist-packages'} & set(path.split(os.sep))
+        for path in paths
+    )
+
+
+def unload_dependencies() -> None:
+    """ Forgets every module imported from outside the standard library and forge itself
+
+    A process that already imported, say, click would otherwise hand the plugin that copy
+    instead of the one in the plugin venv, whatever sys.path says.
+    """
+    stdlib_dirs = {os.path.realpath(sysconfig.get_path(name)) for name in ('stdlib', 'platstdlib')}
+    for name, module in list(sys.modules.items()):
+        if name.partition('.')[0] not in (__package__, '__main__') \
+                and not is_stdlib_module(module, stdlib_dirs):
+            del sys.modules[name]
+
+
+def find_plugin_entry_point(command_name: str, executable: str) -> Optional[Tuple[str, str]]:
+    """ site-packages and entry point of a plugin that can run in process, None otherwise """
+    venv_path = os.path.dirname(os.path.dirname(executable))
+    site_packages = get_site_packages(venv_path)
+    found = None
+    if site_packages and get_venv_python_version(venv_path) == sys.version_info[:2]:
+        entry_point = find_entry_point(site_packages, command_name)
+        found = (site_packages, entry_point) if entry_point else None
+    return found
+
+
+def run_plugin(command: List[str], executable: str) -> None:
+    """ Calls a plugin's entry point like its console script would, returns if it cannot """
+    found = find_plugin_entry_point(command[0], executable)
+    if found:
+        site_packages, entry_point = found
+        isolate_import_path(site_packages)
+        sys.argv = [executable] + command[1:]
+        raise SystemExit(load_entry_point(entry_point)())
@@ -0,0 +1,160 @@
+""" Bulk plugin installation from a manifest file """
+
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import forge
+from .batch import (FAILED, SUCCEEDED, WARNED, BatchResult, print_summary,
+                    raise_for_results, run_batch)
+from .exceptions import PluginManagementFatalException
+from .pipx_wrapper import install_plugin
+from .util import normalize_name
+
+SKIPPED = 'skipped'
+BARE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+
+class ManifestEntry(NamedTuple):
+    """ A single plugin listed in a manifest """
+    source: str
+    name: Optional[str]
+    version: Optional[str]
+    pipx_args: List[str]
+
+    @property
+    def label(self) -> str:
+        """ Name the plugin is reported under """
+        return self.name or self.source
+
+    @property
+    def install_spec(self) -> str:
+        """ Source handed to pipx, pinned when the source is a plain package name """
+        if self.version and BARE_NAME_PATTERN.match(self.source):
+            return f'{self.source}=={self.version}'
+        return self.source
+
+
+def parse_manifest(path: str) -> Dict[str, Any]:
+    """ Reads a TOML or JSON manifest file """
+    with open(path, 'rb') as manifest_file:
+        raw_data = manifest_file.read()
+
+    try:
+        if os.path.splitext(path)[1].lower() == '.toml':
+            return parse_toml(raw_data.decode())
+        data = json.loads(raw_data.decode())
+    except ValueError as err:
+        raise PluginManagementFatalException(f'Problem reading manifest {path}: {err}') from None
+
+    return data if isinstance(data, dict) else {'plugins': data}
+
+
+def parse_toml(content: str) -> Dict[str, Any]:
+    """ Parses TOML with tomllib, or the toml package on Pythons without it """
+    try:
+        import tomllib as toml_parser  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        try:
+            import toml as toml_parser  # type: ignore # pylint: disable=import-outside-toplevel
+        except ImportError:
+            raise PluginManagementFatalException(
+                'TOML manifests need Python 3.11+ or the toml package, use a JSON manifest instead'
+            ) from None
+
+    return dict(toml_parser.loads(content))
+
+
+def load_manifest(path: str) -> List[ManifestEntry]:
+    """ Loads and validates the plugin entries of a manifest """
+    entries = []
+    for plugin in parse_manifest(path).get('plugins', []):
+        if isinstance(plugin, str):
+            plugin = {'source': plugin}
+        if not isinstance(plugin, dict) or not plugin.get('source'):
+            raise PluginManagementFatalException(f'Manifest entry without a source: {plugin}')
+
+        source = str(plugin['source'])
+        entries.append(ManifestEntry(
+            source=source,
+            name=plugin.get('name') or (source if BARE_NAME_PATTERN.match(source) else None),
+            version=str(plugin['version']) if plugin.get('version') else None,
+            pipx_args=[str(arg) for arg in plugin.get('pipx_args', [])]
+        ))
+
+    labels = [entry.label for entry in entries]
+    duplicates = sorted({label for label in labels if labels.count(label) > 1})
+    if duplicates:
+        raise PluginManagementFatalException(f'Manifest lists plugins more than once: {duplicates}')
+    return entries
+
+
+def is_satisfied(entry: ManifestEntry, installed_versions: Dict[str, str]) -> bool:
+    """ Whether the registry already has the plugin at the requested version """
+    if not entry.name or normalize_name(entry.name) not in installed_versions:
+        return False
+    return not entry.version or installed_versions[normalize_name(entry.name)] == entry.version
+
+
+def write_report(results: List[BatchResult], entries: List[ManifestEntry],
+                 report_path: str) -> None:
+    """ Writes a JSON report of a manifest install, - for stdout """
+    sources = {entry.label: entry.source for entry in entries}
+    report = {
+        'plugins': [
+            {'name': result.name, 'source': sources[result.name],
+             'status': result.status, 'message': result.message}
+            for result in results
+        ],
+        'summary': {
+            status: sum(result.status == status for result in results)
+            for status in (SUCCEEDED, SKIPPED, WARNED, FAILED)
+        }
+    }
+
+    if report_path == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        with open(report_path, 'w') as report_file:
+            report_file.write(json.dumps(report, indent=2))
+
+
+def install_manifest(path: str, extra_args: List[str], jobs: int,
+                     report_path: Optional[str] = None) -> List[BatchResult]:
+    """ Installs every plugin in a manifest concurrently, skipping satisfied ones
+
+    A report written to stdout gets it to itself, the progress and summary go to stderr then.
+    """
+    progress_stream = sys.stderr if report_path == '-' else sys.stdout
+    entries = load_manifest(path)
+    installed_versions = {
+        normalize_name(config['main_package']['package']): config['main_package']['package_version']
+        for config in forge.get_plugins()
+    }
+    pending = {
+        entry.label: entry for entry in entries if not is_satisfied(entry, installed_versions)
+    }
+
+    def install(label: str) -> str:
+        entry = pending[label]
+        plugin_name, package, python_version = install_plugin(
+            entry.install_spec, entry.pipx_args + extra_args
+        )
+        return f'Installed plugin: [{plugin_name}] [{package}] [{python_version}]!'
+
+    batch_results = run_batch(install, list(pending), jobs, 'Installing plugins',
+                              progress_stream) if pending else []
+    installed = {result.name: result for result in batch_results}
+    results = [
+        installed.get(entry.label) or BatchResult(entry.label, SKIPPED, 'Already installed')
+        for entry in entries
+    ]
+
+    if results:
+        print_summary(results, progress_stream)
+    if report_path:
+        write_report(results, entries, report_path)
+    raise_for_results(results)
+    return results
@@ -0,0 +1,276 @@
+""" Latest-version lookups against a PEP 503 simple package index """
+
+import configparser
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from json import dumps, loads
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+from urllib.request import Request, url2pathname, urlopen
+
+from .storage import atomic_write
+from .util import normalize_name
+
+INDEX_URL_ENV_VAR = 'FORGE_INDEX_URL'
+INDEX_TTL_ENV_VAR = 'FORGE_INDEX_TTL'
+DEFAULT_INDEX_URL = 'https://pypi.org/simple'
+DEFAULT_INDEX_TTL = 300
+REQUEST_TIMEOUT = 10
+DEFAULT_JOBS = 8
+
+ANCHOR_PATTERN = re.compile(r'<a\s([^>]*)>\s*([^<]+?)\s*</a>', re.IGNORECASE)
+ARCHIVE_PATTERN = re.compile(r'\.(tar\.gz|tar\.bz2|tgz|zip|whl)$', re.IGNORECASE)
+VERSION_PATTERN = re.compile(
+    r'^v?(?P<release>\d+(?:\.\d+)*)'
+    r'(?:[-_.]?(?P<pre>a|b|c|rc|alpha|beta|pre|preview)[-_.]?(?P<pre_number>\d*))?'
+    r'(?:[-_.]?(?:post|rev|r)[-_.]?(?P<post>\d*))?'
+    r'(?:[-_.]?dev[-_.]?(?P<dev>\d*))?'
+    r'(?:\+[a-z0-9.]+)?$',
+    re.IGNORECASE
+)
+PIP_INDEX_SETTINGS = ('index-url', 'extra-index-url', 'no-index')
+PIP_INDEX_FLAGS = {'--index-url': 'index-url', '-i': 'index-url',
+                   '--extra-index-url': 'extra-index-url', '--no-index': 'no-index'}
+PIP_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+PRE_RELEASE_RANKS = {'a': 0, 'alpha': 0, 'b': 1, 'beta': 1, 'c': 2, 'rc': 2, 'pre': 2, 'preview': 2}
+
+
+class UpdateCheck(NamedTuple):
+    """ Installed and latest known version of a plugin """
+    package: str
+    installed: str
+    latest: Optional[str]
+
+    @property
+    def needs_update(self) -> bool:
+        """ Whether the index has something newer, unknown counts as needing one """
+        if self.latest is None:
+            return True
+        latest_key, installed_key = version_key(self.latest), version_key(self.installed)
+        return latest_key is None or installed_key is None or latest_key > installed_key
+
+
+def version_key(version: str) -> Optional[Tuple]:
+    """ Sort key for a PEP 440 style version, None if it cannot be parsed """
+    match = VERSION_PATTERN.match(version.strip())
+    if not match:
+        return None
+
+    release = [int(part) for part in match.group('release').split('.')]
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+    pre, post, dev = match.group('pre'), match.group('post'), match.group('dev')
+
+    if pre:
+        pre_key: Tuple = (-1, PRE_RELEASE_RANKS[pre.lower()], int(match.group('pre_number') or 0))
+    else:
+        pre_key = (-2,) if dev is not None and post is None else (0,)
+    post_key = (int(post or 0),) if post is not None else (-1,)
+    dev_key = (0, int(dev or 0)) if dev is not None else (1, 0)
+    return tuple(release), pre_key, post_key, dev_key
+
+
+def is_prerelease(version: str) -> bool:
+    """ Whether a version is a pre-release or development release """
+    match = VERSION_PATTERN.match(version.strip())
+    return bool(match and (match.group('pre') or match.group('dev') is not None))
+
+
+def parse_versions(project_page: str) -> List[str]:
+    """ Versions of every non-yanked distribution file linked from a project page """
+    versions = []
+    for attributes, file_name in ANCHOR_PATTERN.findall(project_page):
+        if 'data-yanked' in attributes or not ARCHIVE_PATTERN.search(file_name):
+            continue
+        if file_name.lower().endswith('.whl'):
+            version = file_name.split('-')[1]
+        else:
+            version = ARCHIVE_PATTERN.sub('', file_name).rsplit('-', 1)[-1]
+        if version_key(version) is not None:
+            versions.append(version)
+    return versions
+
+
+def latest_version(versions: List[str], include_prereleases: bool = False) -> Optional[str]:
+    """ Highest version, skipping pre-releases unless asked for them """
+    candidates = [
+        version for version in versions if include_prereleases or not is_prerelease(version)
+    ]
+    return max(candidates, key=lambda version: version_key(version) or ()) if candidates else None
+
+
+def get_pip_config_paths() -> List[str]:
+    """ pip configuration files in the order pip reads them, later ones overriding """
+    home = os.path.expanduser('~')
+    if os.name == 'nt':
+        paths = [os.path.join(os.environ.get('PROGRAMDATA', 'C:\\ProgramData'), 'pip', 'pip.ini'),
+                 os.path.join(os.environ.get('APPDATA', home), 'pip', 'pip.ini')]
+    else:
+        config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+        paths = ['/etc/xdg/pip/pip.conf', '/etc/pip.conf', os.path.join(home, '.pip', 'pip.conf'),
+                 os.path.join(config_home, 'pip', 'pip.conf')]
+        if sys.platform == 'darwin':
+            paths.append(os.path.join(home, 'Library', 'Application Support', 'pip', 'pip.conf'))
+    return paths + ([os.environ['PIP_CONFIG_FILE']] if os.environ.get('PIP_CONFIG_FILE') else [])
+
+
+def read_pip_config() -> Dict[str, str]:
+    """ Index settings from pip's configuration files, the install section overriding global """
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(get_pip_config_paths())
+    except configparser.Error:
+        return {}
+    return {setting: parser.get(section, setting) for section in ('global', 'install')
+            for setting in PIP_INDEX_SETTINGS if parser.has_option(section, setting)}
+
+
+def read_pip_args(pip_args: Sequence[str]) -> Dict[str, str]:
+    """ Index settings among the pip arguments pipx recorded for an install """
+    settings = {}
+    for position, arg in enumerate(pip_args):
+        flag, has_value, value = arg.partition('=')
+        if flag == '--no-index':
+            settings['no-index'] = '1'
+        elif flag in PIP_INDEX_FLAGS and not has_value and position + 1 < len(pip_args):
+            settings[PIP_INDEX_FLAGS[flag]] = pip_args[position + 1]
+        elif flag in PIP_INDEX_FLAGS:
+            settings[PIP_INDEX_FLAGS[flag]] = value
+    return settings
+
+
+def get_pip_settings(pip_args: Sequence[str]) -> Dict[str, str]:
+    """ Index settings pip installs a plugin with: config files, then PIP_ variables, then args """
+    settings = read_pip_config()
+    for setting in PIP_INDEX_SETTINGS:
+        variable = 'PIP_' + setting.upper().replace('-', '_')
+        if os.environ.get(variable):
+            settings[setting] = os.environ[variable]
+    settings.update(read_pip_args(pip_args))
+    return settings
+
+
+def get_index_url(pip_args: Sequence[str] = ()) -> Optional[str]:
+    """ Simple index a plugin is installed from without a trailing slash, None if it is unclear
+
+    FORGE_INDEX_URL wins, otherwise it is the index pip is configured with for the plugin. With
+    extra indexes, or none at all, no single index has the latest version, so there is none.
+    """
+    index_url = os.environ.get(INDEX_URL_ENV_VAR)
+    if not index_url:
+        settings = get_pip_settings(pip_args)
+        unclear = bool(settings.get('extra-index-url')) or \
+            settings.get('no-index', '').lower() in PIP_TRUE_VALUES
+        index_url = None if unclear else settings.get('index-url') or DEFAULT_INDEX_URL
+    return index_url.rstrip('/') if index_url else None
+
+
+def get_index_ttl() -> int:
+    """ Seconds a cached project page is trusted without asking the index """
+    try:
+        return int(os.environ.get(INDEX_TTL_ENV_VAR, DEFAULT_INDEX_TTL))
+    except ValueError:
+        return DEFAULT_INDEX_TTL
+
+
+def read_cache(cache_path: str) -> Dict[str, Any]:
+    """ Cached project page lookup, empty if there is none """
+    try:
+        with open(cache_path) as cache_file:
+            cached = loads(cache_file.read())
+    except (OSError, ValueError):
+        cached = {}
+    return cached if isinstance(cached, dict) else {}
+
+
+def read_local_page(project_url: str) -> str:
+    """ Reads a project page from a file based index """
+    path = url2pathname(urlparse(project_url).path)
+    with open(os.path.join(path, 'index.html') if os.path.isdir(path) else path) as page:
+        return page.read()
+
+
+def fetch_remote_page(project_url: str, cached: Dict[str, Any]) -> Optional[str]:
+    """ Conditionally fetches a project page, None when the cached copy is still valid """
+    headers = {'Accept': 'text/html'}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        with urlopen(Request(project_url, headers=headers), timeout=REQUEST_TIMEOUT) as response:
+            cached['etag'] = response.headers.get('ETag')
+            cached['last_modified'] = response.headers.get('Last-Modified')
+            page: Optional[str] = response.read().decode('utf-8', errors='replace')
+    except HTTPError as err:
+        if err.code != 304:
+            raise
+        page = None
+    return page
+
+
+def fetch_project_page(project_url: str, cached: Dict[str, Any]) -> Optional[str]:
+    """ Fetches a project page, None when the cached copy is still valid """
+    if urlparse(project_url).scheme == 'file':
+        return read_local_page(project_url)
+    return fetch_remote_page(project_url, cached)
+
+
+def refresh_cache(project_url: str, cached: Dict[str, Any], cache_path: str) -> Dict[str, Any]:
+    """ Re-validates a cached project page against the index, empty if it is unreachable """
+    try:
+        page = fetch_project_page(project_url, cached)
+    except (OSError, ValueError, HTTPException):
+        return {}
+
+    if page is not None:
+        cached['versions'] = parse_versions(page)
+    cached['fetched_at'] = time.time()
+    atomic_write(cache_path, dumps(cached))
+    return cached
+
+
+def get_versions(package: str, cache_dir: str,
+                 index_url: Optional[str] = None) -> Optional[List[str]]:
+    """ Versions of a package on the index, cached with ETag/Last-Modified and a TTL
+
+    None if they are unknown, also when no index can be told apart to ask.
+    """
+    index_url = index_url or get_index_url()
+    if index_url is None:
+        return None
+    name = normalize_name(package)
+    cache_path = os.path.join(cache_dir, f'{name}.json')
+    cached = read_cache(cache_path)
+
+    if cached.get('index_url') != index_url:
+        cached = {'index_url': index_url}
+    if time.time() - cached.get('fetched_at', 0) >= get_index_ttl():
+        cached = refresh_cache(f'{index_url}/{name}/', cached, cache_path)
+    return cached.get('versions')
+
+
+def check_update(package: str, installed: str, cache_dir: str,
+                 index_url: Optional[str] = None) -> UpdateCheck:
+    """ Compares an installed version with the latest one on the index """
+    versions = get_versions(package, cache_dir, index_url)
+    latest = latest_version(versions, is_prerelease(installed)) if versions else None
+    return UpdateCheck(package=package, installed=installed, latest=latest)
+
+
+def check_updates(installed_versions: Dict[str, str], cache_dir: str, jobs: int = DEFAULT_JOBS,
+                  index_urls: Optional[Dict[str, str]] = None) -> List[UpdateCheck]:
+    """ Checks many packages against their index concurrently, in input order """
+    packages = list(installed_versions)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(
+            lambda package: check_update(package, installed_versions[package], cache_dir,
+                                         (index_urls or {}).get(package)),
+            packages
+        ))
@@ -0,0 +1,107 @@
+""" Incremental parsing of streamed pipx output """
+
+import re
+import time
+from collections import deque
+from queue import Empty, Queue
+from subprocess import Popen, TimeoutExpired
+from threading import Thread
+from typing import IO, Callable, Deque, Dict, Optional, Tuple
+
+from .process import stop_process
+
+MAX_RETAINED_LINES = 2000
+MAX_PHASE_LENGTH = 60
+
+WARNING = 'warning'
+FATAL = 'fatal'
+RETRYABLE = 'retryable'
+
+PHASE_PATTERN = re.compile(
+    r'^\s*(Collecting|Downloading|Using cached|Processing|Building wheels?|'
+    r'Installing build dependencies|Installing collected packages|Successfully installed|'
+    r'creating virtual environment|upgrading shared libraries)\b',
+    re.IGNORECASE
+)
+TERMINAL_MESSAGES = {
+    'already seems to be installed': WARNING,
+    'Package is not installed': WARNING,
+    'Nothing to uninstall for': WARNING,
+    'No matching distribution found': FATAL,
+    'Could not find a version that satisfies': FATAL
+}
+
+
+class PipxOutputParser:
+    """ Turns pipx output, one line at a time, into progress phases and terminal conditions """
+
+    def __init__(self) -> None:
+        self.phase: Optional[str] = None
+        self.terminal: Optional[str] = None
+
+    def feed(self, line: str) -> Optional[str]:
+        """ Consumes a line of output, returns the new pip phase when it changed """
+        for message, severity in TERMINAL_MESSAGES.items():
+            if message in line:
+                self.terminal = severity
+
+        if not PHASE_PATTERN.match(line):
+            return None
+
+        phase = line.strip()[:MAX_PHASE_LENGTH]
+        changed = phase != self.phase
+        self.phase = phase
+        return phase if changed else None
+
+
+def read_stream(stream: IO[str], name: str, lines: 'Queue[Tuple[str, Optional[str]]]') -> None:
+    """ Forwards every line of a stream to a queue, followed by a None end marker """
+    for line in iter(stream.readline, ''):
+        lines.put((name, line))
+    lines.put((name, None))
+
+
+def get_remaining(deadline: Optional[float]) -> Optional[float]:
+    """ Seconds left until a monotonic deadline, None without one """
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def get_line(process: Popen, lines: 'Queue[Tuple[str, Optional[str]]]',
+             deadline: Optional[float], timeout: Optional[float]) -> Tuple[str, Optional[str]]:
+    """ Next line read from either stream, raising TimeoutExpired once the deadline passed """
+    try:
+        return lines.get(timeout=get_remaining(deadline))
+    except Empty:
+        raise TimeoutExpired(process.args, timeout or 0) from None
+
+
+def stream_output(process: Popen, parser: PipxOutputParser,
+                  on_progress: Optional[Callable[[str], None]] = None,
+                  timeout: Optional[float] = None) -> Tuple[str, str]:
+    """ Feeds a process's output to a parser as it arrives, stopping it on terminal conditions """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    lines: 'Queue[Tuple[str, Optional[str]]]' = Queue()
+    retained: Dict[str, Deque[str]] = {
+        'stdout': deque(maxlen=MAX_RETAINED_LINES),
+        'stderr': deque(maxlen=MAX_RETAINED_LINES)
+    }
+    for name in retained:
+        Thread(target=read_stream, args=(getattr(process, name), name, lines), daemon=True).start()
+
+    open_streams = len(retained)
+    while open_streams:
+        name, line = get_line(process, lines, deadline, timeout)
+        if line is None:
+            open_streams -= 1
+            continue
+
+        retained[name].append(line)
+        phase = parser.feed(line)
+        if phase and on_progress:
+            on_progress(phase)
+        if parser.terminal:
+            stop_process(process)
+            break
+
+    process.wait(get_remaining(deadline))
+    return ''.join(retained['stdout']), ''.join(retained['stderr'])
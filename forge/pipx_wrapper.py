@@ -1,14 +1,41 @@
 """ Wrapper around pipx for Forge plugin management """
 
 
+import os
 import re
-from subprocess import PIPE, CalledProcessError, Popen
-from typing import List, Tuple
+import shutil
+import sys
+import time
+from subprocess import CalledProcessError, TimeoutExpired
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
 
 from halo import Halo
 
 from .exceptions import (PluginManagementFatalException,
                          PluginManagementWarnException)
+from .forge import (cache_plugin_help, compile_plugin_bytecode, is_shared_mode,
+                    keep_plugin_snapshot, link_shared_layer, lock_plugin,
+                    prepare_upgrade_wheelhouse, prepare_wheelhouse,
+                    remove_plugin_help, remove_plugin_snapshots, take_plugin_snapshot,
+                    update_plugin_index)
+from .pipx_output import FATAL, RETRYABLE, WARNING, PipxOutputParser, stream_output
+from .process import get_timeout, managed_process
+from .shared import get_pip_env
+
+ACCEPTABLE_ERROR_MESSAGES = (
+    '(_copy_package_apps:66):   Overwriting file',
+    '(_symlink_package_apps:95): Same path'
+)
+RETRYABLE_ERROR_MESSAGES = (
+    'Connection reset', 'Connection refused', 'Connection aborted', 'NewConnectionError',
+    'Read timed out', 'ReadTimeoutError', 'Temporary failure in name resolution',
+    'Name or service not known', 'Max retries exceeded', 'IncompleteRead', 'ProtocolError',
+    'Could not fetch URL', '502 Bad Gateway', '503 Service Unavailable', '504 Gateway Time'
+)
+RETRIES_ENV_VAR = 'FORGE_PIPX_RETRIES'
+DEFAULT_RETRIES = 2
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
 
 DOTS = {
     "interval": 80,
@@ -16,61 +43,183 @@ DOTS = {
 }
 
 
-def make_spinner(text: str) -> Halo:
-    """ Creates uniform stylized Halo spinner """
+def make_spinner(text: str, stream: Optional[TextIO] = None) -> Halo:
+    """ Creates uniform stylized Halo spinner, on stdout unless given another stream """
     return Halo(
         text=text,
         spinner=DOTS,
-        color='blue'
+        color='blue',
+        **({'stream': stream} if stream else {})
     )
 
 
-def determine_is_fatal_error(current_error_message: str) -> bool:
-    """ Determine if a pipx error message is truly fatal """
-    acceptable_error_messages = [
-        '(_copy_package_apps:66):   Overwriting file',
-        '(_symlink_package_apps:95): Same path'
-    ]
+def classify_error(error_message: str) -> str:
+    """ Whether a failed pipx run's error output is only a warning, worth a retry or fatal """
+    severity = FATAL
+    if any(message in error_message for message in ACCEPTABLE_ERROR_MESSAGES):
+        severity = WARNING
+    elif any(message in error_message for message in RETRYABLE_ERROR_MESSAGES):
+        severity = RETRYABLE
+    return severity
 
-    for message in acceptable_error_messages:
-        if message in current_error_message:
-            return False
 
-    return True
+def classify_result(terminal: Optional[str], returncode: int, stderr: str) -> Optional[str]:
+    """ How a finished pipx run went, None when it simply succeeded """
+    severity = classify_error(stderr) if terminal == FATAL or \
+        (terminal is None and returncode) else terminal
+    return FATAL if terminal == FATAL and severity == WARNING else severity
 
 
-def run_command(command: List[str]) -> Tuple[str, str]:
-    """ Wrapper to simplify handling subprocess commands """
-    try:
-        process = Popen(command, stdout=PIPE, stderr=PIPE)
+def get_retries() -> int:
+    """ How often a transient network failure is retried, FORGE_PIPX_RETRIES overrides """
+    value = os.environ.get(RETRIES_ENV_VAR, '')
+    return int(value) if value.isdigit() else DEFAULT_RETRIES
 
-        stdout, stderr = process.communicate()
 
-        if process.returncode and determine_is_fatal_error(current_error_message=stderr.decode()):
-            raise PluginManagementFatalException(stderr.decode())
+def get_backoff(attempt: int) -> float:
+    """ Seconds to wait before a retry, doubling with every attempt """
+    return float(min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt))
 
-        return stdout.decode(), stderr.decode()
 
-    except CalledProcessError as err:
+def run_once(command: List[str], on_progress: Optional[Callable[[str], None]],
+             env: Optional[Dict[str, str]],
+             timeout: Optional[float]) -> Tuple[str, str, Optional[str]]:
+    """ Runs a command once in its own process group, returns its output and how it went """
+    parser = PipxOutputParser()
+    try:
+        with managed_process(command, env) as process:
+            stdout, stderr = stream_output(process, parser, on_progress, timeout)
+    except (CalledProcessError, OSError) as err:
         raise PluginManagementFatalException(err) from None
+    except TimeoutExpired:
+        raise PluginManagementFatalException(
+            f'{" ".join(command)} timed out after {timeout:g} seconds'
+        ) from None
+    return stdout, stderr, classify_result(parser.terminal, process.returncode, stderr)
+
+
+def run_command(command: List[str],
+                on_progress: Optional[Callable[[str], None]] = None,
+                env: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None) -> Tuple[str, str]:
+    """ Runs a command streaming its output, retrying transient network failures with backoff """
+    stdout, stderr, severity = run_once(command, on_progress, env, timeout)
+    attempt = 0
+    while severity == RETRYABLE and attempt < get_retries():
+        time.sleep(get_backoff(attempt))
+        attempt += 1
+        stdout, stderr, severity = run_once(command, on_progress, env, timeout)
+
+    if severity in (FATAL, RETRYABLE):
+        raise PluginManagementFatalException(stderr)
+    return stdout, stderr
+
+
+def read_shebang_interpreter(script_path: str) -> str:
+    """ Interpreter a script's shebang line runs it with, empty if it has none """
+    try:
+        with open(script_path, 'rb') as script_file:
+            first_line = script_file.readline(1024).decode(errors='replace').strip()
+    except OSError:
+        first_line = ''
+    words = first_line[2:].split() if first_line.startswith('#!') else []
+    return (words[-1] if os.path.basename(words[0]) == 'env' else words[0]) if words else ''
+
+
+def get_pipx_python(extra_args: List[str]) -> str:
+    """ Interpreter pipx creates a plugin venv with: --python, PIPX_DEFAULT_PYTHON or its own """
+    candidates = [value for flag, value in zip(extra_args, extra_args[1:]) if flag == '--python']
+    candidates += [arg.split('=', 1)[1] for arg in extra_args if arg.startswith('--python=')]
+    candidates.append(os.environ.get('PIPX_DEFAULT_PYTHON', ''))
+    candidates.append(read_shebang_interpreter(shutil.which('pipx') or ''))
+    return next((candidate for candidate in candidates if candidate), sys.executable)
+
+
+def make_pip_env(pip_env: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """ Environment passing extra pip settings through pipx, None to inherit forge's own """
+    return dict(os.environ, **pip_env) if pip_env else None
+
+
+def make_progress_callback(spinner: Halo, text: str) -> Callable[[str], None]:
+    """ Progress callback showing the current pip phase next to the spinner text """
+    def show_phase(phase: str) -> None:
+        spinner.text = f'{text} {phase}'
+    return show_phase
+
+
+def upgrade_plugin(name: str, extra_args: List[str],
+                   on_progress: Optional[Callable[[str], None]] = None) -> str:
+    """ Upgrades a plugin with pipx, returns the update message """
+    with lock_plugin(name):
+        pip_env = prepare_upgrade_wheelhouse(name)
+        snapshot_path = take_plugin_snapshot(name)
+        command = f'pipx upgrade {name} --verbose'
+        stdout, stderr = run_command(command.split() + extra_args, on_progress=on_progress,
+                                     env=make_pip_env(pip_env), timeout=get_timeout('upgrade'))
+
+        if 'Package is not installed' in stderr:
+            raise PluginManagementWarnException('Plugin not installed! Cannot update!')
+
+        update_message = _extract_update_details(stdout)
+        update_plugin_index(name)
+        keep_plugin_snapshot(name, snapshot_path)
+        compile_plugin_bytecode(name)
+        cache_plugin_help(name)
+        return update_message
+
+
+def install_plugin(source: str, extra_args: List[str],
+                   on_progress: Optional[Callable[[str], None]] = None) -> Tuple[str, str, str]:
+    """ Installs a plugin with pipx, returns its name, package and python version """
+    with lock_plugin(source):
+        install_spec, pip_env = prepare_wheelhouse(source, get_pipx_python(extra_args))
+        shared_mode = is_shared_mode()
+        pipx_env = dict(pip_env, **get_pip_env()) if shared_mode else pip_env
+        stdout, _ = run_command(['pipx', 'install', install_spec, '--verbose'] + extra_args,
+                                on_progress=on_progress, env=make_pip_env(pipx_env),
+                                timeout=get_timeout('install'))
+
+        if 'already seems to be installed' in stdout:
+            raise PluginManagementWarnException('Plugin already installed!')
+
+        plugin_name, package, python_version = _extract_result_details(stdout)
+        if shared_mode:
+            link_shared_layer(package.split()[0], pip_env)
+        update_plugin_index(package.split()[0])
+        compile_plugin_bytecode(package.split()[0])
+        cache_plugin_help(package.split()[0])
+        return plugin_name, package, python_version
+
+
+def uninstall_plugin(plugin_name: str, extra_args: List[str],
+                     on_progress: Optional[Callable[[str], None]] = None) -> str:
+    """ Uninstalls a plugin with pipx, returns the uninstall message """
+    with lock_plugin(plugin_name):
+        command = f'pipx uninstall {plugin_name} --verbose'
+        stdout, _ = run_command(command.split() + extra_args, on_progress=on_progress,
+                                timeout=get_timeout('uninstall'))
+
+        if f'Nothing to uninstall for {plugin_name}' in stdout:
+            raise PluginManagementWarnException(f'Plugin {plugin_name} not installed!')
+
+        update_plugin_index(plugin_name)
+        remove_plugin_help(plugin_name)
+        remove_plugin_snapshots(plugin_name)
+        return f'Uninstalled plugin: [{plugin_name}]!'
 
 
 def update_pipx(name: str, extra_args: List[str]) -> None:
     """ Installs a plugin to pipx """
-    command = f'pipx upgrade {name} --verbose'
     pretty_name = name.replace('forge-', '', 1)
 
     with make_spinner(text=f'Updating plugin: [{pretty_name}]...') as spinner:
         try:
-            stdout, stderr = run_command(command.split() + extra_args)
-
-            if 'Package is not installed' in stderr:
-                spinner.warn('Plugin not installed! Cannot update!')
-                raise PluginManagementWarnException()
+            progress = make_progress_callback(spinner, f'Updating plugin: [{pretty_name}]')
+            spinner.succeed(upgrade_plugin(name, extra_args, on_progress=progress))
 
-            update_message = _extract_update_details(stdout)
-
-            spinner.succeed(update_message)
+        except PluginManagementWarnException as warning:
+            spinner.warn(str(warning))
+            raise
 
         except PluginManagementFatalException as err:
             spinner.fail(f'Something went wrong!\n{str(err)}')
@@ -79,20 +228,19 @@ def update_pipx(name: str, extra_args: List[str]) -> None:
 
 def install_to_pipx(source: str, extra_args: List[str]) -> None:
     """ Installs a plugin to pipx """
-    command = f'pipx install {source} --verbose'
-
     with make_spinner(text='Installing plugin...') as spinner:
         try:
-            stdout, _ = run_command(command.split() + extra_args)
-
-            if 'already seems to be installed' in stdout:
-                spinner.warn('Plugin already installed!')
-                raise PluginManagementWarnException()
-
-            plugin_name, package, python_version = _extract_result_details(stdout)
+            progress = make_progress_callback(spinner, 'Installing plugin')
+            plugin_name, package, python_version = install_plugin(
+                source, extra_args, on_progress=progress
+            )
 
             spinner.succeed(f'Installed plugin: [{plugin_name}] [{package}] [{python_version}]!')
 
+        except PluginManagementWarnException as warning:
+            spinner.warn(str(warning))
+            raise
+
         except PluginManagementFatalException as err:
             spinner.fail(f'Something went wrong!\n{str(err)}')
             raise PluginManagementFatalException from None
@@ -100,20 +248,17 @@ def install_to_pipx(source: str, extra_args: List[str]) -> None:
 
 def uninstall_from_pipx(plugin_name: str, extra_args: List[str]) -> str:
     """ Installs a plugin to pipx """
-    command = f'pipx uninstall {plugin_name} --verbose'
-
     with make_spinner(text=f'Uninstalling plugin: [{plugin_name}]...') as spinner:
         try:
-            stdout, _ = run_command(command.split() + extra_args)
-
-            if f'Nothing to uninstall for {plugin_name}' in stdout:
-                spinner.warn(f'Plugin {plugin_name} not installed!')
-                raise PluginManagementWarnException()
-
-            spinner.succeed(f'Uninstalled plugin: [{plugin_name}]!')
+            progress = make_progress_callback(spinner, f'Uninstalling plugin: [{plugin_name}]')
+            spinner.succeed(uninstall_plugin(plugin_name, extra_args, on_progress=progress))
 
             return plugin_name
 
+        except PluginManagementWarnException as warning:
+            spinner.warn(str(warning))
+            raise
+
         except PluginManagementFatalException as err:
             spinner.fail(f'Something went wrong!\n{str(err)}')
             raise PluginManagementFatalException from None
@@ -0,0 +1,51 @@
+""" Cached plugin help output, keyed by plugin package and version """
+
+import os
+import re
+import shutil
+from subprocess import PIPE, STDOUT, SubprocessError, run
+from typing import List, Optional
+
+from .storage import atomic_write
+
+HELP_TIMEOUT = 30
+UNKNOWN_VERSION = 'unknown'
+
+
+def get_help_path(cache_dir: str, package: str, version: str) -> str:
+    """ Cache file holding the help text of one version of a plugin package """
+    safe_version = re.sub(r'[^A-Za-z0-9._+-]', '_', version) or UNKNOWN_VERSION
+    return os.path.join(cache_dir, package, f'{safe_version}.txt')
+
+
+def read_help(cache_dir: str, package: str, version: str) -> Optional[str]:
+    """ Cached help text, None if this version's help has not been captured """
+    try:
+        with open(get_help_path(cache_dir, package, version)) as help_file:
+            return help_file.read()
+    except OSError:
+        return None
+
+
+def write_help(cache_dir: str, package: str, version: str, text: str) -> None:
+    """ Stores help text, dropping what was cached for any other version of the package """
+    help_path = get_help_path(cache_dir, package, version)
+    atomic_write(help_path, text)
+    for file_name in os.listdir(os.path.dirname(help_path)):
+        if os.path.join(os.path.dirname(help_path), file_name) != help_path:
+            os.remove(os.path.join(os.path.dirname(help_path), file_name))
+
+
+def remove_help(cache_dir: str, package: str) -> None:
+    """ Drops every cached help text of a package """
+    shutil.rmtree(os.path.join(cache_dir, package), ignore_errors=True)
+
+
+def capture_help(command: List[str]) -> Optional[str]:
+    """ Runs a plugin's help command, returns its output if it succeeded """
+    try:
+        result = run(command, stdout=PIPE, stderr=STDOUT, stdin=PIPE,
+                     universal_newlines=True, timeout=HELP_TIMEOUT, check=False)
+    except (OSError, SubprocessError):
+        return None
+    return result.stdout if result.returncode == 0 and result.stdout.strip() else None
@@ -0,0 +1,101 @@
+""" Subprocesses forge can time out and cancel along with everything they started """
+
+import os
+import signal
+import subprocess
+import threading
+from contextlib import contextmanager
+from subprocess import DEVNULL, PIPE, STDOUT, CompletedProcess, Popen, TimeoutExpired
+from typing import Dict, Iterator, List, Optional, Set
+
+STOP_GRACE_PERIOD = 5.0
+NO_PROMPT_ENV = {'GIT_TERMINAL_PROMPT': '0', 'PIP_NO_INPUT': '1'}
+OPERATION_TIMEOUTS = {'install': 900.0, 'upgrade': 900.0, 'uninstall': 120.0, 'build': 900.0,
+                      'compile': 300.0}
+
+RUNNING: Set[Popen] = set()
+RUNNING_LOCK = threading.Lock()
+CANCELLED = threading.Event()
+
+
+def get_timeout(operation: str) -> Optional[float]:
+    """ Seconds an operation may run, FORGE_<OPERATION>_TIMEOUT overrides, 0 for no limit """
+    value = os.environ.get(f'FORGE_{operation.upper()}_TIMEOUT', '')
+    try:
+        seconds = float(value) if value else OPERATION_TIMEOUTS.get(operation)
+    except ValueError:
+        seconds = OPERATION_TIMEOUTS.get(operation)
+    return seconds or None
+
+
+def start_process(command: List[str], env: Optional[Dict[str, str]] = None,
+                  stderr: int = PIPE) -> Popen:
+    """ Starts a command in its own process group, without a stdin to prompt on """
+    if CANCELLED.is_set():
+        raise OSError(f'Cancelled before starting {" ".join(command)}')
+    group_args = {'creationflags': getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0)} \
+        if os.name == 'nt' else {'start_new_session': True}
+    process = Popen(command, stdin=DEVNULL, stdout=PIPE, stderr=stderr, universal_newlines=True,
+                    env=dict(env if env is not None else os.environ, **NO_PROMPT_ENV),
+                    **group_args)
+    with RUNNING_LOCK:
+        RUNNING.add(process)
+    return process
+
+
+def signal_group(process: Popen, signal_number: int) -> None:
+    """ Sends a signal to a process's whole group, or just to it if it leads no group """
+    if os.name != 'nt':
+        try:
+            os.killpg(process.pid, signal_number)
+            return
+        except OSError:
+            pass
+    try:
+        process.send_signal(signal_number)
+    except OSError:
+        pass
+
+
+def stop_process(process: Popen) -> None:
+    """ Terminates a process group, killing it if it outlives the grace period """
+    if process.poll() is None:
+        signal_group(process, signal.SIGTERM)
+        try:
+            process.wait(STOP_GRACE_PERIOD)
+        except TimeoutExpired:
+            signal_group(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            process.wait()
+    with RUNNING_LOCK:
+        RUNNING.discard(process)
+
+
+def stop_all() -> None:
+    """ Stops every running process group and refuses new ones, e.g. after Ctrl-C """
+    CANCELLED.set()
+    with RUNNING_LOCK:
+        processes = list(RUNNING)
+    for process in processes:
+        stop_process(process)
+
+
+@contextmanager
+def managed_process(command: List[str], env: Optional[Dict[str, str]] = None,
+                    stderr: int = PIPE) -> Iterator[Popen]:
+    """ A started process whose whole group is stopped on leaving, however that happens """
+    process = start_process(command, env, stderr)
+    try:
+        yield process
+    finally:
+        stop_process(process)
+
+
+def run(command: List[str], env: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None) -> CompletedProcess:
+    """ Runs a managed process to the end like subprocess.run, stderr merged into stdout
+
+    Raises TimeoutExpired once the timeout passed, with the process group already stopped.
+    """
+    with managed_process(command, env, STDOUT) as process:
+        stdout, _ = process.communicate(timeout=timeout)
+    return CompletedProcess(command, process.returncode, stdout)
@@ -0,0 +1,65 @@
+""" Opt-in timing of forge's startup phases, reported as JSON on stderr """
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+PROFILE_ENV_VAR = 'FORGE_PROFILE'
+
+STARTED_AT = time.perf_counter()
+PHASES: Dict[str, List[float]] = {}
+OPEN_PHASES: Dict[str, float] = {}
+STATE = {'enabled': os.environ.get(PROFILE_ENV_VAR, '') not in ('', '0'), 'reported': False}
+
+
+def enable() -> None:
+    """ Turn on reporting for this process """
+    STATE['enabled'] = True
+
+
+def is_enabled() -> bool:
+    """ Whether a profile will be reported """
+    return STATE['enabled']
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """ Times a block, adding to the totals of every block sharing its name """
+    started_at = time.perf_counter()
+    OPEN_PHASES.setdefault(name, started_at)
+    try:
+        yield
+    finally:
+        if OPEN_PHASES.get(name) == started_at:
+            del OPEN_PHASES[name]
+        elapsed, calls = PHASES.get(name, [0.0, 0])
+        PHASES[name] = [elapsed + time.perf_counter() - started_at, calls + 1]
+
+
+def get_report() -> Dict[str, Any]:
+    """ Milliseconds spent in each phase so far, still running phases included """
+    now = time.perf_counter()
+    phases = {name: list(totals) for name, totals in PHASES.items()}
+    for name, started_at in OPEN_PHASES.items():
+        elapsed, calls = phases.get(name, [0.0, 0])
+        phases[name] = [elapsed + now - started_at, calls + 1]
+
+    return {
+        'total_ms': round((now - STARTED_AT) * 1000, 3),
+        'phases': {
+            name: {'ms': round(elapsed * 1000, 3), 'calls': int(calls)}
+            for name, (elapsed, calls) in phases.items()
+        }
+    }
+
+
+def report() -> None:
+    """ Writes the profile to stderr once, if profiling is enabled """
+    if not STATE['enabled'] or STATE['reported']:
+        return
+    STATE['reported'] = True
+    sys.stderr.write(json.dumps(get_report()) + '\n')
+    sys.stderr.flush()
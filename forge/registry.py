@@ -0,0 +1,194 @@
+""" Persistent index of installed plugin venvs """
+
+import os
+import threading
+from json import dumps, loads
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import profiling
+from .exceptions import PluginManagementFatalException
+from .storage import atomic_write, file_lock, get_lock_path
+from .util import normalize_name
+
+REGISTRY_VERSION = 3
+REGISTRY_FILE_NAME = 'registry.json'
+METADATA_FILE_NAME = 'pipx_metadata.json'
+FORGE_VENV_PREFIX = 'forge-'
+READ_JOBS = 8
+
+INDEX_LOCK = threading.RLock()
+
+
+def read_metadata(venv_path: str) -> Dict[Any, Any]:
+    """ Return config data from pipx venv metadata file """
+    config_file_path = os.path.join(venv_path, METADATA_FILE_NAME)
+    with profiling.phase('metadata_parse'):
+        try:
+            with open(config_file_path) as config_file:
+                raw_data = config_file.read()
+                if raw_data:
+                    return loads(raw_data)
+                raise PluginManagementFatalException()
+
+        except:
+            raise PluginManagementFatalException(
+                f'Problem reading json file expected at {venv_path}'
+            ) from None
+
+
+def get_mtimes(venv_path: str) -> Dict[str, int]:
+    """ Stat a venv directory and its metadata file """
+    try:
+        return {
+            'dir_mtime': os.stat(venv_path).st_mtime_ns,
+            'file_mtime': os.stat(os.path.join(venv_path, METADATA_FILE_NAME)).st_mtime_ns
+        }
+    except OSError:
+        raise PluginManagementFatalException(
+            f'Problem reading json file expected at {venv_path}'
+        ) from None
+
+
+def read_entry(venv_path: str) -> Dict[str, Any]:
+    """ Build a registry entry holding only the metadata fields forge uses """
+    entry: Dict[str, Any] = get_mtimes(venv_path)
+    main_package = read_metadata(venv_path).get('main_package') or {}
+    entry.update({
+        'package': main_package.get('package', ''),
+        'package_or_url': main_package.get('package_or_url') or main_package.get('package', ''),
+        'pip_args': main_package.get('pip_args') or [],
+        'apps': main_package.get('apps', []),
+        'package_version': main_package.get('package_version', '')
+    })
+    return entry
+
+
+def is_current(entry: Dict[str, Any], venv_path: str) -> bool:
+    """ Check whether a registry entry still matches the venv on disk """
+    try:
+        mtimes = get_mtimes(venv_path)
+    except PluginManagementFatalException:
+        return False
+    return all(entry.get(key) == value for key, value in mtimes.items())
+
+
+def to_plugin_config(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """ Shape a registry entry like the pipx metadata it was built from """
+    return {
+        'main_package': {
+            'package': entry['package'],
+            'package_or_url': entry['package_or_url'],
+            'pip_args': entry['pip_args'],
+            'apps': entry['apps'],
+            'package_version': entry['package_version']
+        }
+    }
+
+
+def load_registry(registry_path: str) -> Dict[str, Dict]:
+    """ Read venv entries from the registry index, empty if missing or outdated """
+    with profiling.phase('index_load'):
+        try:
+            with open(registry_path) as registry_file:
+                data = loads(registry_file.read())
+        except (OSError, ValueError):
+            data = None
+
+    if not isinstance(data, dict) or data.get('version') != REGISTRY_VERSION:
+        return {}
+    return dict(data.get('venvs', {}))
+
+
+def save_registry(registry_path: str, venvs: Dict[str, Dict]) -> None:
+    """ Atomically write venv entries to the registry index """
+    atomic_write(registry_path, dumps(
+        {'version': REGISTRY_VERSION, 'venvs': venvs},
+        separators=(',', ':'),
+        sort_keys=True
+    ))
+
+
+def get_registry_lock_path(registry_path: str) -> str:
+    """ Lock taken to change the registry index, next to the other locks under FORGE_PATH """
+    return get_lock_path(os.path.dirname(registry_path), 'registry')
+
+
+def is_forge_venv_name(venv_name: str) -> bool:
+    """ Whether a venv directory could hold a forge plugin, judged by its name alone """
+    return normalize_name(venv_name).startswith(FORGE_VENV_PREFIX)
+
+
+def scan_forge_venvs(plugin_path: str) -> Dict[str, str]:
+    """ Paths of venv directories named like forge plugins, without opening any of them """
+    if not os.path.isdir(plugin_path):
+        return {}
+    with os.scandir(plugin_path) as entries:
+        return {
+            venv.name: venv.path for venv in entries
+            if is_forge_venv_name(venv.name) and venv.is_dir()
+        }
+
+
+def try_read_entry(venv_path: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """ Registry entry of a venv, or None and the reason it could not be read """
+    try:
+        return read_entry(venv_path), ''
+    except PluginManagementFatalException as err:
+        return None, str(err)
+
+
+def read_entries(venv_paths: Dict[str, str],
+                 on_error: Optional[Callable[[str, str], None]] = None) -> Dict[str, Dict]:
+    """ Reads many venvs concurrently, skipping unreadable ones instead of failing """
+    if not venv_paths:
+        return {}
+    from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+    with ThreadPoolExecutor(max_workers=min(READ_JOBS, len(venv_paths))) as executor:
+        results = list(executor.map(try_read_entry, venv_paths.values()))
+
+    entries = {}
+    for venv_name, (entry, error) in zip(venv_paths, results):
+        if entry is not None:
+            entries[venv_name] = entry
+        elif on_error:
+            on_error(venv_name, error)
+    return entries
+
+
+def refresh_registry(plugin_path: str, registry_path: str, rebuild: bool = False,
+                     on_error: Optional[Callable[[str, str], None]] = None) -> Dict[str, Dict]:
+    """ Bring the registry index up to date, re-reading only venvs that changed """
+    with INDEX_LOCK, profiling.phase('registry_refresh'):
+        venvs = {} if rebuild else load_registry(registry_path)
+        refreshed = {}
+        stale = {}
+
+        for venv_name, venv_path in scan_forge_venvs(plugin_path).items():
+            cached = venvs.get(venv_name)
+            if cached and is_current(cached, venv_path):
+                refreshed[venv_name] = cached
+            else:
+                stale[venv_name] = venv_path
+        refreshed.update(read_entries(stale, on_error))
+
+        if rebuild or refreshed != venvs:
+            with file_lock(get_registry_lock_path(registry_path), blocking=rebuild) as locked:
+                if locked:
+                    save_registry(registry_path, refreshed)
+    return refreshed
+
+
+def update_registry_entry(plugin_path: str, registry_path: str,
+                          venv_name: str) -> Dict[str, Dict]:
+    """ Re-read a single venv into the registry index, dropping it if it is gone """
+    venv_path = os.path.join(plugin_path, venv_name)
+
+    with INDEX_LOCK, file_lock(get_registry_lock_path(registry_path)):
+        venvs = load_registry(registry_path)
+        if is_forge_venv_name(venv_name) and os.path.isdir(venv_path):
+            venvs[venv_name] = read_entry(venv_path)
+            save_registry(registry_path, venvs)
+        elif venvs.pop(venv_name, None) is not None:
+            save_registry(registry_path, venvs)
+    return venvs
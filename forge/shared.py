@@ -0,0 +1,262 @@
+""" Opt-in shared site-packages layer plugin venvs link to instead of keeping their own copies """
+
+import csv
+import os
+import re
+import sys
+import time
+from json import dumps, loads
+from subprocess import TimeoutExpired
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .exceptions import PluginManagementFatalException
+from .process import get_timeout, run
+from .storage import atomic_write
+from .util import get_python_path, get_site_packages, normalize_name
+
+SHARED_DIR_NAME = 'shared'
+SHARED_ENV_VAR = 'FORGE_SHARED'
+PTH_FILE_NAME = 'forge_shared.pth'
+SAVINGS_FILE_NAME = 'savings.json'
+MIN_PLUGINS = 2
+EXCLUDED_PACKAGES = {'pip', 'setuptools', 'wheel', 'distribute', 'pkg-resources'}
+SATISFIED_PATTERN = re.compile(
+    r'^Requirement already satisfied: ([A-Za-z0-9._-]+)\S* in (.+?) \(', re.MULTILINE
+)
+
+
+class Distribution(NamedTuple):
+    """ An installed distribution found in a site-packages directory """
+    name: str
+    version: str
+    dist_info: str
+
+
+def get_python_tag(site_packages: str) -> str:
+    """ Python version a site-packages directory belongs to, e.g. python3.9 """
+    return os.path.basename(os.path.dirname(site_packages))
+
+
+def read_distributions(site_packages: str) -> Dict[str, Distribution]:
+    """ Distributions installed in a site-packages directory, by normalized name """
+    distributions = {}
+    for entry in os.listdir(site_packages):
+        if entry.endswith('.dist-info') and '-' in entry:
+            name, version = entry[:-len('.dist-info')].rsplit('-', 1)
+            distributions[normalize_name(name)] = Distribution(
+                name=normalize_name(name), version=version,
+                dist_info=os.path.join(site_packages, entry)
+            )
+    return distributions
+
+
+def get_distribution_size(site_packages: str, distribution: Distribution) -> int:
+    """ Bytes on disk of the files a distribution's RECORD lists """
+    try:
+        with open(os.path.join(distribution.dist_info, 'RECORD'), newline='') as record_file:
+            paths = [row[0] for row in csv.reader(record_file) if row]
+    except OSError:
+        return 0
+
+    size = 0
+    for path in paths:
+        full_path = os.path.normpath(os.path.join(site_packages, path))
+        if os.path.isfile(full_path):
+            size += os.path.getsize(full_path)
+    return size
+
+
+def find_common_distributions(venv_distributions: List[Dict[str, Distribution]],
+                              min_plugins: int = MIN_PLUGINS) -> Dict[str, str]:
+    """ Dependencies that enough plugins hold at one identical version """
+    versions: Dict[str, Set[str]] = {}
+    counts: Dict[str, int] = {}
+    for distributions in venv_distributions:
+        for name, distribution in distributions.items():
+            versions.setdefault(name, set()).add(distribution.version)
+            counts[name] = counts.get(name, 0) + 1
+
+    return {
+        name: next(iter(name_versions)) for name, name_versions in versions.items()
+        if len(name_versions) == 1 and counts[name] >= min_plugins
+        and name not in EXCLUDED_PACKAGES and not name.startswith('forge-')
+    }
+
+
+def is_enabled(shared_path: str) -> bool:
+    """ Whether shared mode is on, i.e. a shared layer exists and is not switched off """
+    return os.environ.get(SHARED_ENV_VAR) != '0' and get_site_packages(shared_path) is not None
+
+
+def get_pip_env() -> Dict[str, str]:
+    """ pip settings for pipx that install only the plugin package, not its dependencies """
+    return {'PIP_NO_DEPS': '1'}
+
+
+def run_pip(venv_path: str, pip_args: List[str], pip_env: Optional[Dict[str, str]] = None) -> str:
+    """ Runs pip inside a venv with extra pip settings, returns its output """
+    try:
+        result = run([get_python_path(venv_path), '-m', 'pip'] + pip_args,
+                     env=dict(os.environ, **pip_env) if pip_env else None,
+                     timeout=get_timeout('install'))
+    except OSError as err:
+        raise PluginManagementFatalException(f'Could not run pip in {venv_path}: {err}') from None
+    except TimeoutExpired as err:
+        raise PluginManagementFatalException(
+            f'pip {pip_args[0]} timed out after {err.timeout:g} seconds in {venv_path}'
+        ) from None
+    if result.returncode:
+        raise PluginManagementFatalException(
+            f'pip {pip_args[0]} failed in {venv_path}:\n{result.stdout}'
+        )
+    return result.stdout
+
+
+def create_layer(shared_path: str) -> None:
+    """ Creates the shared layer venv, with the interpreter forge runs on """
+    if get_site_packages(shared_path) is not None:
+        return
+    result = run([sys.executable, '-m', 'venv', shared_path])
+    if result.returncode:
+        raise PluginManagementFatalException(
+            f'Could not create shared layer at {shared_path}:\n{result.stdout}'
+        )
+
+
+def link_venv(site_packages: str, shared_site_packages: str) -> None:
+    """ Puts the shared layer on a plugin venv's path, after its own site-packages """
+    atomic_write(os.path.join(site_packages, PTH_FILE_NAME), shared_site_packages + '\n')
+
+
+def load_savings(shared_path: str) -> Dict[str, Any]:
+    """ Recorded savings of the shared layer """
+    try:
+        with open(os.path.join(shared_path, SAVINGS_FILE_NAME)) as savings_file:
+            savings = loads(savings_file.read())
+    except (OSError, ValueError):
+        savings = {}
+    return savings if isinstance(savings, dict) else {}
+
+
+def record_savings(shared_path: str, venv_name: str, size: int, packages: List[str]) -> None:
+    """ Records what a plugin venv is not holding itself thanks to the shared layer """
+    savings = load_savings(shared_path)
+    seconds_per_byte = savings.get('seconds_per_byte', 0.0)
+    plugins = savings.setdefault('plugins', {})
+    previous = plugins.get(venv_name, {'bytes': 0, 'packages': [], 'seconds': 0.0})
+    plugins[venv_name] = {
+        'bytes': previous['bytes'] + size,
+        'packages': sorted(set(previous['packages']) | set(packages)),
+        'seconds': round(previous['seconds'] + size * seconds_per_byte, 1)
+    }
+    atomic_write(os.path.join(shared_path, SAVINGS_FILE_NAME), dumps(savings, indent=2))
+
+
+def install_into_layer(shared_path: str, requirements: Dict[str, str]) -> List[str]:
+    """ Installs pinned dependencies the layer does not hold yet, never replacing a version """
+    shared_site_packages = str(get_site_packages(shared_path))
+    present = read_distributions(shared_site_packages)
+    missing = sorted(name for name in requirements if name not in present)
+    if not missing:
+        return []
+
+    started_at = time.perf_counter()
+    pins = [f'{name}=={requirements[name]}' for name in missing]
+    run_pip(shared_path, ['install', '--no-deps'] + pins)
+    elapsed = time.perf_counter() - started_at
+
+    installed = read_distributions(shared_site_packages)
+    size = sum(get_distribution_size(shared_site_packages, installed[name])
+               for name in missing if name in installed)
+    savings = load_savings(shared_path)
+    savings['seconds_per_byte'] = elapsed / size if size else savings.get('seconds_per_byte', 0.0)
+    atomic_write(os.path.join(shared_path, SAVINGS_FILE_NAME), dumps(savings, indent=2))
+    return missing
+
+
+def dedupe_venv(venv_path: str, site_packages: str,
+                shared_distributions: Dict[str, Distribution]) -> Tuple[int, List[str]]:
+    """ Uninstalls a venv's copies of what the layer holds at the same version """
+    duplicates = [
+        distribution for name, distribution in read_distributions(site_packages).items()
+        if name not in EXCLUDED_PACKAGES and name in shared_distributions
+        and shared_distributions[name].version == distribution.version
+    ]
+    size = sum(get_distribution_size(site_packages, distribution) for distribution in duplicates)
+    if duplicates:
+        run_pip(venv_path, ['uninstall', '-y'] + [distribution.name for distribution in duplicates])
+    return size, sorted(distribution.name for distribution in duplicates)
+
+
+def get_compatible_site_packages(shared_path: str, venv_paths: Dict[str, str]) -> Dict[str, str]:
+    """ site-packages of the venvs running the same Python version as the shared layer """
+    python_tag = get_python_tag(str(get_site_packages(shared_path)))
+    compatible = {}
+    for venv_name, venv_path in venv_paths.items():
+        site_packages = get_site_packages(venv_path)
+        if site_packages and get_python_tag(site_packages) == python_tag:
+            compatible[venv_name] = site_packages
+    return compatible
+
+
+def sync_layer(shared_path: str, venv_paths: Dict[str, str],
+               min_plugins: int = MIN_PLUGINS) -> List[str]:
+    """ Moves the dependencies plugins have in common into the layer, returns what it added """
+    create_layer(shared_path)
+    shared_site_packages = str(get_site_packages(shared_path))
+    compatible = get_compatible_site_packages(shared_path, venv_paths)
+
+    added = install_into_layer(shared_path, find_common_distributions(
+        [read_distributions(site_packages) for site_packages in compatible.values()], min_plugins
+    ))
+
+    shared_distributions = read_distributions(shared_site_packages)
+    for venv_name, site_packages in compatible.items():
+        link_venv(site_packages, shared_site_packages)
+        size, packages = dedupe_venv(venv_paths[venv_name], site_packages, shared_distributions)
+        if packages:
+            record_savings(shared_path, venv_name, size, packages)
+    return added
+
+
+def parse_shared_requirements(pip_output: str, shared_site_packages: str) -> Set[str]:
+    """ Requirements pip found already satisfied by the shared layer """
+    return {
+        normalize_name(name) for name, location in SATISFIED_PATTERN.findall(pip_output)
+        if os.path.normpath(location) == os.path.normpath(shared_site_packages)
+    }
+
+
+def finish_install(shared_path: str, venv_path: str, venv_name: str,
+                   pip_env: Optional[Dict[str, str]] = None) -> None:
+    """ Links a plugin installed without dependencies and installs only those the layer lacks
+
+    pip_env carries the wheelhouse settings the plugin itself was installed with, so its
+    dependencies come from the same place.
+    """
+    shared_site_packages = str(get_site_packages(shared_path))
+    if venv_name in get_compatible_site_packages(shared_path, {venv_name: venv_path}):
+        link_venv(str(get_site_packages(venv_path)), shared_site_packages)
+
+    pip_output = run_pip(venv_path, ['install', venv_name], pip_env)
+    shared_requirements = parse_shared_requirements(pip_output, shared_site_packages)
+    shared_distributions = read_distributions(shared_site_packages)
+    size = sum(get_distribution_size(shared_site_packages, shared_distributions[name])
+               for name in shared_requirements if name in shared_distributions)
+    record_savings(shared_path, venv_name, size, sorted(shared_requirements))
+
+
+def format_savings(savings: Dict[str, Any]) -> str:
+    """ Table of the disk space and estimated install time each plugin saved """
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
+    plugins = savings.get('plugins', {})
+    rows = [
+        (venv_name.replace('forge-', '', 1), len(entry['packages']),
+         f'{entry["bytes"] / 1e6:.1f} MB', f'{entry["seconds"]:.1f} s')
+        for venv_name, entry in sorted(plugins.items())
+    ]
+    rows.append(('total', sum(len(entry['packages']) for entry in plugins.values()),
+                 f'{sum(entry["bytes"] for entry in plugins.values()) / 1e6:.1f} MB',
+                 f'{sum(entry["seconds"] for entry in plugins.values()):.1f} s'))
+    return tabulate(rows, ['plugin', 'shared packages', 'disk saved', 'est. install time saved'])
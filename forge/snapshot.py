@@ -0,0 +1,110 @@
+""" Hardlinked snapshots of plugin venvs taken before upgrades, restored with a rename """
+
+import os
+import shutil
+import time
+from typing import List
+
+SNAPSHOTS_DIR_NAME = 'snapshots'
+SNAPSHOTS_ENV_VAR = 'FORGE_SNAPSHOTS'
+KEEP_ENV_VAR = 'FORGE_SNAPSHOTS_KEEP'
+DEFAULT_KEEP = 2
+PARTIAL_SUFFIX = '.partial'
+DISCARDED_SUFFIX = '.discarded'
+
+
+def is_enabled() -> bool:
+    """ Whether venvs are snapshotted before upgrades, unless FORGE_SNAPSHOTS=0 """
+    return os.environ.get(SNAPSHOTS_ENV_VAR) != '0'
+
+
+def get_keep() -> int:
+    """ Snapshots kept per plugin, from FORGE_SNAPSHOTS_KEEP """
+    value = os.environ.get(KEEP_ENV_VAR, '')
+    return int(value) if value.isdigit() else DEFAULT_KEEP
+
+
+def link_file(source: str, target: str, copy: bool) -> None:
+    """ Hardlinks a file, copying it instead where linking is not possible or asked not to """
+    if not copy:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, target)
+
+
+def link_tree(source: str, target: str) -> None:
+    """ Recreates a venv's directories and links, hardlinking files below its top level
+
+    Files at the top of a venv, like pipx_metadata.json, are rewritten in place by pipx and would
+    change the snapshot through a hardlink, so they are copied. pip replaces everything else with
+    new files, leaving the linked ones untouched.
+    """
+    directories = [(source, target)]
+    while directories:
+        source_dir, target_dir = directories.pop()
+        os.makedirs(target_dir)
+        with os.scandir(source_dir) as entries:
+            for entry in entries:
+                target_path = os.path.join(target_dir, entry.name)
+                if entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), target_path)
+                elif entry.is_dir():
+                    directories.append((entry.path, target_path))
+                else:
+                    link_file(entry.path, target_path, copy=source_dir == source)
+
+
+def take(venv_path: str, snapshots_path: str, version: str) -> str:
+    """ Snapshots a venv, only showing up among the snapshots once it is complete """
+    snapshot_path = os.path.join(snapshots_path, f'{time.time_ns()}-{version}')
+    try:
+        link_tree(venv_path, snapshot_path + PARTIAL_SUFFIX)
+        os.rename(snapshot_path + PARTIAL_SUFFIX, snapshot_path)
+    finally:
+        shutil.rmtree(snapshot_path + PARTIAL_SUFFIX, ignore_errors=True)
+    return snapshot_path
+
+
+def list_snapshots(snapshots_path: str) -> List[str]:
+    """ Complete snapshots of a venv, newest first """
+    try:
+        names = os.listdir(snapshots_path)
+    except OSError:
+        return []
+    return [os.path.join(snapshots_path, name) for name in sorted(names, reverse=True)
+            if not name.endswith((PARTIAL_SUFFIX, DISCARDED_SUFFIX))]
+
+
+def get_version(snapshot_path: str) -> str:
+    """ Plugin version a snapshot holds """
+    return os.path.basename(snapshot_path).split('-', 1)[-1]
+
+
+def remove(path: str) -> None:
+    """ Deletes a snapshot """
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def prune(snapshots_path: str, keep: int) -> List[str]:
+    """ Deletes all but the newest snapshots of a venv, returns the deleted ones """
+    pruned = list_snapshots(snapshots_path)[keep:]
+    for snapshot_path in pruned:
+        remove(snapshot_path)
+    return pruned
+
+
+def restore(snapshot_path: str, venv_path: str) -> None:
+    """ Puts a snapshot in place of a venv with renames, deleting the replaced venv afterwards """
+    discarded_path = snapshot_path + DISCARDED_SUFFIX
+    if os.path.lexists(venv_path):
+        os.rename(venv_path, discarded_path)
+    try:
+        os.rename(snapshot_path, venv_path)
+    except OSError:
+        if os.path.lexists(discarded_path):
+            os.rename(discarded_path, venv_path)
+        raise
+    remove(discarded_path)
@@ -0,0 +1,234 @@
+""" Local per-plugin run telemetry, appended to a size bounded binary file under FORGE_PATH """
+
+import math
+import os
+import struct
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import profiling
+from .storage import atomic_write
+
+try:
+    import resource
+except ImportError:
+    resource = None  # type: ignore
+
+STATS_ENV_VAR = 'FORGE_STATS'
+STATS_FILE_NAME = 'stats.bin'
+STATS_CAPACITY = 10000
+RECORD = struct.Struct('<d32s16sffIi')
+PERCENTILES = (50, 95)
+EXEC_EXIT_CODE = -1
+
+REPORTED_USAGE: Dict[str, float] = {}
+
+
+class Run(NamedTuple):
+    """ One recorded plugin run """
+    started_at: float
+    name: str
+    version: str
+    wall_time: float
+    cpu_time: float
+    max_rss_kb: int
+    exit_code: int
+
+
+def is_enabled() -> bool:
+    """ Whether runs forge waits on anyway are recorded, unless FORGE_STATS=0 """
+    return os.environ.get(STATS_ENV_VAR) != '0'
+
+
+def is_measuring_all() -> bool:
+    """ Whether FORGE_STATS=1 asks to wait on exec dispatched plugins too, so they get recorded """
+    return os.environ.get(STATS_ENV_VAR) == '1'
+
+
+def get_usage(usage: Any) -> Tuple[float, int]:
+    """ CPU seconds and max RSS in KB of a struct_rusage, which macOS reports RSS in bytes in """
+    max_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return usage.ru_utime + usage.ru_stime, int(max_rss)
+
+
+def read_usage(who: int) -> Tuple[float, int]:
+    """ CPU seconds and max RSS in KB of this process or its waited for children """
+    return get_usage(resource.getrusage(who)) if resource else (0.0, 0)
+
+
+def report_usage(cpu_time: float, max_rss_kb: int) -> None:
+    """ Usage of a run whose process forge did not wait on itself, e.g. a zygote's child """
+    REPORTED_USAGE.update(cpu_time=cpu_time, max_rss_kb=max_rss_kb)
+
+
+def get_run_usage(self_before: Tuple[float, int],
+                  children_before: Tuple[float, int]) -> Tuple[float, int]:
+    """ CPU seconds and max RSS a run took, from children if it had any, else in process """
+    if REPORTED_USAGE:
+        return REPORTED_USAGE['cpu_time'], int(REPORTED_USAGE['max_rss_kb'])
+    self_after = read_usage(getattr(resource, 'RUSAGE_SELF', 0))
+    children_after = read_usage(getattr(resource, 'RUSAGE_CHILDREN', 0))
+    cpu_time = self_after[0] - self_before[0] + children_after[0] - children_before[0]
+    return cpu_time, children_after[1] or self_after[1]
+
+
+def get_exit_code(code: object) -> int:
+    """ Exit code a SystemExit's code stands for """
+    if code is None or isinstance(code, int):
+        return int(code or 0)
+    return 1
+
+
+def pack(run: Run) -> bytes:
+    """ Fixed size binary record of a run """
+    return RECORD.pack(run.started_at, run.name.encode()[:32], run.version.encode()[:16],
+                       run.wall_time, run.cpu_time, run.max_rss_kb, run.exit_code)
+
+
+def unpack(data: bytes) -> Run:
+    """ Run held by a binary record """
+    started_at, name, version, wall_time, cpu_time, max_rss_kb, exit_code = RECORD.unpack(data)
+    return Run(started_at, name.rstrip(b'\0').decode(errors='replace'),
+               version.rstrip(b'\0').decode(errors='replace'),
+               wall_time, cpu_time, max_rss_kb, exit_code)
+
+
+def read_runs(stats_path: str, capacity: int = STATS_CAPACITY) -> List[Run]:
+    """ The most recent recorded runs, oldest first """
+    try:
+        with open(stats_path, 'rb') as stats_file:
+            data = stats_file.read()
+    except OSError:
+        return []
+    count = len(data) // RECORD.size
+    return [unpack(data[index * RECORD.size:(index + 1) * RECORD.size])
+            for index in range(max(0, count - capacity), count)]
+
+
+def compact(stats_path: str, capacity: int) -> None:
+    """ Drops all but the most recent runs once the file holds twice as many as it keeps """
+    try:
+        size = os.path.getsize(stats_path)
+    except OSError:
+        return
+    if size < 2 * capacity * RECORD.size:
+        return
+    with open(stats_path, 'rb') as stats_file:
+        stats_file.seek((size // RECORD.size - capacity) * RECORD.size)
+        kept = stats_file.read(capacity * RECORD.size)
+    atomic_write(stats_path, kept)
+
+
+def append(stats_path: str, run: Run, capacity: int = STATS_CAPACITY) -> None:
+    """ Appends a run with a single O_APPEND write, so concurrent runs never interleave """
+    try:
+        os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+        descriptor = os.open(stats_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT |
+                             getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            os.write(descriptor, pack(run))
+        finally:
+            os.close(descriptor)
+        compact(stats_path, capacity)
+    except OSError:
+        pass
+
+
+def record_launch(stats_path: str, command_name: str, version: str) -> None:
+    """ Records a run about to replace forge through exec, whose outcome forge never sees
+
+    The record holds when forge started and how long it took to get the plugin going, as its wall
+    and CPU time, with EXEC_EXIT_CODE standing in for the exit code.
+    """
+    resolve_time = time.perf_counter() - profiling.STARTED_AT
+    cpu_time, max_rss_kb = read_usage(getattr(resource, 'RUSAGE_SELF', 0))
+    append(stats_path, Run(time.time() - resolve_time, command_name, version, resolve_time,
+                           cpu_time, max_rss_kb, EXEC_EXIT_CODE))
+
+
+@contextmanager
+def recording(stats_path: str, command_name: str,
+              get_version: Callable[[], str]) -> Iterator[None]:
+    """ Records the run of a plugin in a block ending in the SystemExit carrying its exit code """
+    REPORTED_USAGE.clear()
+    started_at = time.time()
+    started = time.perf_counter()
+    self_before = read_usage(getattr(resource, 'RUSAGE_SELF', 0))
+    children_before = read_usage(getattr(resource, 'RUSAGE_CHILDREN', 0))
+    exit_code = 1
+    try:
+        yield
+    except SystemExit as err:
+        exit_code = get_exit_code(err.code)
+        raise
+    finally:
+        wall_time = time.perf_counter() - started
+        cpu_time, max_rss_kb = get_run_usage(self_before, children_before)
+        append(stats_path, Run(started_at, command_name, get_version(), wall_time, cpu_time,
+                               max_rss_kb, exit_code))
+
+
+def get_percentile(values: List[float], percentile: int) -> float:
+    """ Nearest rank percentile of some values """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percentile / 100 * len(ordered)) - 1)] if ordered else 0.0
+
+
+def group_runs(runs: List[Run]) -> Dict[Tuple[str, str], List[Run]]:
+    """ Runs by plugin and version, versions in the order they were first used """
+    groups: Dict[Tuple[str, str], List[Run]] = {}
+    for run in sorted(runs, key=lambda run: (run.name, run.started_at)):
+        groups.setdefault((run.name, run.version), []).append(run)
+    return groups
+
+
+def get_trend(median: float, previous: Optional[float]) -> str:
+    """ Change of the median wall time since the previously used version """
+    if not previous:
+        return ''
+    return f'{(median - previous) / previous * 100:+.0f}%'
+
+
+def format_seconds(values: List[float], percentile: int) -> str:
+    """ Percentile of some durations for the report, a dash when there are none """
+    return f'{get_percentile(values, percentile):.2f}s' if values else '-'
+
+
+def summarize(runs: List[Run]) -> List[List[str]]:
+    """ Table rows of run counts, percentiles and trend per plugin version
+
+    Runs handed over with exec only count towards the runs and their resolve time, the other
+    columns come from the runs forge waited on.
+    """
+    rows = []
+    previous: Dict[str, float] = {}
+    for (name, version), group in group_runs(runs).items():
+        measured = [run for run in group if run.exit_code != EXEC_EXIT_CODE]
+        wall_times = [run.wall_time for run in measured]
+        rows.append([
+            name, version or '?', str(len(group)),
+            str(sum(1 for run in measured if run.exit_code != 0)),
+            *(format_seconds(wall_times, percentile) for percentile in PERCENTILES),
+            format_seconds([run.cpu_time for run in measured], 50),
+            f'{get_percentile([run.max_rss_kb for run in measured], 95) / 1024:.0f} MB'
+            if measured else '-',
+            format_seconds([run.wall_time for run in group if run.exit_code == EXEC_EXIT_CODE], 50),
+            get_trend(get_percentile(wall_times, 50), previous.get(name)) if measured else '',
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(group[-1].started_at))
+        ])
+        if measured:
+            previous[name] = get_percentile(wall_times, 50)
+    return rows
+
+
+def format_report(runs: List[Run]) -> str:
+    """ Per plugin version table of the recorded runs """
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
+    if not runs:
+        return 'No plugin runs recorded yet\n'
+    headers = ['plugin', 'version', 'runs', 'failed', 'wall p50', 'wall p95', 'cpu p50',
+               'rss p95', 'exec resolve p50', 'p50 vs previous', 'last run']
+    return tabulate(summarize(runs), headers) + '\n'
@@ -0,0 +1,109 @@
+""" Helpers for files forge keeps under FORGE_PATH """
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+if sys.platform == 'win32':
+    import msvcrt  # pylint: disable=import-error
+
+LOCKS_DIR_NAME = 'locks'
+READER_SLOTS = 64
+LOCK_POLL_SECONDS = 0.05
+
+
+def atomic_write(path: str, content: Union[str, bytes]) -> None:
+    """ Writes a file through a temporary sibling and a rename, so readers never see it partial """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temp_path, 'wb' if isinstance(content, bytes) else 'w') as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def get_lock_path(forge_path: str, name: str) -> str:
+    """ Path of a named lock file under FORGE_PATH """
+    return os.path.join(forge_path, LOCKS_DIR_NAME, f'{name}.lock')
+
+
+def try_flock(descriptor: int, shared: bool) -> bool:
+    """ Takes an flock without waiting, False if another holder keeps it from being taken """
+    try:
+        fcntl.flock(descriptor, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def try_lock_range(descriptor: int, shared: bool) -> bool:
+    """ Takes a Windows byte range lock without waiting, False if another holder keeps it
+
+    Windows has no shared locks, so a shared holder locks one of READER_SLOTS bytes and an
+    exclusive one all of them. The file position is left on the locked range for unlock_range.
+    """
+    locked = False
+    if sys.platform == 'win32':
+        for slot in range(READER_SLOTS) if shared else [0]:
+            os.lseek(descriptor, slot, os.SEEK_SET)
+            try:
+                msvcrt.locking(descriptor, msvcrt.LK_NBLCK, 1 if shared else READER_SLOTS)
+            except OSError:
+                continue
+            locked = True
+            break
+    return locked
+
+
+def unlock_range(descriptor: int, shared: bool) -> None:
+    """ Releases a byte range lock taken by try_lock_range """
+    if sys.platform == 'win32':
+        msvcrt.locking(descriptor, msvcrt.LK_UNLCK, 1 if shared else READER_SLOTS)
+
+
+def try_lock(descriptor: int, shared: bool) -> bool:
+    """ Takes a file lock without waiting, False if another holder keeps it from being taken """
+    return try_flock(descriptor, shared) if fcntl else try_lock_range(descriptor, shared)
+
+
+def wait_for_lock(descriptor: int, shared: bool) -> None:
+    """ Takes a file lock, waiting for the other holders to release it """
+    if fcntl:
+        fcntl.flock(descriptor, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    else:
+        while not try_lock_range(descriptor, shared):
+            time.sleep(LOCK_POLL_SECONDS)
+
+
+@contextmanager
+def file_lock(lock_path: str, shared: bool = False, blocking: bool = True,
+              on_wait: Optional[Callable[[], None]] = None) -> Iterator[bool]:
+    """ Holds a file lock across processes, yielding False if it was taken and not blocking
+
+    An flock where there is fcntl, a byte range lock with msvcrt on Windows.
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    descriptor = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    locked = False
+    try:
+        locked = try_lock(descriptor, shared)
+        if not locked and blocking:
+            if on_wait:
+                on_wait()
+            wait_for_lock(descriptor, shared)
+            locked = True
+        yield locked
+    finally:
+        if locked and not fcntl:
+            unlock_range(descriptor, shared)
+        os.close(descriptor)
@@ -0,0 +1,36 @@
+""" Package name and venv layout helpers shared across forge modules """
+
+import glob
+import os
+import re
+from typing import Optional
+
+PLAIN_REQUIREMENT_PATTERN = re.compile(
+    r'^(?!.*\.(whl|zip|tar\.gz|tgz|tar\.bz2)$)'
+    r'[A-Za-z0-9][A-Za-z0-9._-]*\s*(\[[A-Za-z0-9._,\s-]*\])?\s*([<>=!~]=?=?\s*[\w.*+!-]+\s*,?\s*)*$'
+)
+
+
+def normalize_name(name: str) -> str:
+    """ PEP 503 normalized package name """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def is_plain_requirement(source: str) -> bool:
+    """ Whether a pipx source names a package index project, not a VCS URL, path or archive """
+    return bool(PLAIN_REQUIREMENT_PATTERN.match(source))
+
+
+def get_python_path(venv_path: str) -> str:
+    """ Interpreter of a venv """
+    if os.name == 'nt':
+        return os.path.join(venv_path, 'Scripts', 'python.exe')
+    return os.path.join(venv_path, 'bin', 'python')
+
+
+def get_site_packages(venv_path: str) -> Optional[str]:
+    """ site-packages directory of a venv, None if it has none """
+    candidates = sorted(glob.glob(os.path.join(venv_path, 'lib', 'python*', 'site-packages')))
+    candidates.append(os.path.join(venv_path, 'Lib', 'site-packages'))
+    existing = [candidate for candidate in candidates if os.path.isdir(candidate)]
+    return existing[0] if existing else None
@@ -0,0 +1,79 @@
+""" Change notification for plugin directories, inotify on Linux and polling elsewhere """
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import threading
+from typing import Callable, List, Optional
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+POLL_INTERVAL = 2.0
+WAKE_INTERVAL = 0.5
+SETTLE_INTERVAL = 0.05
+READ_SIZE = 65536
+
+
+def load_inotify() -> Optional[ctypes.CDLL]:
+    """ The C library when it provides inotify, None on other platforms """
+    libc = None
+    if sys.platform.startswith('linux'):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        except OSError:
+            libc = None
+    return libc if libc is not None and hasattr(libc, 'inotify_init1') else None
+
+
+def drain_events(inotify_fd: int, stop: threading.Event) -> bool:
+    """ Waits for a burst of events and consumes it, False if stopped first """
+    while not stop.is_set():
+        if select.select([inotify_fd], [], [], WAKE_INTERVAL)[0]:
+            while select.select([inotify_fd], [], [], SETTLE_INTERVAL)[0]:
+                os.read(inotify_fd, READ_SIZE)
+            return True
+    return False
+
+
+def watch_with_inotify(libc: ctypes.CDLL, get_paths: Callable[[], List[str]],
+                       on_change: Callable[[], None], stop: threading.Event) -> None:
+    """ Re-watches the current directories after every change, so new venvs are picked up """
+    changed = True
+    while not stop.is_set():
+        inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if inotify_fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        try:
+            for path in get_paths():
+                libc.inotify_add_watch(inotify_fd, os.fsencode(path), WATCH_MASK)
+            if changed:
+                on_change()
+            changed = drain_events(inotify_fd, stop)
+        finally:
+            os.close(inotify_fd)
+
+
+def watch(get_paths: Callable[[], List[str]], on_change: Callable[[], None],
+          stop: threading.Event) -> None:
+    """ Calls on_change once watching starts and after anything watched changes, until stopped """
+    libc = load_inotify()
+    if libc is not None:
+        try:
+            watch_with_inotify(libc, get_paths, on_change, stop)
+        except OSError:
+            pass
+
+    while not stop.wait(POLL_INTERVAL):
+        on_change()
@@ -0,0 +1,181 @@
+""" Local wheel cache that add and update build into once and install from afterwards """
+
+import os
+import re
+import sys
+import threading
+from json import dumps, loads
+from subprocess import TimeoutExpired
+from typing import Dict, List, Tuple
+
+from .exceptions import PluginManagementFatalException
+from .process import get_timeout, run
+from .storage import atomic_write
+
+WHEELHOUSE_ENV_VAR = 'FORGE_WHEELHOUSE'
+OFFLINE_ENV_VAR = 'FORGE_OFFLINE'
+SIZE_ENV_VAR = 'FORGE_WHEELHOUSE_MB'
+DEFAULT_SIZE_MB = 1024
+SOURCES_FILE_NAME = 'sources.json'
+VCS_PATTERN = re.compile(r'^(git|hg|svn|bzr)\+', re.IGNORECASE)
+PINNED_COMMIT_PATTERN = re.compile(r'@[0-9a-f]{40}(#|$)')
+WHEEL_PATTERN = re.compile(
+    r'^\s*(?:Saved|File was already downloaded) (.+\.whl)\s*$', re.MULTILINE
+)
+
+BUILD_LOCKS: Dict[str, threading.Lock] = {}
+BUILD_LOCKS_LOCK = threading.Lock()
+SOURCES_LOCK = threading.Lock()
+
+
+def is_enabled() -> bool:
+    """ Whether add and update go through the wheelhouse """
+    return os.environ.get(WHEELHOUSE_ENV_VAR) != '0'
+
+
+def is_offline() -> bool:
+    """ Whether installs may only use wheels already in the wheelhouse """
+    return os.environ.get(OFFLINE_ENV_VAR, '') not in ('', '0')
+
+
+def get_max_bytes() -> int:
+    """ Size the wheelhouse is trimmed back to after each build """
+    try:
+        return int(os.environ.get(SIZE_ENV_VAR, DEFAULT_SIZE_MB)) * 1024 * 1024
+    except ValueError:
+        return DEFAULT_SIZE_MB * 1024 * 1024
+
+
+def is_vcs_source(source: str) -> bool:
+    """ Whether pip would clone the source, e.g. git+https://... """
+    return bool(VCS_PATTERN.match(source))
+
+
+def get_pip_env(wheelhouse: str, offline: bool) -> Dict[str, str]:
+    """ pip settings that make installs look in the wheelhouse, and only there when offline """
+    pip_env = {'PIP_FIND_LINKS': wheelhouse}
+    if offline:
+        pip_env['PIP_NO_INDEX'] = '1'
+    return pip_env
+
+
+def get_build_lock(requirement: str) -> threading.Lock:
+    """ Lock serializing builds of one requirement, different requirements build side by side """
+    with BUILD_LOCKS_LOCK:
+        return BUILD_LOCKS.setdefault(requirement, threading.Lock())
+
+
+def load_sources(wheelhouse: str) -> Dict[str, str]:
+    """ Wheel file built for each VCS source """
+    try:
+        with open(os.path.join(wheelhouse, SOURCES_FILE_NAME)) as sources_file:
+            sources = loads(sources_file.read())
+    except (OSError, ValueError):
+        sources = {}
+    return sources if isinstance(sources, dict) else {}
+
+
+def run_pip_wheel(wheelhouse: str, requirements: List[str], pip_args: List[str],
+                  python: str) -> List[str]:
+    """ Builds or downloads wheels into the wheelhouse, returns the wheel files pip reported
+
+    pip runs on the interpreter the plugin venv uses, so compiled wheels get its ABI tags.
+    """
+    command = [python, '-m', 'pip', 'wheel', '--wheel-dir', wheelhouse,
+               '--find-links', wheelhouse] + pip_args + requirements
+    try:
+        result = run(command, timeout=get_timeout('build'))
+    except OSError as err:
+        raise PluginManagementFatalException(f'Could not run pip wheel: {err}') from None
+    except TimeoutExpired as err:
+        raise PluginManagementFatalException(
+            f'pip wheel timed out after {err.timeout:g} seconds'
+        ) from None
+    if result.returncode:
+        raise PluginManagementFatalException(f'Building wheels failed:\n{result.stdout}')
+
+    wheels = [os.path.join(wheelhouse, os.path.basename(path))
+              for path in WHEEL_PATTERN.findall(result.stdout)]
+    for wheel in wheels:
+        if os.path.exists(wheel):
+            os.utime(wheel)
+    return wheels
+
+
+def build_vcs_wheel(wheelhouse: str, source: str, python: str) -> str:
+    """ Wheel of a VCS source, cloned and built only when it is not pinned to a cached commit """
+    sources = load_sources(wheelhouse)
+    cached = os.path.join(wheelhouse, sources.get(source, ''))
+    if sources.get(source) and PINNED_COMMIT_PATTERN.search(source) and os.path.exists(cached):
+        wheel = cached
+    else:
+        built = run_pip_wheel(wheelhouse, [source], ['--no-deps'], python)
+        if not built:
+            raise PluginManagementFatalException(f'pip built no wheel for {source}')
+        wheel = built[0]
+        with SOURCES_LOCK:
+            sources = load_sources(wheelhouse)
+            sources[source] = os.path.basename(wheel)
+            atomic_write(os.path.join(wheelhouse, SOURCES_FILE_NAME), dumps(sources, indent=2))
+    run_pip_wheel(wheelhouse, [wheel], [], python)
+    return wheel
+
+
+def evict(wheelhouse: str, max_bytes: int) -> List[str]:
+    """ Removes least recently used wheels until the wheelhouse fits, keeping VCS builds """
+    kept = set(load_sources(wheelhouse).values())
+    wheels = sorted(
+        (entry for entry in os.scandir(wheelhouse)
+         if entry.name.endswith('.whl') and entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    total = sum(entry.stat().st_size for entry in wheels)
+    removed = []
+    for entry in wheels:
+        if total <= max_bytes:
+            break
+        if entry.name not in kept:
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+            removed.append(entry.name)
+    return removed
+
+
+def find_offline_wheel(wheelhouse: str, source: str) -> str:
+    """ Previously built wheel of a VCS source, for installs without network access """
+    wheel_name = load_sources(wheelhouse).get(source)
+    if not wheel_name or not os.path.exists(os.path.join(wheelhouse, wheel_name)):
+        raise PluginManagementFatalException(
+            f'{source} is not in the wheelhouse, add it once while online'
+        )
+    return os.path.join(wheelhouse, wheel_name)
+
+
+def fill(wheelhouse: str, requirement: str, python: str) -> None:
+    """ Builds a requirement's wheels, leaving a failed build to the install itself """
+    try:
+        if is_vcs_source(requirement):
+            build_vcs_wheel(wheelhouse, requirement, python)
+        else:
+            run_pip_wheel(wheelhouse, [requirement], [], python)
+    except PluginManagementFatalException:
+        pass
+    with SOURCES_LOCK:
+        evict(wheelhouse, get_max_bytes())
+
+
+def prepare(wheelhouse: str, requirement: str, offline: bool = False,
+            python: str = sys.executable) -> Tuple[str, Dict[str, str]]:
+    """ Fills the wheelhouse for a requirement, returns what to install and the pip settings
+
+    pipx gets the requirement itself, so the source it records, and upgrades from, stays the VCS
+    URL rather than a wheel file. Only offline, when nothing can be cloned, is a VCS source
+    installed from the wheel built for it earlier.
+    """
+    os.makedirs(wheelhouse, exist_ok=True)
+    with get_build_lock(requirement):
+        if not offline:
+            fill(wheelhouse, requirement, python)
+        install_spec = find_offline_wheel(wheelhouse, requirement) \
+            if offline and is_vcs_source(requirement) else requirement
+    return install_spec, get_pip_env(wheelhouse, offline)
@@ -0,0 +1,320 @@
+""" Fork server keeping one plugin imported and forking a child for every run """
+
+import array
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import inprocess, stats
+from .exceptions import (PluginManagementFatalException,
+                         PluginManagementWarnException)
+
+ZYGOTE_ENV_VAR = 'FORGE_ZYGOTE'
+STDIO_FDS = [0, 1, 2]
+HEADER = struct.Struct('!I')
+CONNECT_TIMEOUT = 1.0
+POLL_INTERVAL = 0.5
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any],
+                 fds: Optional[List[int]] = None) -> None:
+    """ Sends a length prefixed JSON message, passing file descriptors along with it """
+    data = json.dumps(message).encode()
+    payload = HEADER.pack(len(data)) + data
+    ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))] if fds else []
+    sent = sock.sendmsg([payload], ancillary)
+    if sent < len(payload):
+        sock.sendall(payload[sent:])
+
+
+def receive_exactly(sock: socket.socket, size: int, received: bytes = b'') -> Optional[bytes]:
+    """ Reads until size bytes arrived, None if the peer closed the connection first """
+    while len(received) < size:
+        chunk = sock.recv(size - len(received))
+        if not chunk:
+            return None
+        received += chunk
+    return received
+
+
+def receive_message(sock: socket.socket) -> Tuple[Optional[Dict[str, Any]], List[int]]:
+    """ Reads one message and the file descriptors sent with it """
+    fds = array.array('i')
+    received, ancillary, _, _ = sock.recvmsg(
+        HEADER.size, socket.CMSG_SPACE(len(STDIO_FDS) * fds.itemsize)
+    )
+    for level, kind, fd_data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(fd_data[:len(fd_data) - len(fd_data) % fds.itemsize])
+
+    header = receive_exactly(sock, HEADER.size, received) if received else None
+    data = receive_exactly(sock, HEADER.unpack(header)[0]) if header else None
+    return (json.loads(data.decode()) if data else None), list(fds)
+
+
+def get_exit_code(value: Any) -> int:
+    """ Process exit code for an entry point's return value, like sys.exit would use """
+    if value is None or isinstance(value, int):
+        return int(value or 0)
+    sys.stderr.write(f'{value}\n')
+    return 1
+
+
+def get_status_code(status: int) -> int:
+    """ Exit code of a waited for child, shells' 128 + signal for killed ones """
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def reopen_stdio() -> None:
+    """ Rebinds sys.stdin, stdout and stderr to the client's descriptors, buffered to match """
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False, buffering=1 if os.isatty(1) else -1)
+    sys.stderr = open(2, 'w', closefd=False, buffering=1)
+
+
+def attach_client(run_request: Dict[str, Any], fds: List[int], executable: str) -> None:
+    """ Takes over a client's stdio, working directory, environment and arguments """
+    for target_fd, fd in zip(STDIO_FDS, fds):
+        os.dup2(fd, target_fd)
+    for fd in set(fds) - set(STDIO_FDS):
+        os.close(fd)
+    os.chdir(run_request['cwd'])
+    os.environ.clear()
+    os.environ.update(run_request['env'])
+    sys.argv = [executable] + run_request['argv']
+    reopen_stdio()
+
+
+def get_modified_time(path: str) -> Optional[int]:
+    """ Modification time of a file, None once it is gone """
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ZygoteServer:
+    """ Accepts runs of a pre-imported plugin and forks a child for each """
+
+    def __init__(self, listener: socket.socket, target: Callable[[], Any],
+                 executable: str, watch_path: str) -> None:
+        self.listener = listener
+        self.target = target
+        self.executable = executable
+        self.watched = (watch_path, get_modified_time(watch_path))
+        self.children: Dict[int, Optional[socket.socket]] = {}
+        self.runs = 0
+        self.running = True
+
+    def is_stale(self) -> bool:
+        """ Whether the plugin was upgraded or removed since it was imported """
+        return get_modified_time(self.watched[0]) != self.watched[1]
+
+    def run_child(self, run_request: Dict[str, Any], fds: List[int]) -> None:
+        """ Becomes the plugin run a client asked for, never returns """
+        code = 1
+        try:
+            self.listener.close()
+            for connection in self.children.values():
+                if connection:
+                    connection.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            attach_client(run_request, fds, self.executable)
+            code = get_exit_code(self.target())
+        except SystemExit as err:
+            code = get_exit_code(err.code)
+        except BaseException:  # pylint: disable=broad-except
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)  # pylint: disable=protected-access
+
+    def start_run(self, connection: socket.socket, run_request: Dict[str, Any],
+                  fds: List[int]) -> None:
+        """ Forks a child for a run request and reports its pid to the client """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self.run_child(run_request, fds)
+        self.children[pid] = connection
+        self.runs += 1
+        try:
+            send_message(connection, {'ok': True, 'pid': pid})
+        except OSError:
+            pass
+
+    def accept(self) -> None:
+        """ Handles one incoming request """
+        connection, _ = self.listener.accept()
+        try:
+            message, fds = receive_message(connection)
+        except (OSError, ValueError):
+            connection.close()
+            return
+
+        operation = (message or {}).get('op', 'run')
+        if operation == 'run' and message and not self.is_stale() and len(fds) == len(STDIO_FDS):
+            self.start_run(connection, message, fds)
+        else:
+            self.running = operation != 'stop' and not self.is_stale()
+            try:
+                send_message(connection, {'ok': operation in ('ping', 'stop'),
+                                          'pid': os.getpid(), 'runs': self.runs})
+            except OSError:
+                pass
+            connection.close()
+        for fd in fds:
+            os.close(fd)
+
+    def forward(self, connection: socket.socket) -> None:
+        """ Passes a client's signal on to its child, hanging the child up if the client left """
+        pid = next(pid for pid, child_connection in self.children.items()
+                   if child_connection is connection)
+        try:
+            message, _ = receive_message(connection)
+        except (OSError, ValueError):
+            message = None
+        if message is None:
+            connection.close()
+            self.children[pid] = None
+        try:
+            os.kill(pid, int(message['signal']) if message else signal.SIGHUP)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def reap(self) -> None:
+        """ Collects finished children and reports their exit codes and resource usage """
+        for pid in list(self.children):
+            try:
+                finished, status, usage = os.wait4(pid, os.WNOHANG)
+                cpu_time, max_rss_kb = stats.get_usage(usage)
+                result = {'exit': get_status_code(status), 'cpu': cpu_time, 'max_rss': max_rss_kb}
+            except ChildProcessError:
+                finished, result = pid, {'exit': 1}
+            if finished:
+                connection = self.children.pop(pid)
+                if connection:
+                    try:
+                        send_message(connection, result)
+                    except OSError:
+                        pass
+                    connection.close()
+
+    def serve(self) -> None:
+        """ Runs the request loop until stopped or the plugin goes stale """
+        while self.running or self.children:
+            sockets = [self.listener] if self.running else []
+            connections = [connection for connection in self.children.values() if connection]
+            readable, _, _ = select.select(sockets + connections, [], [], POLL_INTERVAL)
+            for ready in readable:
+                if ready is self.listener:
+                    self.accept()
+                else:
+                    self.forward(ready)
+            self.reap()
+
+
+def send_request(socket_path: str, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ A ping or stop exchange with a zygote, None if it is not reachable """
+    response = None
+    if hasattr(socket, 'AF_UNIX') and os.path.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(CONNECT_TIMEOUT)
+                client.connect(socket_path)
+                send_message(client, message)
+                response, _ = receive_message(client)
+        except (OSError, ValueError):
+            response = None
+    return response if response and response.get('ok') else None
+
+
+def bind(socket_path: str) -> socket.socket:
+    """ Listening socket readable by the current user only, replacing a stale one """
+    if send_request(socket_path, {'op': 'ping'}):
+        raise PluginManagementWarnException(f'A zygote is already running at {socket_path}')
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask = os.umask(0o177)
+    try:
+        listener.bind(socket_path)
+    finally:
+        os.umask(previous_umask)
+    listener.listen(64)
+    return listener
+
+
+def serve(socket_path: str, command_name: str, executable: str, watch_path: str) -> None:
+    """ Imports a plugin once and serves runs of it until stopped, SIGTERM or an upgrade """
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork'):
+        raise PluginManagementFatalException('Zygotes need fork and Unix domain sockets')
+    found = inprocess.find_plugin_entry_point(command_name, executable)
+    if found is None:
+        raise PluginManagementFatalException(
+            f'{command_name} does not declare a {inprocess.ENTRY_POINT_GROUP} entry point '
+            'for this Python version'
+        )
+
+    inprocess.isolate_import_path(found[0])
+    inprocess.unload_dependencies()
+    server = ZygoteServer(bind(socket_path), inprocess.load_entry_point(found[1]),
+                          executable, watch_path)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.listener.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def wait_for_exit(client: socket.socket) -> int:
+    """ Waits for the child's exit code, forwarding Ctrl-C to it meanwhile """
+    while True:
+        try:
+            response, _ = receive_message(client)
+            break
+        except KeyboardInterrupt:
+            send_message(client, {'signal': int(signal.SIGINT)})
+        except (OSError, ValueError):
+            response = None
+            break
+    if response and 'cpu' in response:
+        stats.report_usage(float(response['cpu']), int(response['max_rss']))
+    return int(response['exit']) if response and 'exit' in response else 1
+
+
+def run_client(socket_path: str, command: List[str]) -> Optional[int]:
+    """ Runs a command through a zygote, its exit code or None if no zygote took it """
+    if os.environ.get(ZYGOTE_ENV_VAR) == '0' or not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    code = None
+    try:
+        client.settimeout(CONNECT_TIMEOUT)
+        client.connect(socket_path)
+        send_message(client, {'op': 'run', 'argv': command[1:], 'env': dict(os.environ),
+                              'cwd': os.getcwd()}, STDIO_FDS)
+        accepted, _ = receive_message(client)
+        client.settimeout(None)
+        code = wait_for_exit(client) if accepted and accepted.get('ok') else None
+    except (OSError, ValueError):
+        code = None
+    finally:
+        client.close()
+    return code
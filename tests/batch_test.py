@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+from forge import batch, package_index
+from forge.exceptions import (PluginManagementFatalException,
+                              PluginManagementWarnException)
+from forge.package_index import UpdateCheck
+from mock import call, patch
+
+from .conftest import make_venv
+
+
+def operation(name):
+    if name == 'forge-warn':
+        raise PluginManagementWarnException('Plugin not installed! Cannot update!')
+    if name == 'forge-fail':
+        raise PluginManagementFatalException('pip output\nERROR: no matching distribution\n')
+    if name == 'forge-crash':
+        raise OSError(28, 'No space left on device')
+    return f'{name} updated'
+
+
+def test_run_operation():
+    assert batch.run_operation(operation, 'forge-ok') == batch.BatchResult(
+        'forge-ok', batch.SUCCEEDED, 'forge-ok updated'
+    )
+    assert batch.run_operation(operation, 'forge-warn').status == batch.WARNED
+    assert batch.run_operation(operation, 'forge-fail').status == batch.FAILED
+    assert batch.run_operation(operation, 'forge-crash') == batch.BatchResult(
+        'forge-crash', batch.FAILED, 'OSError: [Errno 28] No space left on device'
+    )
+
+
+@patch('forge.pipx_wrapper.Halo')
+def test_run_batch_runs_concurrently_in_input_order(mock_spinner):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def blocking_operation(name):
+        barrier.wait()
+        return name
+
+    names = ['forge-plugin1', 'forge-plugin2', 'forge-plugin3']
+    results = batch.run_batch(blocking_operation, names, jobs=3, label='Updating plugins')
+
+    assert [result.name for result in results] == names
+    assert all(result.status == batch.SUCCEEDED for result in results)
+    mock_spinner.assert_called_once()
+    assert call().__enter__().start('Updating plugins [3/3]...') in mock_spinner.mock_calls
+
+
+@patch('forge.pipx_wrapper.Halo')
+def test_run_batch_reports_each_plugin(mock_spinner):
+    batch.run_batch(operation, ['forge-ok', 'forge-warn', 'forge-fail'], jobs=1, label='Updating')
+
+    spinner = mock_spinner.return_value.__enter__.return_value
+    spinner.succeed.assert_called_once_with('[ok] forge-ok updated')
+    spinner.warn.assert_called_once_with('[warn] Plugin not installed! Cannot update!')
+    spinner.fail.assert_called_once_with('[fail] ERROR: no matching distribution')
+
+
+@patch('forge.process.stop_all')
+@patch('forge.batch.as_completed', side_effect=KeyboardInterrupt)
+@patch('forge.pipx_wrapper.Halo')
+def test_run_batch_stops_processes_on_ctrl_c(mock_spinner, mock_as_completed, mock_stop_all):
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_batch(operation, ['forge-ok'], jobs=1, label='Updating')
+
+    mock_stop_all.assert_called_once_with()
+
+
+@pytest.mark.parametrize('statuses,expected_exception', [
+    ([batch.SUCCEEDED, batch.SUCCEEDED], None),
+    ([batch.SUCCEEDED, batch.WARNED], PluginManagementWarnException),
+    ([batch.WARNED, batch.FAILED], PluginManagementFatalException),
+    ([], None)
+])
+def test_raise_for_results(statuses, expected_exception):
+    results = [batch.BatchResult(f'forge-{index}', status, '') for index, status in enumerate(statuses)]
+
+    if expected_exception:
+        with pytest.raises(expected_exception):
+            batch.raise_for_results(results)
+    else:
+        batch.raise_for_results(results)
+
+
+@patch('forge.batch.tabulate', return_value='table')
+@patch('forge.pipx_wrapper.Halo')
+@patch('forge.batch.upgrade_plugin', side_effect=lambda name, extra_args: f'{name} updated')
+def test_update_plugins(mock_upgrade, mock_spinner, mock_tabulate):
+    results = batch.update_plugins(['forge-plugin1', 'forge-plugin2'], ['arg1'], jobs=2)
+
+    assert sorted(mock_upgrade.mock_calls) == [
+        call('forge-plugin1', ['arg1']), call('forge-plugin2', ['arg1'])
+    ]
+    assert len(results) == 2
+    mock_tabulate.assert_called_once_with(
+        [('plugin1', 'succeeded', 'forge-plugin1 updated'), ('plugin2', 'succeeded', 'forge-plugin2 updated')],
+        ['plugin', 'result', 'details']
+    )
+
+
+@patch('forge.batch.tabulate', return_value='table')
+@patch('forge.pipx_wrapper.Halo')
+@patch('forge.batch.uninstall_plugin', side_effect=PluginManagementFatalException('boom'))
+def test_uninstall_plugins_failure(mock_uninstall, mock_spinner, mock_tabulate):
+    with pytest.raises(PluginManagementFatalException):
+        batch.uninstall_plugins(['forge-plugin1'], [], jobs=1)
+
+    mock_uninstall.assert_called_once_with('forge-plugin1', [])
+    mock_tabulate.assert_called_once_with([('plugin1', 'failed', 'boom')], ['plugin', 'result', 'details'])
+
+
+@patch('forge.batch.check_updates')
+def test_check_plugin_updates_only_asks_index_about_index_installs(mock_check_updates, forge_home):
+    make_venv(forge_home / 'venvs', 'forge-indexed', package_version='1.0')
+    make_venv(forge_home / 'venvs', 'forge-cloned', package_version='1.0',
+              source='git+https://example.com/forge-cloned.git')
+    mock_check_updates.return_value = [UpdateCheck('forge-indexed', '1.0', '1.0')]
+
+    checks = batch.check_plugin_updates(['forge-cloned', 'forge-indexed'], jobs=2)
+
+    assert mock_check_updates.call_args.args[0] == {'forge-indexed': '1.0'}
+    assert checks == [UpdateCheck('forge-cloned', '1.0', None), UpdateCheck('forge-indexed', '1.0', '1.0')]
+    assert batch.skip_up_to_date(['forge-cloned', 'forge-indexed'], jobs=2) == ['forge-cloned']
+
+
+@patch('forge.batch.check_updates')
+def test_check_plugin_updates_asks_each_plugins_own_index(mock_check_updates, forge_home,
+                                                          monkeypatch):
+    monkeypatch.delenv('FORGE_INDEX_URL')
+    for variable in ('PIP_INDEX_URL', 'PIP_EXTRA_INDEX_URL', 'PIP_NO_INDEX'):
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setattr(package_index, 'get_pip_config_paths', lambda: [])
+    make_venv(forge_home / 'venvs', 'forge-internal', package_version='1.0',
+              pip_args=['--index-url', 'https://pypi.internal/simple/'])
+    make_venv(forge_home / 'venvs', 'forge-mixed', package_version='1.0',
+              pip_args=['--extra-index-url=https://pypi.internal/simple'])
+    mock_check_updates.return_value = [UpdateCheck('forge-internal', '1.0', '1.0')]
+
+    checks = batch.check_plugin_updates(['forge-internal', 'forge-mixed'], jobs=2)
+
+    assert mock_check_updates.call_args.args[0] == {'forge-internal': '1.0'}
+    assert mock_check_updates.call_args.args[3] == {'forge-internal': 'https://pypi.internal/simple'}
+    assert checks[1] == UpdateCheck('forge-mixed', '1.0', None)
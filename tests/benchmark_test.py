@@ -0,0 +1,115 @@
+""" Scaling benchmarks, run with FORGE_BENCHMARK=1 python -m pytest -s tests/benchmark_test.py """
+
+import json
+import os
+import stat
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+from forge import forge
+
+from .conftest import make_venv
+
+BENCHMARK_ENV_VAR = 'FORGE_BENCHMARK'
+VENV_COUNTS = (1, 50, 500, 5000)
+FORGE_PLUGIN_RATIO = 4
+REPEATS = 5
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get(BENCHMARK_ENV_VAR), reason=f'set {BENCHMARK_ENV_VAR}=1 to run benchmarks'
+)
+
+
+@pytest.fixture(scope='module', params=VENV_COUNTS, ids=lambda count: f'{count}-venvs')
+def forge_tree(request, tmp_path_factory):
+    """ A home directory holding a synthetic ~/.forge with a mix of forge and other venvs """
+    home = tmp_path_factory.mktemp(f'home-{request.param}')
+    plugin_path = home / '.forge' / 'venvs'
+    for index in range(request.param):
+        if index % FORGE_PLUGIN_RATIO == 0:
+            make_venv(plugin_path, f'forge-plugin{index}')
+        else:
+            make_venv(plugin_path, f'package{index}')
+
+    bin_path = home / 'bin'
+    bin_path.mkdir()
+    plugin = bin_path / 'plugin0'
+    plugin.write_text('#!/bin/sh\nexit 0\n')
+    plugin.chmod(plugin.stat().st_mode | stat.S_IEXEC)
+    return home, request.param
+
+
+@pytest.fixture
+def forge_paths(forge_tree, monkeypatch):
+    """ Points forge at the synthetic tree """
+    home, count = forge_tree
+    monkeypatch.setattr(forge, 'FORGE_PATH', str(home / '.forge'))
+    monkeypatch.setattr(forge, 'PLUGIN_PATH', str(home / '.forge' / 'venvs'))
+    return home, count
+
+
+def time_call(function, repeats=REPEATS):
+    """ Median wall time of a call in milliseconds """
+    timings = []
+    for _ in range(repeats):
+        started_at = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def report(benchmark, venv_count, median_ms, **extra):
+    """ Prints one benchmark result as a JSON line """
+    print(json.dumps(dict(benchmark=benchmark, venvs=venv_count, median_ms=median_ms, **extra)))
+
+
+def test_get_plugins_cold(forge_paths):
+    _, count = forge_paths
+
+    def cold_get_plugins():
+        if os.path.exists(forge.get_registry_path()):
+            os.remove(forge.get_registry_path())
+        forge.get_plugins()
+
+    report('get_plugins_cold', count, time_call(cold_get_plugins))
+
+
+def test_get_plugins_warm(forge_paths):
+    _, count = forge_paths
+    plugin_count = len(forge.get_plugins())
+
+    report('get_plugins_warm', count, time_call(forge.get_plugins), plugins=plugin_count)
+    assert plugin_count == len(range(0, count, FORGE_PLUGIN_RATIO))
+
+
+def test_list_plugins(forge_paths, capsys):
+    _, count = forge_paths
+    forge.get_plugins()
+
+    median_ms = time_call(forge.list_plugins)
+
+    capsys.readouterr()
+    report('list_plugins', count, median_ms)
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='plugin stub is a shell script')
+def test_dispatch_end_to_end(forge_paths):
+    home, count = forge_paths
+    env = dict(os.environ, HOME=str(home), FORGE_PROFILE='1',
+               PATH=f'{home / "bin"}{os.pathsep}{os.environ["PATH"]}')
+    results = []
+
+    def dispatch():
+        results.append(subprocess.run(
+            [sys.executable, '-m', 'forge', 'plugin0'],
+            env=env, cwd=str(home), stderr=subprocess.PIPE, universal_newlines=True, check=True
+        ))
+
+    median_ms = time_call(dispatch)
+
+    profile = json.loads(results[-1].stderr.splitlines()[-1])
+    report('dispatch', count, median_ms,
+           phases={name: timing['ms'] for name, timing in profile['phases'].items()})
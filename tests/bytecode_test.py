@@ -0,0 +1,101 @@
+import importlib.util
+import os
+import threading
+from subprocess import CompletedProcess
+
+from forge import bytecode, forge
+from mock import patch
+
+from .conftest import make_plugin_venv
+
+
+def add_module(site_packages, name, source='VALUE = 1\n'):
+    path = os.path.join(site_packages, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as module_file:
+        module_file.write(source)
+    return path
+
+
+def get_site_packages(executable):
+    return bytecode.get_site_packages(os.path.dirname(os.path.dirname(executable)))
+
+
+def test_is_stale(tmp_path):
+    source = add_module(str(tmp_path), 'module.py')
+    assert bytecode.is_stale(source)
+
+    assert bytecode.compile_source(source)
+    assert not bytecode.is_stale(source)
+
+    os.utime(source, (0, 0))
+    assert bytecode.is_stale(source)
+
+
+def test_compile_source_syntax_error(tmp_path):
+    source = add_module(str(tmp_path), 'broken.py', 'def broken(:\n')
+
+    assert not bytecode.compile_source(source)
+
+
+def test_compile_venv_only_compiles_stale_sources(forge_home):
+    executable = make_plugin_venv(forge_home / 'venvs')
+    site_packages = get_site_packages(executable)
+    add_module(site_packages, os.path.join('package', '__init__.py'))
+
+    assert bytecode.compile_venv(os.path.dirname(os.path.dirname(executable))) == 2
+    assert os.path.exists(importlib.util.cache_from_source(
+        os.path.join(site_packages, 'package', '__init__.py')
+    ))
+
+    add_module(site_packages, 'added.py')
+    assert forge.compile_plugins([], force=False) == {'forge-hello': 1}
+    assert forge.compile_plugins(['forge-hello'], force=True) == {'forge-hello': 3}
+
+
+@patch('forge.bytecode.MIN_POOL_SOURCES', 2)
+def test_compile_sources_in_a_process_pool(tmp_path):
+    sources = [add_module(str(tmp_path), f'module{index}.py') for index in range(4)]
+
+    assert bytecode.compile_sources(sources, workers=2) == 4
+    assert not any(map(bytecode.is_stale, sources))
+
+
+@patch('forge.bytecode.MIN_POOL_SOURCES', 2)
+@patch('forge.bytecode.ProcessPoolExecutor')
+def test_compile_sources_serially_off_the_main_thread(mock_pool, tmp_path):
+    sources = [add_module(str(tmp_path), f'module{index}.py') for index in range(4)]
+    compiled = []
+
+    thread = threading.Thread(target=lambda: compiled.append(bytecode.compile_sources(sources)))
+    thread.start()
+    thread.join()
+
+    assert compiled == [4]
+    mock_pool.assert_not_called()
+
+
+@patch('forge.bytecode.run')
+def test_compile_venv_other_python_version(mock_run, forge_home):
+    executable = make_plugin_venv(forge_home / 'venvs', python_version='2.7.18')
+    venv_path = os.path.dirname(os.path.dirname(executable))
+    mock_run.return_value = CompletedProcess([], 0, stdout="Listing '...'\nCompiling 'a.py'...\n")
+
+    assert bytecode.compile_venv(venv_path, force=True) == 1
+    command = mock_run.call_args.args[0]
+    assert command[:4] == [bytecode.get_python_path(venv_path), '-m', 'compileall', '-j']
+    assert command[-1] == '-f'
+
+
+@patch('forge.bytecode.compile_venv')
+def test_compile_plugin_bytecode_disabled(mock_compile_venv, monkeypatch):
+    monkeypatch.setenv(bytecode.COMPILE_ENV_VAR, '0')
+
+    assert forge.compile_plugin_bytecode('forge-hello') == 0
+    mock_compile_venv.assert_not_called()
+
+
+def test_compile_plugins_skips_unknown_plugins(forge_home):
+    make_plugin_venv(forge_home / 'venvs')
+
+    assert forge.compile_plugins(['forge-missing'], force=False) == {}
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+
+import pytest
+from forge import cleanup, forge, wheelhouse
+from forge.cli import forge_cli
+from mock import patch
+
+from .conftest import make_plugin_venv
+
+CACHE_TAG = f'cpython-{sys.version_info[0]}{sys.version_info[1]}'
+OLD = time.time() - 90 * 86400
+
+
+def write_file(path, size=10, mtime=None):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), 'w') as written_file:
+        written_file.write('x' * size)
+    if mtime:
+        os.utime(str(path), (mtime, mtime))
+    return str(path)
+
+
+def test_scan_tree_finds_stale_bytecode(forge_home):
+    venv_path = os.path.dirname(os.path.dirname(make_plugin_venv(forge_home / 'venvs')))
+    cache_dir = os.path.join(venv_path, 'lib', f'python{sys.version_info[0]}.{sys.version_info[1]}',
+                             'site-packages', '__pycache__')
+    write_file(os.path.join(cache_dir, f'forge_inprocess_hello.{CACHE_TAG}.pyc'), 100)
+    removed_source = write_file(os.path.join(cache_dir, f'gone.{CACHE_TAG}.pyc'), 200)
+    other_python = write_file(os.path.join(cache_dir, 'forge_inprocess_hello.cpython-27.pyc'), 300)
+
+    scan = cleanup.scan_tree(venv_path, cleanup.get_cache_tag(venv_path))
+
+    assert sorted(scan.stale_bytecode) == sorted([(removed_source, 200), (other_python, 300)])
+    assert scan.size >= 600
+
+
+def test_plan_caches():
+    now = time.time()
+    units = [('old', 10, OLD), ('kept', 10, OLD), ('lru', 400, now - 60), ('new', 400, now)]
+
+    plan = cleanup.plan_caches(units, {'kept'}, now, max_age_days=30, max_bytes=500)
+
+    assert [(item.path, item.reason) for item in plan] == [
+        ('old', 'cache unused for over 30 days'),
+        ('lru', 'cache over 0 MB')
+    ]
+
+
+def make_leftovers(forge_home):
+    """ An orphaned venv, pipx trash, a dangling console script and caches old and new """
+    make_plugin_venv(forge_home / 'venvs')
+    orphan = forge_home / 'venvs' / 'forge-broken'
+    write_file(orphan / 'lib' / 'module.py', 1000)
+    os.utime(str(orphan), (OLD, OLD))
+    write_file(forge_home / '.trash' / 'forge-removed' / 'module.py', 500)
+    os.makedirs(str(forge_home / 'bin'))
+    os.symlink(str(forge_home / 'venvs' / 'forge-gone' / 'bin' / 'gone'), str(forge_home / 'bin' / 'gone'))
+    write_file(forge_home / 'cache' / 'index' / 'old.json', 50, mtime=OLD)
+    write_file(forge_home / 'cache' / 'wheels' / 'sources.json', 20, mtime=OLD)
+    write_file(forge_home / 'cache' / 'help' / 'new.txt', 30)
+    write_file(forge_home / 'snapshots' / 'forge-hello' / '1-0.9' / 'module.py', 40)
+    write_file(forge_home / 'snapshots' / 'forge-gone' / '1-1.0' / 'module.py', 60)
+
+
+def test_plan_cleanup(forge_home):
+    make_leftovers(forge_home)
+
+    venv_sizes, plan = forge.plan_cleanup()
+
+    assert set(venv_sizes) == {'forge-hello', 'forge-broken'}
+    assert {(item.path, item.reason) for item in plan} == {
+        (str(forge_home / 'venvs' / 'forge-broken'), 'orphaned venv without usable pipx metadata'),
+        (str(forge_home / '.trash' / 'forge-removed'), 'pipx trash'),
+        (str(forge_home / 'bin' / 'gone'), 'console script of a removed venv'),
+        (str(forge_home / 'cache' / 'index' / 'old.json'), 'cache unused for over 30 days'),
+        (str(forge_home / 'snapshots' / 'forge-gone'), 'snapshots of a removed plugin')
+    }
+
+
+def test_plan_cleanup_leaves_fresh_venvs_alone(forge_home):
+    write_file(forge_home / 'venvs' / 'forge-installing' / 'module.py')
+
+    assert forge.plan_cleanup()[1] == []
+
+
+def test_plan_cleanup_caps_the_wheelhouse_on_its_own(forge_home, monkeypatch):
+    monkeypatch.setenv(cleanup.CACHE_SIZE_ENV_VAR, '0')
+    wheel = write_file(forge_home / 'cache' / 'wheels' / 'demo-1.0-py3-none-any.whl', 100)
+    index = write_file(forge_home / 'cache' / 'index' / 'demo.json', 100)
+
+    assert [item.path for item in forge.plan_cleanup()[1]] == [index]
+
+    monkeypatch.setenv(wheelhouse.SIZE_ENV_VAR, '0')
+    assert [item.path for item in forge.plan_cleanup()[1]] == [index, wheel]
+
+
+def test_plan_cleanup_keeps_help_that_is_read(forge_home):
+    help_path = write_file(forge_home / 'cache' / 'help' / 'forge-hello' / '1.0.txt', 30, mtime=OLD)
+    os.utime(help_path, (time.time(), OLD))
+
+    assert forge.plan_cleanup()[1] == []
+
+
+@pytest.mark.parametrize('dry_run', [True, False])
+def test_cli_gc(dry_run, forge_home, capsys):
+    make_leftovers(forge_home)
+    argv = ['forge', 'gc'] + (['--dry-run'] if dry_run else [])
+
+    with patch('sys.argv', argv), pytest.raises(SystemExit):
+        forge_cli()
+
+    output = capsys.readouterr().out
+    assert ('Would reclaim' in output) == dry_run
+    assert os.path.exists(str(forge_home / 'venvs' / 'forge-broken')) == dry_run
+    assert os.path.lexists(str(forge_home / 'bin' / 'gone')) == dry_run
+    assert os.path.exists(str(forge_home / 'cache' / 'wheels' / 'sources.json'))
+    assert os.path.exists(str(forge_home / 'venvs' / 'forge-hello'))
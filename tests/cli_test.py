@@ -1,5 +1,9 @@
 import pytest
-from forge.cli import forge_cli, run_forge_plugin, inject_forge_plugins
+from forge import forge, plugin_help
+from forge.cli import forge_cli, run_forge_plugin
+from forge.package_index import UpdateCheck
+
+from .conftest import make_venv
 from mock import call, patch
 
 
@@ -19,7 +23,7 @@ def test_cli_list(mock_pipx_list):
     mock_pipx_list.assert_called_once_with()
 
 
-@patch('forge.cli.install_to_pipx')
+@patch('forge.pipx_wrapper.install_to_pipx')
 def test_cli_add(mock_pipx_install):
     mock_args = 'forge add --source some-source'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
@@ -27,7 +31,7 @@ def test_cli_add(mock_pipx_install):
     mock_pipx_install.assert_called_once_with(source='some-source', extra_args=[])
 
 
-@patch('forge.cli.install_to_pipx')
+@patch('forge.pipx_wrapper.install_to_pipx')
 def test_cli_add_with_extra_args(mock_pipx_install):
     mock_args = 'forge add -s some-source arg1 val1 arg2 val2'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
@@ -38,7 +42,46 @@ def test_cli_add_with_extra_args(mock_pipx_install):
     )
 
 
-@patch('forge.cli.update_pipx')
+@patch('forge.pipx_wrapper.run_command')
+def test_cli_add_through_wheelhouse(mock_run_command, wheelhouse_builds):
+    mock_run_command.return_value = ('installed package forge-demo,3.9\nyada\nforge-demo\n', '')
+    mock_args = 'forge add --source forge-demo'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert err.value.code == 0
+    assert [command[-1] for command in wheelhouse_builds] == ['forge-demo']
+    assert mock_run_command.call_args.args[0][:3] == ['pipx', 'install', 'forge-demo']
+    assert mock_run_command.call_args.kwargs['env']['PIP_FIND_LINKS'] == forge.get_wheelhouse_path()
+
+
+@patch('forge.manifest.install_manifest')
+def test_cli_add_manifest(mock_install_manifest, tmp_path):
+    manifest_path = tmp_path / 'plugins.json'
+    manifest_path.write_text('[]')
+    mock_args = f'forge add -m {manifest_path} -j 3 --report - arg1'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+    mock_install_manifest.assert_called_once_with(
+        path=str(manifest_path), extra_args=['arg1'], jobs=3, report_path='-'
+    )
+
+
+@pytest.mark.parametrize('mock_args', ['forge add', 'forge add -s some-source -m plugins.json'])
+@patch('forge.manifest.install_manifest')
+@patch('forge.pipx_wrapper.install_to_pipx')
+def test_cli_add_requires_one_source(mock_pipx_install, mock_install_manifest, mock_args,
+                                    tmp_path, monkeypatch):
+    (tmp_path / 'plugins.json').write_text('[]')
+    monkeypatch.chdir(tmp_path)
+    with patch('sys.argv', mock_args.split()), pytest.raises(SystemExit) as err:
+        forge_cli()
+    assert err.value.code == 2
+    mock_pipx_install.assert_not_called()
+    mock_install_manifest.assert_not_called()
+
+
+@patch('forge.pipx_wrapper.update_pipx')
 def test_cli_update(mock_pipx_update):
     mock_args = 'forge update --name plugin-name'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
@@ -46,7 +89,80 @@ def test_cli_update(mock_pipx_update):
     mock_pipx_update.assert_called_once_with(name='forge-plugin-name', extra_args=[])
 
 
-@patch('forge.cli.update_pipx')
+@patch('forge.batch.check_plugin_updates')
+@patch('forge.pipx_wrapper.update_pipx')
+def test_cli_update_skips_up_to_date_plugin(mock_pipx_update, mock_check_updates):
+    mock_check_updates.return_value = [UpdateCheck('forge-plugin-name', '1.0.0', '1.0.0')]
+    mock_args = 'forge update --name plugin-name'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+    mock_check_updates.assert_called_once_with(['forge-plugin-name'], 4)
+    mock_pipx_update.assert_not_called()
+
+
+@patch('forge.batch.check_plugin_updates')
+@patch('forge.pipx_wrapper.update_pipx')
+def test_cli_update_force_skips_check(mock_pipx_update, mock_check_updates):
+    mock_args = 'forge update --name plugin-name --force'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+    mock_check_updates.assert_not_called()
+    mock_pipx_update.assert_called_once_with(name='forge-plugin-name', extra_args=[])
+
+
+@patch('forge.pipx_wrapper.run_command')
+def test_cli_update_through_wheelhouse(mock_run_command, wheelhouse_builds):
+    make_venv(forge.PLUGIN_PATH, 'forge-demo', source='forge-demo')
+    mock_run_command.return_value = ('forge-demo updated to 2.0.0(', '')
+    mock_args = 'forge update --name demo --force'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert err.value.code == 0
+    assert [command[-1] for command in wheelhouse_builds] == ['forge-demo']
+    assert mock_run_command.call_args.args[0][:3] == ['pipx', 'upgrade', 'forge-demo']
+    assert mock_run_command.call_args.kwargs['env']['PIP_FIND_LINKS'] == forge.get_wheelhouse_path()
+
+
+@patch('forge.batch.update_plugins')
+@patch('forge.batch.tabulate', return_value='table')
+@patch('forge.batch.check_plugin_updates')
+def test_cli_update_check_only_reports(mock_check_updates, mock_tabulate, mock_update_plugins):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin3')
+    mock_check_updates.return_value = [
+        UpdateCheck('forge-plugin1', '1.0.0', '2.0.0'),
+        UpdateCheck('forge-plugin2', '1.0.0', '1.0.0'),
+        UpdateCheck('forge-plugin3', '1.0.0', None)
+    ]
+    mock_args = 'forge update --check'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+    mock_update_plugins.assert_not_called()
+    mock_tabulate.assert_called_once_with([
+        ('plugin1', '1.0.0', '2.0.0', 'update available'),
+        ('plugin2', '1.0.0', '1.0.0', 'up to date'),
+        ('plugin3', '1.0.0', 'unknown', 'unknown')
+    ], ['plugin', 'installed', 'latest', 'status'])
+
+
+@patch('forge.batch.update_plugins')
+@patch('forge.batch.check_plugin_updates')
+def test_cli_update_all_only_outdated(mock_check_updates, mock_update_plugins):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2')
+    mock_check_updates.return_value = [
+        UpdateCheck('forge-plugin1', '1.0.0', '2.0.0'),
+        UpdateCheck('forge-plugin2', '1.0.0', '1.0.0')
+    ]
+    mock_args = 'forge update'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+    mock_update_plugins.assert_called_once_with(names=['forge-plugin1'], extra_args=[], jobs=4)
+
+
+@patch('forge.pipx_wrapper.update_pipx')
 def test_cli_update_with_extra_args(mock_pipx_update):
     mock_args = 'forge update -n plugin-name arg1 val1 arg2 val2 '.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
@@ -57,9 +173,9 @@ def test_cli_update_with_extra_args(mock_pipx_update):
     )
 
 
-@patch('forge.cli.update_pipx')
+@patch('forge.batch.update_plugins')
 @patch('forge.forge.get_plugins')
-def test_cli_update_all_since_no_name_given(mock_get_plugins, mock_pipx_update):
+def test_cli_update_all_since_no_name_given(mock_get_plugins, mock_update_plugins):
     mock_get_plugins.return_value = [
         {"main_package": {"package": "forge-plugin1"}},
         {"main_package": {"package": "forge-plugin2"}}
@@ -67,29 +183,27 @@ def test_cli_update_all_since_no_name_given(mock_get_plugins, mock_pipx_update):
     mock_args = 'forge update'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
         forge_cli()
-    assert mock_pipx_update.mock_calls == [
-        call(name='forge-plugin1', extra_args=[]),
-        call(name='forge-plugin2', extra_args=[])
-    ]
+    mock_update_plugins.assert_called_once_with(
+        names=['forge-plugin1', 'forge-plugin2'], extra_args=[], jobs=4
+    )
 
 
-@patch('forge.cli.update_pipx')
+@patch('forge.batch.update_plugins')
 @patch('forge.forge.get_plugins')
-def test_cli_update_all_since_no_name_given_with_extra_args(mock_get_plugins, mock_pipx_update):
+def test_cli_update_all_since_no_name_given_with_extra_args(mock_get_plugins, mock_update_plugins):
     mock_get_plugins.return_value = [
         {"main_package": {"package": "forge-plugin1"}},
         {"main_package": {"package": "forge-plugin2"}}
     ]
-    mock_args = 'forge update arg1 val1'.split()
+    mock_args = 'forge update -j 8 arg1 val1'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
         forge_cli()
-    assert mock_pipx_update.mock_calls == [
-        call(name='forge-plugin1', extra_args=['arg1', 'val1']),
-        call(name='forge-plugin2', extra_args=['arg1', 'val1'])
-    ]
+    mock_update_plugins.assert_called_once_with(
+        names=['forge-plugin1', 'forge-plugin2'], extra_args=['arg1', 'val1'], jobs=8
+    )
 
 
-@patch('forge.cli.uninstall_from_pipx')
+@patch('forge.pipx_wrapper.uninstall_from_pipx')
 def test_cli_remove(uninstall_from_pipx):
     mock_args = 'forge remove -n plugin-name'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
@@ -97,7 +211,7 @@ def test_cli_remove(uninstall_from_pipx):
     uninstall_from_pipx.assert_called_once_with(plugin_name='forge-plugin-name', extra_args=[])
 
 
-@patch('forge.cli.uninstall_from_pipx')
+@patch('forge.pipx_wrapper.uninstall_from_pipx')
 def test_cli_remove_with_extra_args(uninstall_from_pipx):
     mock_args = 'forge remove -n plugin-name arg1 val1 arg2 val2 '.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
@@ -108,9 +222,9 @@ def test_cli_remove_with_extra_args(uninstall_from_pipx):
     )
 
 
-@patch('forge.cli.uninstall_from_pipx')
+@patch('forge.batch.uninstall_plugins')
 @patch('forge.forge.get_plugins')
-def test_cli_remove_all_since_no_name_given(mock_get_plugins, mocked_uninstall_from_pipx):
+def test_cli_remove_all_since_no_name_given(mock_get_plugins, mock_uninstall_plugins):
     mock_get_plugins.return_value = [
         {"main_package": {"package": "forge-plugin1"}},
         {"main_package": {"package": "forge-plugin2"}}
@@ -118,26 +232,24 @@ def test_cli_remove_all_since_no_name_given(mock_get_plugins, mocked_uninstall_f
     mock_args = 'forge remove'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
         forge_cli()
-    assert mocked_uninstall_from_pipx.mock_calls == [
-        call(plugin_name='forge-plugin1', extra_args=[]),
-        call(plugin_name='forge-plugin2', extra_args=[])
-    ]
+    mock_uninstall_plugins.assert_called_once_with(
+        names=['forge-plugin1', 'forge-plugin2'], extra_args=[], jobs=4
+    )
 
 
-@patch('forge.cli.uninstall_from_pipx')
+@patch('forge.batch.uninstall_plugins')
 @patch('forge.forge.get_plugins')
-def test_cli_remove_all_since_no_name_given_with_extra_args(mock_get_plugins, mocked_uninstall_from_pipx):
+def test_cli_remove_all_since_no_name_given_with_extra_args(mock_get_plugins, mock_uninstall_plugins):
     mock_get_plugins.return_value = [
         {"main_package": {"package": "forge-plugin1"}},
         {"main_package": {"package": "forge-plugin2"}}
     ]
-    mock_args = 'forge remove arg1 val1'.split()
+    mock_args = 'forge remove --jobs 2 arg1 val1'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
         forge_cli()
-    assert mocked_uninstall_from_pipx.mock_calls == [
-        call(plugin_name='forge-plugin1', extra_args=['arg1', 'val1']),
-        call(plugin_name='forge-plugin2', extra_args=['arg1', 'val1'])
-    ]
+    mock_uninstall_plugins.assert_called_once_with(
+        names=['forge-plugin1', 'forge-plugin2'], extra_args=['arg1', 'val1'], jobs=2
+    )
 
 
 @patch('click.echo')
@@ -163,25 +275,186 @@ def test_cli_help_forge_core_command(mock_echo, mock_command_names):
     assert str(mock_echo.mock_calls[0].args[0]).split('\n')[0] == 'Usage: forge add [OPTIONS] [PIPX_ARGS]...'
 
 
-@patch('forge.cli.Popen')
-@patch('click.echo')
-def test_run_forge_plugin(mock_echo, mock_popen):
-    mock_process = mock_popen.return_value
-    mock_process.returncode = 0
-    mock_process.communicate.return_value = (b'stdout', b'stderr')
+@patch('forge.forge.format_shared_savings', return_value='savings')
+@patch('forge.forge.sync_shared_layer', return_value=['click', 'six'])
+def test_cli_shared(mock_sync, mock_savings, capsys):
+    with patch('sys.argv', 'forge shared --min-plugins 3'.split()), pytest.raises(SystemExit):
+        forge_cli()
+
+    mock_sync.assert_called_once_with(3)
+    assert capsys.readouterr().out == 'Added 2 package(s) to the shared layer\nsavings\n'
+
+
+@patch('forge.forge.format_shared_savings', return_value='savings')
+@patch('forge.forge.sync_shared_layer')
+def test_cli_shared_report(mock_sync, mock_savings, capsys):
+    with patch('sys.argv', 'forge shared --report'.split()), pytest.raises(SystemExit):
+        forge_cli()
+
+    mock_sync.assert_not_called()
+    assert capsys.readouterr().out == 'savings\n'
+
 
-    with pytest.raises(SystemExit):
-        run_forge_plugin(['ls'])
-    assert mock_echo.mock_calls == [call('stdout'), call('stderr')]
+@patch('forge.forge.compile_plugins', return_value={'forge-plugin': 3})
+def test_cli_compile(mock_compile, capsys):
+    with patch('sys.argv', 'forge compile -n plugin --force'.split()), pytest.raises(SystemExit):
+        forge_cli()
+
+    mock_compile.assert_called_once_with(['forge-plugin'], force=True)
+    assert capsys.readouterr().out == 'Compiled 3 file(s) in 1 plugin(s)\n'
 
 
-@patch('forge.forge.get_forge_plugin_command_names', return_value=['plugin1'])
+@patch('forge.forge.compile_plugins', return_value={})
+def test_cli_compile_unknown_plugin(mock_compile, capsys):
+    with patch('sys.argv', 'forge compile -n missing'.split()), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    mock_compile.assert_called_once_with(['forge-missing'], force=False)
+    assert err.value.code == 1
+    assert 'No plugin named forge-missing is installed' in capsys.readouterr().err
+
+
+@patch('forge.forge.diagnose_plugins', return_value={'forge-a': [], 'forge-b': ['broken']})
+def test_cli_doctor(mock_diagnose, capsys):
+    with patch('sys.argv', 'forge doctor --refresh'.split()), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    mock_diagnose.assert_called_once_with(True)
+    assert err.value.code == 1
+    output = capsys.readouterr()
+    assert output.out == '[forge-a] ok\n[forge-b] broken\n'
+    assert '1 plugin(s) need attention' in output.err
+
+
+@patch('forge.dispatch.run_plugin')
+def test_run_forge_plugin(mock_run_plugin):
+    run_forge_plugin(['ls'])
+    mock_run_plugin.assert_called_once_with(['ls'], zygote_path=forge.get_zygote_socket_path('ls'),
+                                            stats_path=forge.get_stats_path())
+
+
+@patch('forge.forge.get_forge_plugin_command_names')
 @patch('forge.cli.run_forge_plugin')
 def test_cli_help_forge_plugin_command(mock_run_forge_plugin, mock_command_names):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'])
 
     mock_args = 'forge plugin1 -h'.split()
     with patch('sys.argv', mock_args), pytest.raises(SystemExit):
-        inject_forge_plugins()
         forge_cli()
 
     mock_run_forge_plugin.assert_called_once_with(['plugin1', '-h'])
+    mock_command_names.assert_not_called()
+
+
+@patch('forge.plugin_help.capture_help')
+@patch('forge.cli.run_forge_plugin')
+def test_cli_help_forge_plugin_command_from_cache(mock_run_forge_plugin, mock_capture_help, capsys):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'], package_version='1.0.0')
+    plugin_help.write_help(forge.get_help_cache_dir(), 'forge-plugin1', '1.0.0', 'usage: plugin1\n')
+
+    with patch('sys.argv', 'forge plugin1 -h'.split()), pytest.raises(SystemExit):
+        forge_cli()
+
+    assert capsys.readouterr().out == 'usage: plugin1\n'
+    mock_run_forge_plugin.assert_not_called()
+    mock_capture_help.assert_not_called()
+
+
+@patch('forge.plugin_help.capture_help', return_value='usage: plugin1\n')
+@patch('forge.cli.run_forge_plugin')
+def test_cli_help_forge_plugin_command_captures_once(mock_run_forge_plugin, mock_capture_help):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'], package_version='1.0.0')
+
+    for _ in range(2):
+        with patch('sys.argv', 'forge plugin1 -h'.split()), pytest.raises(SystemExit):
+            forge_cli()
+
+    mock_capture_help.assert_called_once_with(['plugin1', '-h'])
+    mock_run_forge_plugin.assert_not_called()
+    assert plugin_help.read_help(forge.get_help_cache_dir(), 'forge-plugin1', '1.0.0') == \
+        'usage: plugin1\n'
+
+
+@patch('forge.plugin_help.capture_help')
+def test_cli_help_all(mock_capture_help, capsys):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'], package_version='1.0.0')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2', apps=['plugin2'], package_version='2.0.0')
+    plugin_help.write_help(forge.get_help_cache_dir(), 'forge-plugin1', '1.0.0', 'usage: plugin1\n')
+
+    with patch('sys.argv', 'forge help --all'.split()), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert str(err.value) == '0'
+    assert capsys.readouterr().out == (
+        'plugin1 (1.0.0)\n===============\nusage: plugin1\n\n'
+        '\nplugin2 (2.0.0)\n===============\nNo cached help yet, run forge plugin2 -h\n'
+    )
+    mock_capture_help.assert_not_called()
+
+
+@patch('forge.plugin_help.capture_help', return_value=None)
+def test_cli_help_plugin_unavailable(mock_capture_help):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'])
+
+    with patch('sys.argv', 'forge help plugin1'.split()), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert str(err.value) == '1'
+
+
+@patch('forge.forge.get_forge_plugin_command_names')
+@patch('forge.cli.run_forge_plugin')
+def test_cli_dispatch_plugin_looks_up_only_that_plugin(mock_run_forge_plugin, mock_command_names):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'])
+    forge.get_plugins()
+
+    mock_args = 'forge plugin1 arg1 --flag'.split()
+    with patch('sys.argv', mock_args), patch('forge.forge.get_plugins') as mock_get_plugins, \
+            pytest.raises(SystemExit):
+        forge_cli()
+
+    mock_run_forge_plugin.assert_called_once_with(['plugin1', 'arg1', '--flag'])
+    mock_get_plugins.assert_not_called()
+    mock_command_names.assert_not_called()
+
+
+@patch('forge.forge.find_plugin', return_value=None)
+def test_cli_unknown_command(mock_find_plugin):
+    mock_args = 'forge unknown'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert err.value.code == 2
+
+
+@patch('forge.forge.get_forge_plugin_command_names', return_value=['plugin1', 'plugin2'])
+@patch('forge.forge.find_plugin')
+@patch('click.echo')
+def test_cli_help_lists_plugins_with_one_lookup(mock_echo, mock_find_plugin, mock_command_names):
+    mock_args = 'forge -h'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+
+    help_text = str(mock_echo.mock_calls[0].args[0])
+    assert '  plugin1' in help_text and '  plugin2' in help_text and '  add' in help_text
+    mock_command_names.assert_called_once_with()
+    mock_find_plugin.assert_not_called()
+
+
+@patch('forge.forge.reindex_plugins', return_value=2)
+@patch('click.echo')
+def test_cli_reindex(mock_echo, mock_reindex):
+    mock_args = 'forge reindex'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+    mock_reindex.assert_called_once_with()
+    mock_echo.assert_called_once_with('Indexed 2 forge plugin(s)')
+
+
+@patch('forge.cli.get_version', return_value='1.2.3')
+@patch('click.echo')
+def test_cli_version(mock_echo, mock_get_version):
+    mock_args = 'forge --version'.split()
+    with patch('sys.argv', mock_args), pytest.raises(SystemExit):
+        forge_cli()
+    mock_echo.assert_called_once_with('forge, version 1.2.3')
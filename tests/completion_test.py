@@ -0,0 +1,90 @@
+import subprocess
+import sys
+
+import forge as forge_main
+import pytest
+from forge import completion, forge
+from forge.cli import forge_cli
+from mock import patch
+
+from .conftest import make_venv
+
+
+def test_builtin_commands_match_cli():
+    assert set(completion.BUILTIN_COMMANDS) == set(forge_cli.commands)
+
+
+def test_write_and_read_cache(tmp_path):
+    cache_path = str(tmp_path / 'completion.txt')
+
+    completion.write_cache(cache_path, ['zeta', 'alpha'])
+
+    assert completion.read_cache(cache_path) == [
+        'add', 'alpha', 'compile', 'completion', 'daemon', 'doctor', 'gc', 'help', 'list',
+        'reindex', 'remove', 'rollback', 'serve', 'shared', 'stats', 'update', 'zeta',
+        '--help', '--profile', '--version', '-h'
+    ]
+
+
+def test_read_cache_missing(tmp_path):
+    assert completion.read_cache(str(tmp_path / 'missing.txt')) is None
+
+
+def test_filter_names():
+    names = ['add', 'alpha', 'list', '--help']
+
+    assert completion.filter_names(names, ['a']) == ['add', 'alpha']
+    assert completion.filter_names(names, []) == names
+
+
+def test_make_script_reads_cache_file():
+    for shell in completion.SHELLS:
+        script = completion.make_script(shell, '/home/user/.forge/completion.txt')
+        assert '/home/user/.forge/completion.txt' in script
+        assert f'{completion.COMPLETE_ENV_VAR}={shell} forge' in script
+
+
+def test_get_completion_names_builds_missing_cache(forge_home):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+
+    assert 'plugin1' in forge.get_completion_names()
+    assert (forge_home / 'completion.txt').exists()
+
+
+def test_update_plugin_index_refreshes_cache():
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+
+    forge.update_plugin_index('forge-plugin1')
+
+    assert 'plugin1' in completion.read_cache(forge.get_completion_cache_path())
+
+
+@patch('forge.cli.forge_cli')
+def test_main_answers_completion_without_cli(mock_cli, monkeypatch, capsys):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+    monkeypatch.setenv(completion.COMPLETE_ENV_VAR, 'bash')
+    monkeypatch.setattr(sys, 'argv', ['forge', 'pl'])
+
+    forge_main.main()
+
+    assert capsys.readouterr().out == 'plugin1\n'
+    mock_cli.assert_not_called()
+
+
+def test_completion_command(capsys):
+    with patch('sys.argv', ['forge', 'completion', 'zsh']), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert str(err.value) == '0'
+    assert forge.get_completion_cache_path() in capsys.readouterr().out
+
+
+def test_completion_skips_click_import(tmp_path):
+    code = ('import sys, forge; sys.argv = ["forge"]; forge.main(); '
+            'print("click" in sys.modules)')
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, universal_newlines=True,
+        env={'HOME': str(tmp_path), completion.COMPLETE_ENV_VAR: 'bash'}, check=True
+    )
+
+    assert result.stdout.splitlines()[-1] == 'False'
@@ -1,3 +1,10 @@
+import json
+import os
+import sys
+from subprocess import CompletedProcess
+
+import pytest
+from forge import forge, wheelhouse
 from mock import mock_open
 
 # Credit to: https://gist.github.com/adammartinez271828/137ae25d0b817da2509c1a96ba37fc56
@@ -17,3 +24,80 @@ def multi_mock_open(*file_contents):
     mock_opener.side_effect = mock_files
 
     return mock_opener
+
+
+def make_venv(plugin_path, package, apps=None, package_version='1.0.0', source=None,
+              pip_args=None):
+    """Create a fake pipx venv holding only its pipx_metadata.json
+    Returns:
+        (str) path of the created venv
+    """
+    venv_path = os.path.join(str(plugin_path), package)
+    os.makedirs(venv_path, exist_ok=True)
+    metadata = {'main_package': {
+        'package': package,
+        'apps': apps if apps is not None else [package.replace('forge-', '', 1)],
+        'package_version': package_version
+    }}
+    if source:
+        metadata['main_package']['package_or_url'] = source
+    if pip_args:
+        metadata['main_package']['pip_args'] = pip_args
+    with open(os.path.join(venv_path, 'pipx_metadata.json'), 'w') as metadata_file:
+        metadata_file.write(json.dumps(metadata))
+    return venv_path
+
+
+def make_plugin_venv(plugin_path, entry_points='', python_version=None):
+    """ Fake plugin venv with a pyvenv.cfg, a module and its dist-info entry points """
+    venv_path = make_venv(plugin_path, 'forge-hello', apps=['hello'])
+    version = python_version or '.'.join(map(str, sys.version_info[:3]))
+    with open(os.path.join(venv_path, 'pyvenv.cfg'), 'w') as config_file:
+        config_file.write(f'home = /usr/bin\nversion = {version}\n')
+
+    python = 'python' + '.'.join(version.split('.')[:2])
+    site_packages = os.path.join(venv_path, 'lib', python, 'site-packages')
+    dist_info = os.path.join(site_packages, 'forge_hello-1.0.dist-info')
+    os.makedirs(dist_info)
+    with open(os.path.join(site_packages, 'forge_inprocess_hello.py'), 'w') as module_file:
+        module_file.write('import sys\n\ndef main():\n    print("hello", *sys.argv[1:])\n    return 3\n')
+    with open(os.path.join(dist_info, 'entry_points.txt'), 'w') as entry_points_file:
+        entry_points_file.write('[console_scripts]\nhello = forge_inprocess_hello:main\n' + entry_points)
+    return os.path.join(venv_path, 'bin', 'hello')
+
+
+@pytest.fixture(autouse=True)
+def forge_home(tmp_path, monkeypatch):
+    """Point forge at a temporary home so tests never touch the real ~/.forge"""
+    forge_path = tmp_path / '.forge'
+    plugin_path = forge_path / 'venvs'
+    plugin_path.mkdir(parents=True)
+    monkeypatch.setattr(forge, 'FORGE_PATH', str(forge_path))
+    monkeypatch.setattr(forge, 'PLUGIN_PATH', str(plugin_path))
+    monkeypatch.setenv('FORGE_INDEX_URL', (tmp_path / 'simple').as_uri())
+    monkeypatch.setenv('FORGE_WHEELHOUSE', '0')
+    monkeypatch.delenv('PIPX_BIN_DIR', raising=False)
+    return forge_path
+
+
+@pytest.fixture
+def wheelhouse_builds(forge_home, monkeypatch):
+    """Turn the wheelhouse back on, with pip wheel faked to build one wheel per requirement
+    Returns:
+        (list) the pip wheel commands run
+    """
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        wheel_dir = command[command.index('--wheel-dir') + 1]
+        wheel_path = os.path.join(
+            wheel_dir, f'{forge.get_lock_name(command[-1]).replace("-", "_")}-1.0-py3-none-any.whl'
+        )
+        with open(wheel_path, 'w') as wheel_file:
+            wheel_file.write('wheel')
+        return CompletedProcess(command, 0, stdout=f'Saved {wheel_path}\n')
+
+    monkeypatch.delenv('FORGE_WHEELHOUSE')
+    monkeypatch.setattr(wheelhouse, 'run', run)
+    return commands
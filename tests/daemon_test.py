@@ -0,0 +1,136 @@
+import os
+import threading
+
+import pytest
+from forge import daemon, forge
+from forge.exceptions import PluginManagementWarnException
+from mock import patch
+
+from .conftest import make_venv
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='needs Unix domain sockets')
+
+
+@pytest.fixture
+def running_daemon(tmp_path):
+    """ A daemon serving from a short socket path, stopped after the test """
+    socket_path = str(tmp_path / 'd.sock')
+    state = daemon.DaemonState(lambda: 'Usage: forge\n')
+    server = daemon.make_server(socket_path, state)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with patch('forge.forge.get_daemon_socket_path', return_value=socket_path):
+        yield socket_path, state
+    server.shutdown()
+    server.server_close()
+    thread.join(5)
+
+
+@pytest.mark.parametrize('args, request_body', [
+    ([], {'op': 'list'}),
+    (['list'], {'op': 'list'}),
+    (['-h'], {'op': 'help'}),
+    (['hello', 'world'], {'op': 'resolve', 'name': 'hello'}),
+    (['add', '-s', 'forge-hello'], None),
+    (['hello', '--help'], None),
+    (['--version'], None)
+])
+def test_make_request(args, request_body):
+    assert daemon.make_request(args) == request_body
+
+
+def test_send_request_without_daemon(tmp_path):
+    assert daemon.send_request(str(tmp_path / 'd.sock'), {'op': 'ping'}) is None
+
+
+def test_send_request_stale_socket(tmp_path):
+    socket_path = tmp_path / 'd.sock'
+    socket_path.write_text('')
+
+    assert daemon.send_request(str(socket_path), {'op': 'ping'}) is None
+
+
+def test_run_client_without_daemon():
+    assert daemon.run_client(['hello']) is False
+
+
+def test_resolve(running_daemon):
+    socket_path, _ = running_daemon
+    make_venv(forge.PLUGIN_PATH, 'forge-hello', apps=['hello'])
+
+    response = daemon.send_request(socket_path, {'op': 'resolve', 'name': 'hello'})
+
+    assert response['ok'] is True
+    assert response['plugin']['main_package']['package'] == 'forge-hello'
+    assert daemon.send_request(socket_path, {'op': 'resolve', 'name': 'missing'})['ok'] is False
+
+
+def test_lookups_are_cached_until_invalidated(running_daemon):
+    socket_path, state = running_daemon
+    make_venv(forge.PLUGIN_PATH, 'forge-hello', apps=['hello'])
+    daemon.send_request(socket_path, {'op': 'ping'})
+
+    make_venv(forge.PLUGIN_PATH, 'forge-other', apps=['other'])
+    with patch('forge.forge.get_plugins') as mocked_get_plugins:
+        assert daemon.send_request(socket_path, {'op': 'resolve', 'name': 'other'})['ok'] is False
+    mocked_get_plugins.assert_not_called()
+
+    state.invalidate()
+    assert daemon.send_request(socket_path, {'op': 'resolve', 'name': 'other'})['ok'] is True
+
+
+@patch('forge.dispatch.run_plugin', side_effect=SystemExit(0))
+def test_run_client_dispatches_plugin(mocked_run_plugin, running_daemon):
+    make_venv(forge.PLUGIN_PATH, 'forge-hello', apps=['hello'])
+
+    with pytest.raises(SystemExit):
+        daemon.run_client(['hello', 'world'])
+
+    mocked_run_plugin.assert_called_once_with(
+        ['hello', 'world'], zygote_path=forge.get_zygote_socket_path('hello'),
+        stats_path=forge.get_stats_path()
+    )
+
+
+def test_run_client_prints_list_and_help(running_daemon, capsys):
+    make_venv(forge.PLUGIN_PATH, 'forge-hello', apps=['hello'], package_version='1.2.3')
+
+    assert daemon.run_client(['list']) is True
+    assert daemon.run_client(['--help']) is True
+
+    output = capsys.readouterr().out
+    assert 'hello' in output and '1.2.3' in output
+    assert output.endswith('Usage: forge\n')
+
+
+def test_run_client_falls_back_for_empty_list(running_daemon):
+    assert daemon.run_client([]) is False
+
+
+def test_run_client_disabled(running_daemon, monkeypatch):
+    make_venv(forge.PLUGIN_PATH, 'forge-hello', apps=['hello'])
+    monkeypatch.setenv(daemon.DAEMON_ENV_VAR, '0')
+
+    assert daemon.run_client(['list']) is False
+
+
+def test_make_server_already_running(running_daemon):
+    socket_path, _ = running_daemon
+
+    with pytest.raises(PluginManagementWarnException):
+        daemon.make_server(socket_path, daemon.DaemonState(lambda: ''))
+
+
+def test_make_server_socket_is_private(tmp_path):
+    socket_path = str(tmp_path / 'd.sock')
+    server = daemon.make_server(socket_path, daemon.DaemonState(lambda: ''))
+    try:
+        assert os.stat(socket_path).st_mode & 0o077 == 0
+    finally:
+        server.server_close()
+
+
+def test_stop(running_daemon):
+    socket_path, _ = running_daemon
+
+    assert daemon.send_request(socket_path, {'op': 'stop'})['ok'] is True
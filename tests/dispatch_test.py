@@ -0,0 +1,176 @@
+import os
+
+import pytest
+from forge import dispatch
+from mock import patch
+
+
+@pytest.mark.parametrize('env_mode,os_name,expected_mode', [
+    (None, 'posix', dispatch.EXEC_MODE),
+    ('exec', 'posix', dispatch.EXEC_MODE),
+    ('EXEC', 'posix', dispatch.EXEC_MODE),
+    ('spawn', 'posix', dispatch.SPAWN_MODE),
+    (None, 'nt', dispatch.SPAWN_MODE),
+    ('exec', 'nt', dispatch.SPAWN_MODE),
+    ('inprocess', 'posix', dispatch.INPROCESS_MODE),
+    ('inprocess', 'nt', dispatch.INPROCESS_MODE)
+])
+def test_get_dispatch_mode(monkeypatch, env_mode, os_name, expected_mode):
+    if env_mode is None:
+        monkeypatch.delenv(dispatch.DISPATCH_ENV_VAR, raising=False)
+    else:
+        monkeypatch.setenv(dispatch.DISPATCH_ENV_VAR, env_mode)
+
+    with patch('os.name', os_name):
+        assert dispatch.get_dispatch_mode() == expected_mode
+
+
+@patch('forge.dispatch.get_dispatch_mode', return_value=dispatch.EXEC_MODE)
+@patch('os.execvp')
+def test_run_plugin_exec(mock_execvp, mock_mode):
+    mock_execvp.side_effect = SystemExit(0)
+
+    with pytest.raises(SystemExit):
+        dispatch.run_plugin(['plugin1', 'arg1'])
+
+    mock_execvp.assert_called_once_with('plugin1', ['plugin1', 'arg1'])
+
+
+@patch('forge.dispatch.get_dispatch_mode', return_value=dispatch.EXEC_MODE)
+@patch('forge.dispatch.Popen')
+@patch('os.execvp', side_effect=OSError('exec format error'))
+def test_run_plugin_exec_failure_falls_back_to_spawn(mock_execvp, mock_popen, mock_mode):
+    mock_popen.return_value.returncode = 3
+
+    with pytest.raises(SystemExit) as err:
+        dispatch.run_plugin(['plugin1'])
+
+    mock_popen.assert_called_once_with(['plugin1'])
+    assert err.value.code == 3
+
+
+@patch('forge.dispatch.get_dispatch_mode', return_value=dispatch.SPAWN_MODE)
+@patch('forge.dispatch.Popen')
+@patch('os.execvp')
+def test_run_plugin_spawn(mock_execvp, mock_popen, mock_mode):
+    mock_popen.return_value.returncode = 0
+
+    with pytest.raises(SystemExit) as err:
+        dispatch.run_plugin(['plugin1', 'arg1'])
+
+    mock_execvp.assert_not_called()
+    mock_popen.assert_called_once_with(['plugin1', 'arg1'])
+    assert err.value.code == 0
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='exec dispatch is POSIX only')
+def test_run_plugin_exec_replaces_process(tmp_path):
+    pid_file = tmp_path / 'pid'
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.environ[dispatch.DISPATCH_ENV_VAR] = dispatch.EXEC_MODE
+            dispatch.run_plugin(['sh', '-c', f'echo $$ > {pid_file}; exit 7'])
+        finally:
+            os._exit(99)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 7
+    assert int(pid_file.read_text()) == pid
+
+
+@patch('forge.dispatch.get_dispatch_mode', return_value=dispatch.EXEC_MODE)
+@patch('os.execv', side_effect=SystemExit(0))
+def test_run_plugin_exec_executable(mock_execv, mock_mode):
+    with pytest.raises(SystemExit):
+        dispatch.run_plugin(['plugin1', 'arg1'], '/venvs/forge-plugin1/bin/plugin1')
+
+    mock_execv.assert_called_once_with('/venvs/forge-plugin1/bin/plugin1', ['plugin1', 'arg1'])
+
+
+@patch('forge.dispatch.get_dispatch_mode', return_value=dispatch.INPROCESS_MODE)
+@patch('forge.inprocess.run_plugin')
+@patch('os.execv', side_effect=SystemExit(0))
+def test_run_plugin_inprocess_falls_back_to_exec(mock_execv, mock_inprocess, mock_mode):
+    with pytest.raises(SystemExit):
+        dispatch.run_plugin(['plugin1'], '/venvs/forge-plugin1/bin/plugin1')
+
+    mock_inprocess.assert_called_once_with(['plugin1'], '/venvs/forge-plugin1/bin/plugin1')
+    if os.name == 'posix':
+        mock_execv.assert_called_once_with('/venvs/forge-plugin1/bin/plugin1', ['plugin1'])
+
+
+@pytest.mark.parametrize('stats_enabled', ['1', '0'])
+@patch('forge.dispatch.start_plugin')
+def test_run_plugin_starts_the_plugin_once(mock_start_plugin, stats_enabled, tmp_path, monkeypatch):
+    monkeypatch.setenv('FORGE_STATS', stats_enabled)
+
+    dispatch.run_plugin(['plugin1'], stats_path=str(tmp_path / 'stats.jsonl'))
+
+    assert mock_start_plugin.call_count == 1
+
+
+@pytest.mark.parametrize('args, expected', [
+    (['plugin1'], True),
+    (['plugin1', 'arg1', '--flag'], True),
+    ([], False),
+    (['--version'], False),
+    (['update', '-n', 'plugin1'], False),
+    (['plugin1', '-h'], False)
+])
+def test_is_plugin_invocation(args, expected):
+    assert dispatch.is_plugin_invocation(args) is expected
+
+
+@pytest.fixture
+def dispatch_table(tmp_path):
+    plugin_path = tmp_path / 'venvs'
+    executable = plugin_path / 'forge-plugin1' / 'bin' / 'plugin1'
+    executable.parent.mkdir(parents=True)
+    executable.write_text('#!/bin/sh\n')
+    executable.chmod(0o755)
+    (plugin_path / 'forge-plugin1' / 'pipx_metadata.json').write_text('{}')
+    table_path = str(tmp_path / dispatch.DISPATCH_TABLE_FILE_NAME)
+    dispatch.write_table(table_path, str(plugin_path), {'plugin1': str(executable)},
+                         {'plugin1': '1.2.0'})
+    return table_path, str(plugin_path), str(executable)
+
+
+def test_lookup_executable(dispatch_table):
+    table_path, plugin_path, executable = dispatch_table
+
+    assert dispatch.lookup_executable(table_path, plugin_path, 'plugin1') == executable
+    assert dispatch.lookup_executable(table_path, plugin_path, 'plugin2') is None
+    assert dispatch.lookup_version(table_path, 'plugin1') == '1.2.0'
+    assert dispatch.lookup_version(table_path, 'plugin2') == ''
+
+
+def test_lookup_executable_stale_after_venvs_change(dispatch_table):
+    table_path, plugin_path, _ = dispatch_table
+    stat = os.stat(plugin_path)
+    os.utime(plugin_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+    assert not dispatch.is_table_current(dispatch.load_table(table_path), plugin_path)
+    assert dispatch.lookup_executable(table_path, plugin_path, 'plugin1') is None
+
+
+def test_lookup_executable_stale_after_upgrade_outside_forge(dispatch_table):
+    table_path, plugin_path, executable = dispatch_table
+    metadata_path = os.path.join(os.path.dirname(os.path.dirname(executable)), 'pipx_metadata.json')
+    stat = os.stat(metadata_path)
+    os.utime(metadata_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+    assert dispatch.is_table_current(dispatch.load_table(table_path), plugin_path, ['plugin2'])
+    assert not dispatch.is_table_current(dispatch.load_table(table_path), plugin_path)
+    assert dispatch.lookup_executable(table_path, plugin_path, 'plugin1') is None
+
+
+def test_lookup_executable_missing_file(dispatch_table):
+    table_path, plugin_path, executable = dispatch_table
+    os.remove(executable)
+
+    assert dispatch.lookup_executable(table_path, plugin_path, 'plugin1') is None
+
+
+def test_lookup_executable_missing_table(tmp_path):
+    assert dispatch.lookup_executable(str(tmp_path / 'missing.json'), str(tmp_path), 'plugin1') is None
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+from forge import doctor, forge
+from mock import patch
+
+from .conftest import make_venv
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='checks POSIX venv layouts')
+
+
+def make_healthy_venv(forge_home, package='forge-hello', app='hello'):
+    """ Plugin venv with an interpreter link, a console script linked into the bin dir and metadata """
+    venv_path = make_venv(forge_home / 'venvs', package, apps=[app], package_version='1.0')
+    os.makedirs(os.path.join(venv_path, 'bin'))
+    os.symlink(sys.executable, os.path.join(venv_path, 'bin', 'python'))
+    with open(os.path.join(venv_path, 'bin', app), 'w') as script_file:
+        script_file.write('#!/bin/sh\n')
+    os.makedirs(os.path.join(venv_path, 'lib', 'python3.9', 'site-packages',
+                             f'{package.replace("-", "_")}-1.0.dist-info'))
+    os.makedirs(forge_home / 'bin', exist_ok=True)
+    os.symlink(os.path.join(venv_path, 'bin', app), forge_home / 'bin' / app)
+    return venv_path
+
+
+def test_diagnose_healthy_plugin(forge_home):
+    make_healthy_venv(forge_home)
+
+    assert forge.diagnose_plugins() == {'forge-hello': []}
+    assert doctor.format_report({'forge-hello': []}) == '[forge-hello] ok\n'
+
+
+def test_diagnose_broken_interpreter_and_scripts(forge_home):
+    venv_path = make_healthy_venv(forge_home)
+    os.remove(os.path.join(venv_path, 'bin', 'python'))
+    os.symlink('/nonexistent/python3.9', os.path.join(venv_path, 'bin', 'python'))
+    os.remove(os.path.join(venv_path, 'bin', 'hello'))
+
+    problems = forge.diagnose_plugins()['forge-hello']
+
+    assert problems == [
+        f'interpreter {venv_path}/bin/python links to missing /nonexistent/python3.9',
+        'console script hello is missing from the venv',
+        f'console script hello is a broken link in {forge_home / "bin"}'
+    ]
+
+
+def test_diagnose_package_metadata(forge_home):
+    make_venv(forge_home / 'venvs', 'forge-hello', apps=[], package_version='2.0')
+    venv_path = make_healthy_venv(forge_home, package='forge-other', app='other')
+    os.rename(os.path.join(venv_path, 'lib', 'python3.9', 'site-packages', 'forge_other-1.0.dist-info'),
+              os.path.join(venv_path, 'lib', 'python3.9', 'site-packages', 'forge_other-0.9.dist-info'))
+
+    problems = forge.diagnose_plugins()
+
+    assert 'package forge-hello has no installed metadata' in problems['forge-hello']
+    assert problems['forge-other'] == [
+        'package forge-other is installed at 0.9, pipx metadata says 1.0'
+    ]
+
+
+def test_diagnose_orphaned_and_duplicated(forge_home):
+    make_healthy_venv(forge_home)
+    make_venv(forge_home / 'venvs', 'forge-hello2', apps=['hello'], package_version='1.0')
+    os.makedirs(forge_home / 'venvs' / 'forge-broken')
+    make_healthy_venv(forge_home, package='forge-gone', app='gone')
+    os.rename(forge_home / 'venvs' / 'forge-gone', forge_home / 'elsewhere')
+
+    problems = forge.diagnose_plugins()
+
+    assert problems['forge-broken'][0].startswith('orphaned venv: ')
+    assert problems['forge-hello'] == []
+    assert 'duplicate of forge-hello, both provide hello' in problems['forge-hello2']
+    assert problems['gone'] == [
+        f'orphaned console script in {forge_home / "bin"}, its venv is gone'
+    ]
+
+
+@patch('forge.doctor.check_venv', return_value=[])
+def test_check_venvs_uses_cached_results(mock_check_venv, forge_home):
+    venv_path = make_healthy_venv(forge_home)
+
+    forge.diagnose_plugins()
+    forge.diagnose_plugins()
+    assert mock_check_venv.call_count == 1
+
+    os.remove(os.path.join(venv_path, 'bin', 'hello'))
+    forge.diagnose_plugins()
+    assert mock_check_venv.call_count == 2
+
+    forge.diagnose_plugins(refresh=True)
+    assert mock_check_venv.call_count == 3
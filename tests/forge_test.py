@@ -1,57 +1,12 @@
 import os
 
 import pytest
-from forge import forge
+from forge import dispatch, forge, storage
 from forge.exceptions import (PluginManagementFatalException,
                               PluginManagementWarnException)
-from mock import call, mock_open, patch
+from mock import call, patch
 
-from .conftest import multi_mock_open
-
-
-@patch('os.listdir', return_value=['plugin1', 'plugin2'])
-def test_get_plugin_paths(mocked_listdir):
-
-    forge.PLUGIN_PATH = os.path.join('home', 'user', '.forge', 'venvs')
-
-    expected_paths = [
-        'home|user|.forge|venvs|plugin1',
-        'home|user|.forge|venvs|plugin2'
-    ]
-
-    plugin_paths = forge.get_plugin_paths()
-
-    normalized_plugin_paths = [path.replace(os.path.sep, '|') for path in plugin_paths]
-
-    assert normalized_plugin_paths == expected_paths
-
-
-def test_get_pipx_config():
-
-    fake_config_json = '{"a":"something", "b":"another"}'
-
-    with patch("builtins.open", mock_open(read_data=fake_config_json)):
-        config_data = forge.get_pipx_config('some_path')
-
-    assert config_data == {'a': 'something', 'b': 'another'}
-
-
-def test_get_pipx_config_bad_json_data():
-    fake_config_json = '{"a":no quote heres, or here:"another"}'
-
-    with pytest.raises(forge.PluginManagementFatalException) as err:
-        with patch("builtins.open", mock_open(read_data=fake_config_json)):
-            forge.get_pipx_config('some_path')
-
-    assert str(err.value) == 'Problem reading json file expected at some_path'
-
-
-def test_get_pipx_config_no_data():
-    with pytest.raises(forge.PluginManagementFatalException) as err:
-        with patch("builtins.open", mock_open(read_data='')):
-            forge.get_pipx_config('some_path')
-
-    assert str(err.value) == 'Problem reading json file expected at some_path'
+from .conftest import make_venv
 
 
 def test_filer_forge_plugins():
@@ -85,41 +40,118 @@ def test_get_command_from_config():
     assert forge.get_command_from_config(mock_plugin_config) == 'plugin-name'
 
 
-@patch('os.listdir', return_value=['forge-plugin1', 'forge-plugin2', 'non_plugin'])
-def test_get_plugins(mocked_listdir):
-    forge.PLUGIN_PATH = os.path.join('home', 'user', '.forge', 'venvs')
-
-    fake_config_jsons = [
-        '{"main_package": {"package": "forge-plugin1"}}',
-        '{"main_package": {"package": "forge-plugin2"}}',
-        '{"main_package": {"package": "non_plugin"}}'
-    ]
+def test_get_plugins(forge_home):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=[], package_version='')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2', apps=[], package_version='')
+    make_venv(forge.PLUGIN_PATH, 'non_plugin', apps=[], package_version='')
 
-    with patch("builtins.open", multi_mock_open(*fake_config_jsons)):
-        filtered_plugin_configs = forge.get_plugins()
+    filtered_plugin_configs = forge.get_plugins()
 
     expected_plugin_configs = [
-        {'main_package': {'package': 'forge-plugin1'}},
-        {'main_package': {'package': 'forge-plugin2'}}
+        {'main_package': {'package': 'forge-plugin1', 'package_or_url': 'forge-plugin1',
+                          'pip_args': [], 'apps': [], 'package_version': ''}},
+        {'main_package': {'package': 'forge-plugin2', 'package_or_url': 'forge-plugin2',
+                          'pip_args': [], 'apps': [], 'package_version': ''}}
     ]
 
     assert filtered_plugin_configs == expected_plugin_configs
+    assert (forge_home / 'registry.json').is_file()
 
 
-@patch('forge.forge.Halo')
-@patch('forge.forge.tabulate')
-@patch('os.listdir', return_value=['forge-plugin1', 'forge-plugin2', 'non_plugin'])
-def test_list_plugins(mocked_listdir, mocked_tabulate, mocked_spinner):
-    forge.PLUGIN_PATH = os.path.join('home', 'user', '.forge', 'venvs')
+@patch('halo.Halo')
+def test_get_plugins_bad_json_data(mocked_spinner):
+    venv_path = make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2')
+    with open(os.path.join(venv_path, 'pipx_metadata.json'), 'w') as metadata_file:
+        metadata_file.write('{"main_package":')
 
-    fake_config_jsons = [
-        '{"main_package": {"package": "forge-plugin1", "apps": ["plugin1.exe"], "package_version":"1.0.0"}}',
-        '{"main_package": {"package": "forge-plugin2", "apps": ["plugin2"], "package_version":"0.0.1"}}',
-        '{"main_package": {"package": "non_plugin", "apps": ["non_plugin.exe"], "package_version":"0.0.2"}}'
-    ]
+    plugin_configs = forge.get_plugins()
+
+    assert [config['main_package']['package'] for config in plugin_configs] == ['forge-plugin2']
+    mocked_spinner.return_value.warn.assert_called_once_with(
+        f'Skipping [forge-plugin1]: Problem reading json file expected at {venv_path}'
+    )
+
+
+def test_find_plugin():
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'])
+    make_venv(forge.PLUGIN_PATH, 'non_plugin', apps=['plugin2'])
+    forge.get_plugins()
+
+    with patch('os.scandir') as mocked_scandir:
+        config = forge.find_plugin('plugin1')
+    mocked_scandir.assert_not_called()
+
+    assert config['main_package']['package'] == 'forge-plugin1'
+    assert forge.find_plugin('plugin2') is None
+    assert forge.find_plugin('missing') is None
+
+
+def test_find_plugin_not_yet_indexed():
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1.exe'])
+
+    assert forge.find_plugin('plugin1')['main_package']['package'] == 'forge-plugin1'
+
+
+def test_find_plugin_stale_entry():
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'])
+    forge.get_plugins()
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['renamed'])
 
-    with patch("builtins.open", multi_mock_open(*fake_config_jsons)):
-        forge.list_plugins()
+    with patch('forge.registry.is_current', return_value=False):
+        assert forge.find_plugin('plugin1') is None
+    assert forge.find_plugin('renamed') is not None
+
+
+def test_reindex_plugins(forge_home):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+    make_venv(forge.PLUGIN_PATH, 'non_plugin')
+    (forge_home / 'registry.json').write_text('{"version": 1, "venvs": {"forge-gone": {}}}')
+
+    assert forge.reindex_plugins() == 1
+    assert forge.get_forge_plugin_command_names() == ['plugin1']
+
+
+def test_get_plugins_writes_dispatch_table():
+    venv_path = make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'])
+    make_venv(forge.PLUGIN_PATH, 'non_plugin')
+
+    forge.get_plugins()
+
+    table = dispatch.load_table(forge.get_dispatch_table_path())
+    assert table['commands'] == {'plugin1': dispatch.get_executable_path(venv_path, 'plugin1')}
+    assert dispatch.is_table_current(table, forge.PLUGIN_PATH)
+
+
+def test_get_plugins_keeps_current_dispatch_table():
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1')
+    forge.get_plugins()
+
+    with patch('forge.dispatch.write_table') as mocked_write_table:
+        forge.get_plugins()
+
+    mocked_write_table.assert_not_called()
+
+
+def test_update_plugin_index():
+    forge.get_plugins()
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', package_version='1.0.0')
+
+    with patch('os.scandir') as mocked_scandir:
+        forge.update_plugin_index('forge-plugin1')
+    mocked_scandir.assert_not_called()
+
+    assert forge.get_plugins()[0]['main_package']['package_version'] == '1.0.0'
+
+
+@patch('halo.Halo')
+@patch('tabulate.tabulate')
+def test_list_plugins(mocked_tabulate, mocked_spinner):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1.exe'], package_version='1.0.0')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2', apps=['plugin2'], package_version='0.0.1')
+    make_venv(forge.PLUGIN_PATH, 'non_plugin', apps=['non_plugin.exe'], package_version='0.0.2')
+
+    forge.list_plugins()
 
     mocked_tabulate.assert_called_once_with(
         [('plugin1', '1.0.0'), ('plugin2', '0.0.1')], ['plugin', 'version']
@@ -128,16 +160,69 @@ def test_list_plugins(mocked_listdir, mocked_tabulate, mocked_spinner):
     mocked_spinner.assert_not_called()
 
 
-@patch('forge.forge.Halo')
-@patch('forge.forge.tabulate')
-@patch('os.listdir')
-def test_list_plugins_no_plugins_installed(mocked_listdir, mocked_tabulate, mocked_spinner):
-    forge.PLUGIN_PATH = os.path.join('home', 'user', '.forge', 'venvs')
-
-    fake_config_jsons = []
-
-    with patch("builtins.open", multi_mock_open(*fake_config_jsons)):
-        forge.list_plugins()
+@patch('halo.Halo')
+@patch('tabulate.tabulate')
+def test_list_plugins_no_plugins_installed(mocked_tabulate, mocked_spinner):
+    forge.list_plugins()
 
     mocked_tabulate.assert_not_called()
     assert mocked_spinner.mock_calls[1] == call().warn('No forge plugins installed yet! - Run forge --help for help')
+
+
+@patch('forge.plugin_help.capture_help', return_value='usage: plugin1\n')
+def test_cache_plugin_help(mock_capture_help):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'], package_version='1.0.0')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2', apps=[])
+    forge.get_plugins()
+
+    forge.cache_plugin_help('forge-plugin1')
+    forge.cache_plugin_help('forge-plugin2')
+    forge.cache_plugin_help('forge-missing')
+
+    mock_capture_help.assert_called_once_with(['plugin1', '-h'])
+    assert forge.get_plugin_help('plugin1') == 'usage: plugin1\n'
+
+
+@patch('forge.plugin_help.capture_help')
+def test_get_plugin_help_invalidated_by_upgrade(mock_capture_help):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'], package_version='1.0.0')
+    mock_capture_help.return_value = 'usage: plugin1 v1\n'
+    assert forge.get_plugin_help('plugin1', capture=True) == 'usage: plugin1 v1\n'
+
+    venv_path = make_venv(forge.PLUGIN_PATH, 'forge-plugin1', apps=['plugin1'], package_version='2.0.0')
+    metadata_path = os.path.join(venv_path, 'pipx_metadata.json')
+    stat = os.stat(metadata_path)
+    os.utime(metadata_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    mock_capture_help.return_value = 'usage: plugin1 v2\n'
+
+    assert forge.get_plugin_help('plugin1') is None
+    assert forge.get_plugin_help('plugin1', capture=True) == 'usage: plugin1 v2\n'
+
+
+@pytest.mark.parametrize('requirement, lock_name', [
+    ('forge-plugin1', 'forge-plugin1'),
+    ('Forge_Plugin1[extra]>=2.0', 'forge-plugin1'),
+    ('forge-plugin1 @ https://example.com/plugin.whl', 'forge-plugin1'),
+    ('git+ssh://git@example.com/team/forge-plugin1.git@v1.0', 'forge-plugin1'),
+    ('git+https://example.com/team/repo.git#egg=forge_plugin1', 'forge-plugin1'),
+    ('/tmp/forge_plugin1-1.0-py3-none-any.whl', 'forge-plugin1')
+])
+def test_get_lock_name(requirement, lock_name):
+    assert forge.get_lock_name(requirement) == lock_name
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='file locks need fcntl')
+def test_lock_plugin_leaves_other_plugins_free():
+    def is_free(name, shared=False):
+        with storage.file_lock(storage.get_lock_path(forge.FORGE_PATH, name), shared=shared,
+                               blocking=False) as locked:
+            return locked
+
+    with forge.lock_plugin('forge-plugin1==1.0'):
+        assert not is_free('forge-plugin1')
+        assert is_free('forge-plugin2')
+        assert is_free(forge.PLUGINS_LOCK_NAME, shared=True)
+        assert not is_free(forge.PLUGINS_LOCK_NAME)
+
+    with forge.lock_all_plugins():
+        assert not is_free(forge.PLUGINS_LOCK_NAME, shared=True)
@@ -0,0 +1,64 @@
+import os
+import sys
+import sysconfig
+
+import pytest
+from forge import inprocess
+
+from .conftest import make_plugin_venv
+
+
+@pytest.fixture
+def isolated_interpreter(monkeypatch):
+    """ Restores the import path, argv and imported modules a plugin run changes """
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    monkeypatch.setattr(sys, 'argv', list(sys.argv))
+    yield
+    sys.modules.pop('forge_inprocess_hello', None)
+
+
+def test_run_plugin_in_process(forge_home, isolated_interpreter, capsys):
+    executable = make_plugin_venv(
+        forge_home / 'venvs', '[forge.inprocess]\nhello = forge_inprocess_hello:main\n'
+    )
+
+    with pytest.raises(SystemExit) as err:
+        inprocess.run_plugin(['hello', 'world'], executable)
+
+    assert err.value.code == 3
+    assert capsys.readouterr().out == 'hello world\n'
+    assert sys.argv == [executable, 'world']
+    assert not any(path.endswith('site-packages') and 'forge-hello' not in path for path in sys.path)
+
+
+@pytest.mark.parametrize('entry_points, python_version', [
+    ('', None),
+    ('[forge.inprocess]\nhello = forge_inprocess_hello:main\n', '2.7.18')
+])
+def test_run_plugin_not_eligible(forge_home, isolated_interpreter, entry_points, python_version):
+    executable = make_plugin_venv(forge_home / 'venvs', entry_points, python_version)
+    path = list(sys.path)
+
+    inprocess.run_plugin(['hello'], executable)
+
+    assert sys.path == path
+
+
+@pytest.mark.parametrize('entry_point', ['os.path:join', 'os:path.join', 'os.path:join [extra]'])
+def test_load_entry_point(entry_point):
+    assert inprocess.load_entry_point(entry_point) is os.path.join
+
+
+def test_get_venv_python_version(tmp_path):
+    (tmp_path / 'pyvenv.cfg').write_text('home = /usr/bin\nversion_info = 3.8.10.final.0\n')
+
+    assert inprocess.get_venv_python_version(str(tmp_path)) == (3, 8)
+    assert inprocess.get_venv_python_version(str(tmp_path / 'missing')) is None
+
+
+def test_is_stdlib_module():
+    stdlib_dirs = {os.path.realpath(sysconfig.get_path('stdlib'))}
+
+    assert inprocess.is_stdlib_module(os, stdlib_dirs)
+    assert inprocess.is_stdlib_module(sys, stdlib_dirs)
+    assert not inprocess.is_stdlib_module(pytest, stdlib_dirs)
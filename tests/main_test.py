@@ -5,9 +5,8 @@ from forge.exceptions import (PluginManagementFatalException,
 from mock import patch
 
 
-@patch('forge.inject_forge_plugins')
-@patch('forge.forge_cli')
-def test_main_fatal_exception(mock_cli, mock_inject):
+@patch('forge.cli.forge_cli')
+def test_main_fatal_exception(mock_cli):
 
     mock_cli.side_effect = PluginManagementFatalException('some fatal message')
 
@@ -15,13 +14,11 @@ def test_main_fatal_exception(mock_cli, mock_inject):
         forge.main()
 
     mock_cli.assert_called_once()
-    mock_inject.assert_called_once()
     assert str(err.value) == '1'
 
 
-@patch('forge.inject_forge_plugins')
-@patch('forge.forge_cli')
-def test_main_warning_exception(mock_cli, mock_inject):
+@patch('forge.cli.forge_cli')
+def test_main_warning_exception(mock_cli):
 
     mock_cli.side_effect = PluginManagementWarnException('some fatal message')
 
@@ -29,5 +26,42 @@ def test_main_warning_exception(mock_cli, mock_inject):
         forge.main()
 
     mock_cli.assert_called_once()
-    mock_inject.assert_called_once()
     assert str(err.value) == '0'
+
+
+@patch('forge.cli.forge_cli')
+@patch('forge.daemon.run_client', return_value=True)
+def test_main_served_by_daemon(mock_run_client, mock_cli):
+
+    with patch('sys.argv', ['forge', 'list']):
+        forge.main()
+
+    mock_run_client.assert_called_once_with(['list'])
+    mock_cli.assert_not_called()
+
+
+@patch('forge.cli.forge_cli')
+@patch('forge.dispatch.run_plugin', side_effect=SystemExit(0))
+@patch('forge.dispatch.lookup_executable', return_value='/venvs/forge-plugin1/bin/plugin1')
+def test_main_dispatches_from_table(mock_lookup, mock_run_plugin, mock_cli):
+
+    with patch('sys.argv', ['forge', 'plugin1', 'arg1']), pytest.raises(SystemExit):
+        forge.main()
+
+    mock_run_plugin.assert_called_once_with(
+        ['plugin1', 'arg1'], '/venvs/forge-plugin1/bin/plugin1',
+        forge.forge.get_zygote_socket_path('plugin1'), forge.forge.get_stats_path()
+    )
+    mock_cli.assert_not_called()
+
+
+@patch('forge.cli.forge_cli')
+@patch('forge.forge.get_plugin_help', return_value='usage: plugin1\n')
+def test_main_prints_cached_plugin_help(mock_get_plugin_help, mock_cli, capsys):
+
+    with patch('sys.argv', ['forge', 'plugin1', '-h']):
+        forge.main()
+
+    mock_get_plugin_help.assert_called_once_with('plugin1')
+    assert capsys.readouterr().out == 'usage: plugin1\n'
+    mock_cli.assert_not_called()
@@ -0,0 +1,120 @@
+import json
+import sys
+
+import pytest
+from forge import forge, manifest
+from forge.cli import forge_cli
+from forge.exceptions import (PluginManagementFatalException,
+                              PluginManagementWarnException)
+from mock import call, patch
+
+from .conftest import make_venv
+
+
+def write_manifest(tmp_path, plugins, name='plugins.json'):
+    manifest_path = tmp_path / name
+    manifest_path.write_text(json.dumps({'plugins': plugins}))
+    return str(manifest_path)
+
+
+def test_load_manifest_json(tmp_path):
+    manifest_path = write_manifest(tmp_path, [
+        'forge-plugin1',
+        {'source': 'git+ssh://git@host/forge-plugin2', 'name': 'forge-plugin2',
+         'version': '2.0.0', 'pipx_args': ['--python', 'python3.9']},
+        {'source': 'forge-plugin3', 'version': '1.0'}
+    ])
+
+    entries = manifest.load_manifest(manifest_path)
+
+    assert entries[0] == manifest.ManifestEntry('forge-plugin1', 'forge-plugin1', None, [])
+    assert entries[1].pipx_args == ['--python', 'python3.9']
+    assert entries[1].install_spec == 'git+ssh://git@host/forge-plugin2'
+    assert entries[2].install_spec == 'forge-plugin3==1.0'
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason='tomllib is part of the standard library from 3.11')
+def test_load_manifest_toml(tmp_path):
+    manifest_path = tmp_path / 'plugins.toml'
+    manifest_path.write_text(
+        '[[plugins]]\n'
+        'source = "forge-plugin1"\n'
+        'version = "1.2.3"\n'
+        'pipx_args = ["--force"]\n'
+    )
+
+    assert manifest.load_manifest(str(manifest_path)) == [
+        manifest.ManifestEntry('forge-plugin1', 'forge-plugin1', '1.2.3', ['--force'])
+    ]
+
+
+@pytest.mark.parametrize('plugins', [
+    [{'name': 'forge-plugin1'}],
+    ['forge-plugin1', {'source': 'forge-plugin1'}]
+])
+def test_load_manifest_invalid(tmp_path, plugins):
+    with pytest.raises(PluginManagementFatalException):
+        manifest.load_manifest(write_manifest(tmp_path, plugins))
+
+
+def test_load_manifest_bad_json(tmp_path):
+    manifest_path = tmp_path / 'plugins.json'
+    manifest_path.write_text('{"plugins": [')
+
+    with pytest.raises(PluginManagementFatalException):
+        manifest.load_manifest(str(manifest_path))
+
+
+@patch('forge.manifest.print_summary')
+@patch('forge.pipx_wrapper.Halo')
+@patch('forge.manifest.install_plugin')
+def test_install_manifest_skips_installed_plugins(mock_install, mock_spinner, mock_summary, tmp_path):
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin1', package_version='1.0.0')
+    make_venv(forge.PLUGIN_PATH, 'forge-plugin2', package_version='1.0.0')
+    mock_install.return_value = ('plugin', 'forge-plugin 2.0.0', 'Python 3.9')
+    report_path = tmp_path / 'report.json'
+    manifest_path = write_manifest(tmp_path, [
+        {'source': 'forge-plugin1', 'version': '1.0.0'},
+        {'source': 'forge-plugin2', 'version': '2.0.0'},
+        {'source': 'git+ssh://git@host/forge-plugin3', 'pipx_args': ['--force']}
+    ])
+
+    results = manifest.install_manifest(manifest_path, ['--verbose'], jobs=2, report_path=str(report_path))
+
+    assert sorted(mock_install.mock_calls) == [
+        call('forge-plugin2==2.0.0', ['--verbose']),
+        call('git+ssh://git@host/forge-plugin3', ['--force', '--verbose'])
+    ]
+    assert [result.status for result in results] == ['skipped', 'succeeded', 'succeeded']
+    report = json.loads(report_path.read_text())
+    assert report['summary'] == {'succeeded': 2, 'skipped': 1, 'warned': 0, 'failed': 0}
+    assert report['plugins'][2]['source'] == 'git+ssh://git@host/forge-plugin3'
+
+
+@patch('forge.manifest.install_plugin')
+def test_install_manifest_raises_for_worst_result(mock_install, tmp_path, capsys):
+    mock_install.side_effect = [PluginManagementWarnException('Plugin already installed!')]
+    manifest_path = write_manifest(tmp_path, ['forge-plugin1'])
+
+    with pytest.raises(PluginManagementWarnException):
+        manifest.install_manifest(manifest_path, [], jobs=1, report_path='-')
+
+    output = capsys.readouterr()
+    assert json.loads(output.out)['plugins'][0]['status'] == 'warned'
+    assert 'Plugin already installed!' in output.err
+
+
+@patch('forge.manifest.install_plugin')
+def test_cli_add_manifest_report_to_stdout(mock_install, tmp_path, capsys):
+    mock_install.side_effect = [('plugin1', 'forge-plugin1', '3.11')]
+    manifest_path = write_manifest(tmp_path, ['forge-plugin1'])
+
+    with patch('sys.argv', ['forge', 'add', '-m', manifest_path, '--report', '-']), \
+            pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert err.value.code == 0
+    output = capsys.readouterr()
+    assert json.loads(output.out)['summary'] == {'succeeded': 1, 'skipped': 0, 'warned': 0,
+                                                 'failed': 0}
+    assert 'Installing plugins' in output.err and 'succeeded' in output.err
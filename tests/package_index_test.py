@@ -0,0 +1,195 @@
+import json
+import time
+from http.client import IncompleteRead
+from urllib.error import HTTPError
+
+import pytest
+from forge import package_index
+from mock import MagicMock, patch
+
+PROJECT_PAGE = """<!DOCTYPE html>
+<html><body>
+<a href="../../packages/forge_plugin-1.0.0-py3-none-any.whl#sha256=abc">forge_plugin-1.0.0-py3-none-any.whl</a>
+<a href="../../packages/forge-plugin-1.0.0.tar.gz">forge-plugin-1.0.0.tar.gz</a>
+<a href="../../packages/forge-plugin-1.10.0.tar.gz">forge-plugin-1.10.0.tar.gz</a>
+<a href="../../packages/forge-plugin-2.0.0.tar.gz" data-yanked="broken">forge-plugin-2.0.0.tar.gz</a>
+<a href="../../packages/forge_plugin-2.1.0rc1-py3-none-any.whl">forge_plugin-2.1.0rc1-py3-none-any.whl</a>
+<a href="../../packages/forge-plugin.txt">forge-plugin.txt</a>
+</body></html>
+"""
+
+
+@pytest.fixture
+def simple_index(tmp_path, monkeypatch):
+    project_path = tmp_path / 'simple' / 'forge-plugin'
+    project_path.mkdir(parents=True)
+    (project_path / 'index.html').write_text(PROJECT_PAGE)
+    monkeypatch.setenv(package_index.INDEX_URL_ENV_VAR, (tmp_path / 'simple').as_uri() + '/')
+    return project_path
+
+
+@pytest.fixture
+def pip_config(tmp_path, monkeypatch):
+    """ Only a temporary pip.conf, no FORGE_INDEX_URL or PIP_ index variables """
+    config_path = tmp_path / 'pip.conf'
+    config_path.write_text('')
+    for variable in ('FORGE_INDEX_URL', 'PIP_INDEX_URL', 'PIP_EXTRA_INDEX_URL', 'PIP_NO_INDEX'):
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setattr(package_index, 'get_pip_config_paths', lambda: [str(config_path)])
+    return config_path
+
+
+@pytest.mark.parametrize('older,newer', [
+    ('1.0', '1.0.1'),
+    ('1.9.0', '1.10.0'),
+    ('1.0.0a1', '1.0.0b1'),
+    ('1.0.0rc1', '1.0.0'),
+    ('1.0.0.dev1', '1.0.0a1'),
+    ('1.0.0', '1.0.0.post1'),
+    ('1.0.0.post1.dev0', '1.0.0.post1')
+])
+def test_version_key_ordering(older, newer):
+    assert package_index.version_key(older) < package_index.version_key(newer)
+
+
+def test_version_key_equivalent_versions():
+    assert package_index.version_key('1.0') == package_index.version_key('1.0.0')
+    assert package_index.version_key('not-a-version') is None
+
+
+def test_parse_versions():
+    assert package_index.parse_versions(PROJECT_PAGE) == ['1.0.0', '1.0.0', '1.10.0', '2.1.0rc1']
+
+
+@pytest.mark.parametrize('versions,include_prereleases,expected', [
+    (['1.0.0', '1.10.0', '2.1.0rc1'], False, '1.10.0'),
+    (['1.0.0', '1.10.0', '2.1.0rc1'], True, '2.1.0rc1'),
+    (['2.1.0rc1'], False, None)
+])
+def test_latest_version(versions, include_prereleases, expected):
+    assert package_index.latest_version(versions, include_prereleases) == expected
+
+
+@pytest.mark.parametrize('installed,latest,needs_update', [
+    ('1.0.0', '1.10.0', True),
+    ('1.10.0', '1.10.0', False),
+    ('2.0.0', '1.10.0', False),
+    ('1.0.0', None, True),
+    ('', '1.0.0', True)
+])
+def test_update_check_needs_update(installed, latest, needs_update):
+    assert package_index.UpdateCheck('forge-plugin', installed, latest).needs_update is needs_update
+
+
+def test_check_updates_against_file_index(simple_index, tmp_path):
+    checks = package_index.check_updates(
+        {'forge-plugin': '1.10.0', 'Forge_Other': '1.0.0', 'forge.plugin': '1.0.0'},
+        str(tmp_path / 'cache')
+    )
+
+    assert checks == [
+        package_index.UpdateCheck('forge-plugin', '1.10.0', '1.10.0'),
+        package_index.UpdateCheck('Forge_Other', '1.0.0', None),
+        package_index.UpdateCheck('forge.plugin', '1.0.0', '1.10.0')
+    ]
+
+
+def test_get_versions_uses_cache_within_ttl(simple_index, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    assert package_index.get_versions('forge-plugin', cache_dir)
+
+    (simple_index / 'index.html').write_text('')
+    assert package_index.get_versions('forge-plugin', cache_dir) == ['1.0.0', '1.0.0', '1.10.0', '2.1.0rc1']
+
+
+def test_get_versions_refreshes_after_ttl(simple_index, tmp_path, monkeypatch):
+    monkeypatch.setenv(package_index.INDEX_TTL_ENV_VAR, '0')
+    cache_dir = str(tmp_path / 'cache')
+    assert package_index.get_versions('forge-plugin', cache_dir)
+
+    (simple_index / 'index.html').write_text('')
+    assert package_index.get_versions('forge-plugin', cache_dir) == []
+
+
+def test_get_versions_revalidates_with_etag(tmp_path, monkeypatch):
+    monkeypatch.setenv(package_index.INDEX_URL_ENV_VAR, 'https://index.example/simple')
+    cache_path = tmp_path / 'forge-plugin.json'
+    cache_path.write_text(json.dumps({
+        'index_url': 'https://index.example/simple', 'fetched_at': time.time() - 3600,
+        'etag': '"abc"', 'last_modified': 'Mon, 01 Jan 2024 00:00:00 GMT', 'versions': ['1.0.0']
+    }))
+    not_modified = HTTPError('https://index.example/simple/forge-plugin/', 304, 'Not Modified', {}, None)
+
+    with patch('forge.package_index.urlopen', side_effect=not_modified) as mock_urlopen:
+        assert package_index.get_versions('forge-plugin', str(tmp_path)) == ['1.0.0']
+
+    request = mock_urlopen.call_args.args[0]
+    assert request.full_url == 'https://index.example/simple/forge-plugin/'
+    assert request.get_header('If-none-match') == '"abc"'
+    assert request.get_header('If-modified-since') == 'Mon, 01 Jan 2024 00:00:00 GMT'
+    assert json.loads(cache_path.read_text())['fetched_at'] > time.time() - 60
+
+
+def test_get_versions_stores_validators(tmp_path, monkeypatch):
+    monkeypatch.setenv(package_index.INDEX_URL_ENV_VAR, 'https://index.example/simple')
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.headers = {'ETag': '"def"', 'Last-Modified': 'Tue, 02 Jan 2024 00:00:00 GMT'}
+    response.read.return_value = PROJECT_PAGE.encode()
+
+    with patch('forge.package_index.urlopen', return_value=response):
+        assert package_index.get_versions('forge-plugin', str(tmp_path))
+
+    cached = json.loads((tmp_path / 'forge-plugin.json').read_text())
+    assert cached['etag'] == '"def"'
+    assert cached['last_modified'] == 'Tue, 02 Jan 2024 00:00:00 GMT'
+
+
+def test_get_versions_unreachable_index(tmp_path, monkeypatch):
+    monkeypatch.setenv(package_index.INDEX_URL_ENV_VAR, (tmp_path / 'missing').as_uri())
+
+    assert package_index.get_versions('forge-plugin', str(tmp_path / 'cache')) is None
+
+
+def test_get_versions_malformed_response(tmp_path, monkeypatch):
+    monkeypatch.setenv(package_index.INDEX_URL_ENV_VAR, 'https://index.example/simple')
+
+    with patch('forge.package_index.urlopen', side_effect=IncompleteRead(b'')):
+        assert package_index.get_versions('forge-plugin', str(tmp_path)) is None
+
+
+def test_get_index_url_defaults_to_pypi(pip_config):
+    assert package_index.get_index_url() == 'https://pypi.org/simple'
+
+
+def test_get_index_url_follows_pip(pip_config, monkeypatch):
+    pip_config.write_text('[global]\nindex-url = https://config.internal/simple/\n')
+    assert package_index.get_index_url() == 'https://config.internal/simple'
+
+    monkeypatch.setenv('PIP_INDEX_URL', 'https://env.internal/simple')
+    assert package_index.get_index_url() == 'https://env.internal/simple'
+    assert package_index.get_index_url(['-i', 'https://args.internal/simple']) == \
+        'https://args.internal/simple'
+
+    monkeypatch.setenv(package_index.INDEX_URL_ENV_VAR, 'https://forge.internal/simple')
+    assert package_index.get_index_url(['-i', 'https://args.internal/simple']) == \
+        'https://forge.internal/simple'
+
+
+@pytest.mark.parametrize('config, pip_args', [
+    ('[install]\nextra-index-url = https://config.internal/simple\n', []),
+    ('', ['--extra-index-url', 'https://args.internal/simple']),
+    ('', ['--no-index']),
+])
+def test_get_index_url_unclear(pip_config, config, pip_args):
+    pip_config.write_text(config)
+
+    assert package_index.get_index_url(pip_args) is None
+    assert package_index.check_update('forge-plugin', '1.0', str(pip_config.parent),
+                                      package_index.get_index_url(pip_args)).latest is None
+
+
+def test_get_pip_config_paths_ends_with_pip_config_file(monkeypatch):
+    monkeypatch.setenv('PIP_CONFIG_FILE', '/srv/pip.conf')
+
+    assert package_index.get_pip_config_paths()[-1] == '/srv/pip.conf'
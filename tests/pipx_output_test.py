@@ -0,0 +1,33 @@
+import pytest
+from forge import pipx_output
+
+
+def test_parser_reports_phase_changes_only():
+    parser = pipx_output.PipxOutputParser()
+
+    assert parser.feed('Collecting requests\n') == 'Collecting requests'
+    assert parser.feed('Collecting requests\n') is None
+    assert parser.feed('  Downloading requests-2.25.0-py2.py3-none-any.whl (61 kB)\n').startswith('Downloading')
+    assert parser.feed('pipx >(run_subprocess:142): running pip\n') is None
+    assert parser.phase.startswith('Downloading requests-2.25.0')
+    assert parser.terminal is None
+
+
+def test_parser_truncates_long_phases():
+    parser = pipx_output.PipxOutputParser()
+
+    assert len(parser.feed('Collecting ' + 'x' * 200)) == pipx_output.MAX_PHASE_LENGTH
+
+
+@pytest.mark.parametrize('line,severity', [
+    ("'forge-plugin' already seems to be installed. Not modifying existing installation", pipx_output.WARNING),
+    ('Package is not installed. Expected to find /home/user/.forge/venvs/forge-plugin', pipx_output.WARNING),
+    ('Nothing to uninstall for forge-plugin', pipx_output.WARNING),
+    ('ERROR: No matching distribution found for forge-plugin', pipx_output.FATAL),
+    ('ERROR: Could not find a version that satisfies the requirement forge-plugin', pipx_output.FATAL)
+])
+def test_parser_terminal_conditions(line, severity):
+    parser = pipx_output.PipxOutputParser()
+    parser.feed(line)
+
+    assert parser.terminal == severity
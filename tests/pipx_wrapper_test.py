@@ -1,43 +1,56 @@
+import io
+import os
+import sys
+import time
 from subprocess import CalledProcessError
 
 import pytest
-from forge import pipx_wrapper
+from forge import forge, pipx_wrapper, process
+from forge.pipx_output import FATAL, RETRYABLE, WARNING
 from forge.exceptions import (PluginManagementFatalException,
                               PluginManagementWarnException)
-from mock import call, patch
+from mock import ANY, call, patch
+
+from .conftest import make_venv
 
 
 def run_command_fail(*args, **kwargs):
     raise CalledProcessError(returncode=1, cmd=' '.join(args[0]))
 
 
-@patch('forge.pipx_wrapper.Popen')
+@patch('forge.process.Popen')
 def test_run_command(mock_popen):
     mock_process = mock_popen.return_value
     mock_process.returncode = 0
-    mock_process.communicate.return_value = (b'stdout', b'stderr')
+    mock_process.stdout = io.StringIO('stdout')
+    mock_process.stderr = io.StringIO('stderr')
 
     stdout, stderr = pipx_wrapper.run_command(['ls'])
     assert stdout == 'stdout'
     assert stderr == 'stderr'
 
 
-@patch('forge.pipx_wrapper.Popen')
+@patch('forge.process.Popen')
 def test_run_command_fail_non_zero_exit_code(mock_popen):
     mock_process = mock_popen.return_value
     mock_process.returncode = 1
-    mock_process.communicate.return_value = (b'stdout', b'stderr')
+    mock_process.stdout = io.StringIO('stdout')
+    mock_process.stderr = io.StringIO('stderr')
     with pytest.raises(PluginManagementFatalException):
         pipx_wrapper.run_command(['ls'])
 
 
 @patch('forge.pipx_wrapper.Halo')
 @patch('forge.pipx_wrapper.run_command')
-def test_update_pipx(mock_run_command, mock_spinner):
+def test_update_pipx(mock_run_command, mock_spinner, wheelhouse_builds):
     mock_run_command.return_value = ('forge-plugin-name updated to some version(', '')
     pipx_wrapper.update_pipx('forge-plugin-name', [])
 
-    mock_run_command.assert_called_once_with(['pipx', 'upgrade', 'forge-plugin-name', '--verbose'])
+    mock_run_command.assert_called_once_with(
+        ['pipx', 'upgrade', 'forge-plugin-name', '--verbose'], on_progress=ANY,
+        env=dict(os.environ, PIP_FIND_LINKS=forge.get_wheelhouse_path()),
+        timeout=process.OPERATION_TIMEOUTS['upgrade']
+    )
 
     assert mock_spinner.mock_calls[0] == call(text='Updating plugin: [plugin-name]...',
                                               spinner={'interval': 80, 'frames': [
@@ -47,6 +60,102 @@ def test_update_pipx(mock_run_command, mock_spinner):
     assert mock_spinner.mock_calls[2] == call().__enter__().succeed('plugin-name updated to some version')
 
 
+@patch('forge.pipx_wrapper.lock_plugin')
+@patch('forge.pipx_wrapper.cache_plugin_help')
+@patch('forge.pipx_wrapper.compile_plugin_bytecode')
+@patch('forge.pipx_wrapper.update_plugin_index')
+@patch('forge.pipx_wrapper.run_command')
+def test_upgrade_plugin_caches_help(mock_run_command, mock_update_index, mock_compile,
+                                    mock_cache_help, mock_lock, forge_home, wheelhouse_builds):
+    make_venv(forge_home / 'venvs', 'forge-plugin-name', source='forge-plugin-name')
+    mock_run_command.return_value = ('forge-plugin-name updated to some version(', '')
+
+    pipx_wrapper.upgrade_plugin('forge-plugin-name', [])
+
+    assert [command[-1] for command in wheelhouse_builds] == ['forge-plugin-name']
+    assert mock_run_command.call_args.kwargs['env']['PIP_FIND_LINKS'] == forge.get_wheelhouse_path()
+
+    mock_update_index.assert_called_once_with('forge-plugin-name')
+    mock_compile.assert_called_once_with('forge-plugin-name')
+    mock_lock.assert_called_once_with('forge-plugin-name')
+    mock_cache_help.assert_called_once_with('forge-plugin-name')
+
+
+@patch('forge.pipx_wrapper.remove_plugin_help')
+@patch('forge.pipx_wrapper.update_plugin_index')
+@patch('forge.pipx_wrapper.run_command')
+def test_uninstall_plugin_removes_help(mock_run_command, mock_update_index, mock_remove_help):
+    mock_run_command.return_value = ('uninstalled forge-plugin-name!', '')
+
+    pipx_wrapper.uninstall_plugin('forge-plugin-name', [])
+
+    mock_remove_help.assert_called_once_with('forge-plugin-name')
+
+
+def python_command(script):
+    return [sys.executable, '-c', script]
+
+
+def test_run_command_streams_progress():
+    phases = []
+    stdout, stderr = pipx_wrapper.run_command(python_command(
+        "import sys, time\n"
+        "print('Collecting forge-plugin')\n"
+        "print('Collecting forge-plugin')\n"
+        "print('  some detail', flush=True)\n"
+        "time.sleep(0.5)\n"
+        "print('Installing collected packages: forge-plugin', file=sys.stderr)\n"
+    ), on_progress=phases.append)
+
+    assert phases == ['Collecting forge-plugin', 'Installing collected packages: forge-plugin']
+    assert stdout.splitlines() == ['Collecting forge-plugin', 'Collecting forge-plugin', '  some detail']
+    assert 'Installing collected packages' in stderr
+
+
+def test_run_command_stops_early_on_warning_condition():
+    started = time.monotonic()
+    stdout, _ = pipx_wrapper.run_command(python_command(
+        "import time\n"
+        "print('forge-plugin already seems to be installed', flush=True)\n"
+        "time.sleep(30)\n"
+    ))
+
+    assert time.monotonic() - started < 10
+    assert 'already seems to be installed' in stdout
+
+
+def test_run_command_stops_early_on_fatal_condition():
+    with pytest.raises(PluginManagementFatalException) as err:
+        pipx_wrapper.run_command(python_command(
+            "import sys, time\n"
+            "print('ERROR: No matching distribution found for forge-nope', file=sys.stderr, flush=True)\n"
+            "time.sleep(30)\n"
+        ))
+
+    assert 'No matching distribution found' in str(err.value)
+
+
+@patch('forge.pipx_output.MAX_RETAINED_LINES', 3)
+def test_run_command_caps_retained_output():
+    stdout, _ = pipx_wrapper.run_command(python_command("for i in range(100): print(i)"))
+
+    assert stdout.splitlines() == ['97', '98', '99']
+
+
+@patch('forge.pipx_wrapper.Halo')
+@patch('forge.pipx_wrapper.run_command')
+def test_update_pipx_shows_progress(mock_run_command, mock_spinner):
+    def run_command(command, on_progress, env, timeout):
+        on_progress('Collecting forge-plugin-name')
+        return 'forge-plugin-name updated to some version(', ''
+
+    mock_run_command.side_effect = run_command
+    pipx_wrapper.update_pipx('forge-plugin-name', [])
+
+    spinner = mock_spinner.return_value.__enter__.return_value
+    assert spinner.text == 'Updating plugin: [plugin-name] Collecting forge-plugin-name'
+
+
 @patch('forge.pipx_wrapper.Halo')
 @patch('forge.pipx_wrapper.run_command')
 def test_update_pipx_fail_no_update_message_matched(mock_run_command, mock_spinner):
@@ -69,7 +178,7 @@ def test_update_pipx_warn_already_up_to_date(mock_run_command, mock_spinner):
 
 @patch('forge.pipx_wrapper.Halo')
 @patch('forge.pipx_wrapper.run_command')
-def test_install_to_pipx(mock_run_command, mock_spinner):
+def test_install_to_pipx(mock_run_command, mock_spinner, wheelhouse_builds):
 
     pipx_output = """
         installed package forge-plugin-name-here,python-version
@@ -80,13 +189,37 @@ def test_install_to_pipx(mock_run_command, mock_spinner):
     mock_run_command.return_value = (pipx_output, '')
     pipx_wrapper.install_to_pipx('some-source', [])
 
-    mock_run_command.assert_called_once_with(['pipx', 'install', 'some-source', '--verbose'])
+    mock_run_command.assert_called_once_with(
+        ['pipx', 'install', 'some-source', '--verbose'], on_progress=ANY,
+        env=dict(os.environ, PIP_FIND_LINKS=forge.get_wheelhouse_path()),
+        timeout=process.OPERATION_TIMEOUTS['install']
+    )
+    assert [command[-1] for command in wheelhouse_builds] == ['some-source']
     assert mock_spinner.mock_calls[0].kwargs['text'] == 'Installing plugin...'
     assert mock_spinner.mock_calls[2] == call().__enter__().succeed(
         'Installed plugin: [plugin-name-here] [forge-plugin-name-here] [python-version]!'
     )
 
 
+@patch('forge.pipx_wrapper.cache_plugin_help')
+@patch('forge.pipx_wrapper.update_plugin_index')
+@patch('forge.pipx_wrapper.link_shared_layer')
+@patch('forge.pipx_wrapper.is_shared_mode', return_value=True)
+@patch('forge.pipx_wrapper.prepare_wheelhouse',
+       return_value=('some-source', {'PIP_FIND_LINKS': '/wheels'}))
+@patch('forge.pipx_wrapper.run_command')
+def test_install_plugin_shared_mode(mock_run_command, mock_prepare, mock_shared_mode, mock_link,
+                                    mock_update_index, mock_cache_help):
+    mock_run_command.return_value = ('installed package forge-plugin,3.9\nyada\nforge-plugin\n', '')
+
+    pipx_wrapper.install_plugin('some-source', [])
+
+    assert mock_run_command.call_args.kwargs['env']['PIP_NO_DEPS'] == '1'
+    assert mock_run_command.call_args.kwargs['env']['PIP_FIND_LINKS'] == '/wheels'
+    mock_link.assert_called_once_with('forge-plugin', {'PIP_FIND_LINKS': '/wheels'})
+    mock_update_index.assert_called_once_with('forge-plugin')
+
+
 @patch('forge.pipx_wrapper.Halo')
 @patch('forge.pipx_wrapper.run_command')
 def test_install_to_pipx_warn_plugin_already_installed(mock_run_command, mock_spinner):
@@ -113,7 +246,10 @@ def test_uninstall_from_pipx(mock_run_command, mock_spinner):
     mock_run_command.return_value = ('', '')
     pipx_wrapper.uninstall_from_pipx('forge-plugin-name', [])
 
-    mock_run_command.assert_called_once_with(['pipx', 'uninstall', 'forge-plugin-name', '--verbose'])
+    mock_run_command.assert_called_once_with(
+        ['pipx', 'uninstall', 'forge-plugin-name', '--verbose'], on_progress=ANY,
+        timeout=process.OPERATION_TIMEOUTS['uninstall']
+    )
     assert mock_spinner.mock_calls[0].kwargs['text'] == 'Uninstalling plugin: [forge-plugin-name]...'
     assert mock_spinner.mock_calls[2] == call().__enter__().succeed('Uninstalled plugin: [forge-plugin-name]!')
 
@@ -129,7 +265,7 @@ def test_uninstall_from_pipx_warn_plugin_not_installed(mock_run_command, mock_sp
 
 
 @patch('forge.pipx_wrapper.Halo')
-@patch('forge.pipx_wrapper.Popen')
+@patch('forge.process.Popen')
 def test_uninstall_from_pipx_fail_some_pipx_exception(mock_popen, mock_spinner):
     mock_popen.side_effect = run_command_fail
     with pytest.raises(PluginManagementFatalException):
@@ -145,17 +281,110 @@ def test_uninstall_from_pipx_fail_some_pipx_exception(mock_popen, mock_spinner):
         yada
         (_symlink_package_apps:95): Same path
         yada
-    """, False),
+    """, WARNING),
     ("""
         yada
         (_copy_package_apps:66):   Overwriting file
         yada
-    """, False),
+    """, WARNING),
+    ("""
+        WARNING: Retrying (Retry(total=4)) after connection broken by 'NewConnectionError'
+        ERROR: No matching distribution found for forge-plugin
+    """, RETRYABLE),
     ("""
         yada
         some none error log message
         yada
-    """, True)
+    """, FATAL)
+])
+def test_classify_error(error_message, expected_result):
+    assert pipx_wrapper.classify_error(error_message) == expected_result
+
+
+@pytest.mark.parametrize('terminal, returncode, stderr, expected', [
+    (None, 0, '', None),
+    (WARNING, 0, '', WARNING),
+    (None, 1, '(_symlink_package_apps:95): Same path', WARNING),
+    (None, 1, 'boom', FATAL),
+    (FATAL, 1, 'Max retries exceeded', RETRYABLE),
+    (FATAL, 1, '(_copy_package_apps:66):   Overwriting file', FATAL),
+])
+def test_classify_result(terminal, returncode, stderr, expected):
+    assert pipx_wrapper.classify_result(terminal, returncode, stderr) == expected
+
+
+@patch('forge.pipx_wrapper.time.sleep')
+@patch('forge.pipx_wrapper.run_once')
+def test_run_command_retries_transient_failures(mock_run_once, mock_sleep):
+    mock_run_once.side_effect = [
+        ('', 'Read timed out', RETRYABLE), ('', 'Read timed out', RETRYABLE), ('done', '', None)
+    ]
+
+    assert pipx_wrapper.run_command(['pipx', 'install', 'forge-plugin']) == ('done', '')
+    assert mock_sleep.call_args_list == [call(1.0), call(2.0)]
+
+
+@patch('forge.pipx_wrapper.time.sleep')
+@patch('forge.pipx_wrapper.run_once', return_value=('', 'Read timed out', RETRYABLE))
+def test_run_command_gives_up_after_retries(mock_run_once, mock_sleep, monkeypatch):
+    monkeypatch.setenv(pipx_wrapper.RETRIES_ENV_VAR, '1')
+
+    with pytest.raises(PluginManagementFatalException):
+        pipx_wrapper.run_command(['pipx', 'install', 'forge-plugin'])
+    assert mock_run_once.call_count == 2
+
+
+def test_run_command_times_out_and_kills_the_process_group():
+    started = time.monotonic()
+    with pytest.raises(PluginManagementFatalException) as err:
+        pipx_wrapper.run_command(python_command(
+            "import subprocess, sys, time\n"
+            "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+            "time.sleep(30)\n"
+        ), timeout=0.5)
+
+    assert 'timed out after 0.5 seconds' in str(err.value)
+    assert time.monotonic() - started < 10
+
+
+@patch('forge.pipx_wrapper.cache_plugin_help')
+@patch('forge.pipx_wrapper.compile_plugin_bytecode')
+@patch('forge.pipx_wrapper.update_plugin_index')
+@patch('forge.pipx_wrapper.run_command')
+def test_install_plugin_keeps_vcs_source(mock_run_command, mock_update_index, mock_compile,
+                                         mock_cache_help, wheelhouse_builds):
+    source = 'git+https://example.com/forge-demo.git'
+    mock_run_command.return_value = ('installed package forge-demo,3.9\nyada\nforge-demo\n', '')
+
+    pipx_wrapper.install_plugin(source, [])
+
+    assert mock_run_command.call_args.args[0][:3] == ['pipx', 'install', source]
+    assert mock_run_command.call_args.kwargs['env']['PIP_FIND_LINKS'] == forge.get_wheelhouse_path()
+    assert wheelhouse_builds[0][-2:] == ['--no-deps', source]
+    assert os.listdir(forge.get_wheelhouse_path())
+
+
+@pytest.mark.parametrize('extra_args, env, expected', [
+    (['--python', '/opt/python3.8'], {'PIPX_DEFAULT_PYTHON': '/opt/python3.9'}, '/opt/python3.8'),
+    (['--python=/opt/python3.8'], {}, '/opt/python3.8'),
+    ([], {'PIPX_DEFAULT_PYTHON': '/opt/python3.9'}, '/opt/python3.9'),
+    ([], {}, '/opt/pipx/bin/python')
 ])
-def test_determine_is_fatal_error(error_message, expected_result):
-    assert pipx_wrapper.determine_is_fatal_error(error_message) == expected_result
+def test_get_pipx_python(extra_args, env, expected, tmp_path, monkeypatch):
+    pipx_script = tmp_path / 'pipx'
+    pipx_script.write_text('#!/opt/pipx/bin/python\nimport pipx\n')
+    monkeypatch.delenv('PIPX_DEFAULT_PYTHON', raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+
+    with patch('forge.pipx_wrapper.shutil.which', return_value=str(pipx_script)):
+        assert pipx_wrapper.get_pipx_python(extra_args) == expected
+
+
+def test_read_shebang_interpreter(tmp_path):
+    script = tmp_path / 'pipx'
+    script.write_text('#!/usr/bin/env python3\n')
+    assert pipx_wrapper.read_shebang_interpreter(str(script)) == 'python3'
+    script.write_bytes(b'MZ\x90\x00')
+    assert pipx_wrapper.read_shebang_interpreter(str(script)) == ''
+    assert pipx_wrapper.read_shebang_interpreter(str(tmp_path / 'missing')) == ''
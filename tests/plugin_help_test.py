@@ -0,0 +1,52 @@
+import os
+import sys
+
+from forge import plugin_help
+
+
+def test_get_help_path(tmp_path):
+    assert plugin_help.get_help_path(str(tmp_path), 'forge-plugin1', '1.0.0') == \
+        os.path.join(str(tmp_path), 'forge-plugin1', '1.0.0.txt')
+    assert plugin_help.get_help_path(str(tmp_path), 'forge-plugin1', '') == \
+        os.path.join(str(tmp_path), 'forge-plugin1', 'unknown.txt')
+    assert plugin_help.get_help_path(str(tmp_path), 'forge-plugin1', '1.0/../x') == \
+        os.path.join(str(tmp_path), 'forge-plugin1', '1.0_.._x.txt')
+
+
+def test_write_and_read_help(tmp_path):
+    plugin_help.write_help(str(tmp_path), 'forge-plugin1', '1.0.0', 'usage: plugin1\n')
+
+    assert plugin_help.read_help(str(tmp_path), 'forge-plugin1', '1.0.0') == 'usage: plugin1\n'
+    assert plugin_help.read_help(str(tmp_path), 'forge-plugin1', '2.0.0') is None
+
+
+def test_write_help_drops_other_versions(tmp_path):
+    plugin_help.write_help(str(tmp_path), 'forge-plugin1', '1.0.0', 'old usage\n')
+    plugin_help.write_help(str(tmp_path), 'forge-plugin1-extra', '1.0.0', 'other plugin\n')
+
+    plugin_help.write_help(str(tmp_path), 'forge-plugin1', '2.0.0', 'new usage\n')
+
+    assert plugin_help.read_help(str(tmp_path), 'forge-plugin1', '1.0.0') is None
+    assert plugin_help.read_help(str(tmp_path), 'forge-plugin1', '2.0.0') == 'new usage\n'
+    assert plugin_help.read_help(str(tmp_path), 'forge-plugin1-extra', '1.0.0') == 'other plugin\n'
+
+
+def test_remove_help(tmp_path):
+    plugin_help.write_help(str(tmp_path), 'forge-plugin1', '1.0.0', 'usage\n')
+
+    plugin_help.remove_help(str(tmp_path), 'forge-plugin1')
+    plugin_help.remove_help(str(tmp_path), 'forge-missing')
+
+    assert plugin_help.read_help(str(tmp_path), 'forge-plugin1', '1.0.0') is None
+
+
+def test_capture_help():
+    text = plugin_help.capture_help([sys.executable, '-c', 'import sys; print("usage: " + sys.argv[1])', '-h'])
+
+    assert text == 'usage: -h\n'
+
+
+def test_capture_help_failure():
+    assert plugin_help.capture_help([sys.executable, '-c', 'raise SystemExit(2)']) is None
+    assert plugin_help.capture_help([sys.executable, '-c', 'pass']) is None
+    assert plugin_help.capture_help(['forge-no-such-plugin', '-h']) is None
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+from forge import process
+from mock import patch
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='uses POSIX process groups')
+
+SPAWN_SLEEPER = (
+    "import subprocess, sys, time\n"
+    "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+    "print(child.pid, flush=True)\n"
+    "time.sleep(30)\n"
+)
+
+
+def is_running(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as stat_file:
+            return stat_file.read().split(')')[-1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+def wait_until_stopped(pid):
+    deadline = time.time() + 10
+    while is_running(pid) and time.time() < deadline:
+        time.sleep(0.05)
+    return not is_running(pid)
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='reads /proc')
+def test_managed_process_stops_the_whole_group():
+    with process.managed_process([sys.executable, '-c', SPAWN_SLEEPER]) as started:
+        grandchild_pid = int(started.stdout.readline())
+
+    assert started.returncode is not None
+    assert wait_until_stopped(grandchild_pid)
+    assert started not in process.RUNNING
+
+
+def test_start_process_disables_prompts():
+    with process.managed_process([sys.executable, '-c',
+                                  'import os; print(os.environ["GIT_TERMINAL_PROMPT"])']) as started:
+        assert started.stdout.read() == '0\n'
+
+
+@patch('forge.process.CANCELLED', threading.Event())
+def test_stop_all_refuses_new_processes():
+    started = process.start_process([sys.executable, '-c', 'import time; time.sleep(30)'])
+
+    process.stop_all()
+
+    assert started.poll() is not None
+    with pytest.raises(OSError):
+        process.start_process([sys.executable, '-c', 'pass'])
+
+
+@pytest.mark.parametrize('value, expected', [('', 900.0), ('0', None), ('60', 60.0), ('soon', 900.0)])
+def test_get_timeout(value, expected, monkeypatch):
+    monkeypatch.setenv('FORGE_INSTALL_TIMEOUT', value)
+
+    assert process.get_timeout('install') == expected
+
+
+def test_run_merges_output():
+    completed = process.run([sys.executable, '-c', 'import sys; print("out"); print("err", file=sys.stderr)'])
+
+    assert completed.returncode == 0
+    assert sorted(completed.stdout.split()) == ['err', 'out']
+
+
+def test_run_times_out():
+    started = time.monotonic()
+
+    with pytest.raises(process.TimeoutExpired):
+        process.run([sys.executable, '-c', 'import time; time.sleep(30)'], timeout=0.5)
+
+    assert time.monotonic() - started < 10
+    assert not process.RUNNING
@@ -0,0 +1,85 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+from forge import profiling
+
+
+@pytest.fixture
+def profile_state(monkeypatch):
+    monkeypatch.setattr(profiling, 'PHASES', {})
+    monkeypatch.setattr(profiling, 'OPEN_PHASES', {})
+    monkeypatch.setattr(profiling, 'STATE', {'enabled': False, 'reported': False})
+
+
+def test_phase_accumulates(profile_state):
+    for _ in range(2):
+        with profiling.phase('metadata_parse'):
+            pass
+
+    report = profiling.get_report()
+
+    assert report['phases']['metadata_parse']['calls'] == 2
+    assert report['phases']['metadata_parse']['ms'] >= 0
+    assert report['total_ms'] >= report['phases']['metadata_parse']['ms']
+
+
+def test_phase_records_on_error(profile_state):
+    with pytest.raises(ValueError), profiling.phase('cli'):
+        raise ValueError()
+
+    assert profiling.get_report()['phases']['cli']['calls'] == 1
+    assert not profiling.OPEN_PHASES
+
+
+def test_report_includes_open_phases(profile_state):
+    with profiling.phase('dispatch'):
+        report = profiling.get_report()
+
+    assert report['phases']['dispatch']['calls'] == 1
+
+
+def test_report_disabled(profile_state, capsys):
+    profiling.report()
+
+    assert capsys.readouterr().err == ''
+
+
+def test_report_once(profile_state, capsys):
+    profiling.enable()
+    with profiling.phase('imports'):
+        pass
+
+    profiling.report()
+    profiling.report()
+
+    lines = capsys.readouterr().err.splitlines()
+    assert len(lines) == 1
+    assert 'imports' in json.loads(lines[0])['phases']
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='plugin stub is a shell script')
+def test_profile_plugin_dispatch(tmp_path):
+    venv_path = tmp_path / '.forge' / 'venvs' / 'forge-hello'
+    venv_path.mkdir(parents=True)
+    (venv_path / 'pipx_metadata.json').write_text(json.dumps({'main_package': {
+        'package': 'forge-hello', 'apps': ['hello'], 'package_version': '1.0.0'
+    }}))
+    plugin = tmp_path / 'hello'
+    plugin.write_text('#!/bin/sh\nexit 0\n')
+    plugin.chmod(plugin.stat().st_mode | stat.S_IEXEC)
+
+    env = dict(os.environ, HOME=str(tmp_path), PATH=f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+    env[profiling.PROFILE_ENV_VAR] = '1'
+    result = subprocess.run(
+        [sys.executable, '-m', 'forge', 'hello'],
+        env=env, cwd=str(tmp_path), stderr=subprocess.PIPE, universal_newlines=True, check=False
+    )
+
+    assert result.returncode == 0, result.stderr
+    phases = json.loads(result.stderr.splitlines()[-1])['phases']
+    assert {'imports', 'cli', 'registry_refresh', 'metadata_parse',
+            'command_resolve', 'dispatch'} <= set(phases)
@@ -0,0 +1,188 @@
+import json
+import os
+
+import pytest
+from forge import registry, storage
+from forge.exceptions import PluginManagementFatalException
+from mock import mock_open, patch
+
+from .conftest import make_venv
+
+
+@pytest.fixture
+def paths(tmp_path):
+    plugin_path = tmp_path / 'venvs'
+    plugin_path.mkdir()
+    return str(plugin_path), str(tmp_path / 'registry.json')
+
+
+def test_read_metadata(tmp_path):
+    with patch('builtins.open', mock_open(read_data='{"a":"something", "b":"another"}')):
+        assert registry.read_metadata(str(tmp_path)) == {'a': 'something', 'b': 'another'}
+
+
+@pytest.mark.parametrize('content', ['{"a":no quote heres, or here:"another"}', ''])
+def test_read_metadata_invalid(content):
+    with pytest.raises(PluginManagementFatalException) as err:
+        with patch('builtins.open', mock_open(read_data=content)):
+            registry.read_metadata('some_path')
+
+    assert str(err.value) == 'Problem reading json file expected at some_path'
+
+
+def test_read_entry_keeps_only_used_fields(tmp_path):
+    venv_path = make_venv(tmp_path, 'forge-plugin1', apps=['plugin1'], package_version='1.2.3')
+
+    entry = registry.read_entry(venv_path)
+
+    assert entry['package'] == 'forge-plugin1'
+    assert entry['apps'] == ['plugin1']
+    assert entry['package_version'] == '1.2.3'
+    assert entry['package_or_url'] == 'forge-plugin1'
+    assert set(entry) == {
+        'dir_mtime', 'file_mtime', 'package', 'package_or_url', 'pip_args', 'apps', 'package_version'
+    }
+
+
+def test_read_entry_missing_metadata(tmp_path):
+    with pytest.raises(PluginManagementFatalException) as err:
+        registry.read_entry(str(tmp_path))
+
+    assert str(err.value) == f'Problem reading json file expected at {tmp_path}'
+
+
+def test_refresh_registry_writes_index(paths):
+    plugin_path, registry_path = paths
+    make_venv(plugin_path, 'forge-plugin1')
+    make_venv(plugin_path, 'non_plugin')
+
+    venvs = registry.refresh_registry(plugin_path, registry_path)
+
+    assert sorted(venvs) == ['forge-plugin1']
+    with open(registry_path) as registry_file:
+        assert json.loads(registry_file.read()) == {'version': registry.REGISTRY_VERSION, 'venvs': venvs}
+
+
+def test_refresh_registry_rereads_only_changed_venvs(paths):
+    plugin_path, registry_path = paths
+    make_venv(plugin_path, 'forge-plugin1')
+    changed_path = make_venv(plugin_path, 'forge-plugin2', package_version='1.0.0')
+    registry.refresh_registry(plugin_path, registry_path)
+
+    make_venv(plugin_path, 'forge-plugin2', package_version='2.0.0')
+    stat = os.stat(os.path.join(changed_path, registry.METADATA_FILE_NAME))
+    os.utime(os.path.join(changed_path, registry.METADATA_FILE_NAME), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+    with patch('forge.registry.read_metadata', wraps=registry.read_metadata) as mocked_read:
+        venvs = registry.refresh_registry(plugin_path, registry_path)
+
+    mocked_read.assert_called_once_with(changed_path)
+    assert venvs['forge-plugin2']['package_version'] == '2.0.0'
+
+
+@pytest.mark.parametrize('venv_name, expected', [
+    ('forge-plugin', True), ('forge_plugin', True), ('Forge.Plugin', True),
+    ('forgeplugin', False), ('black', False), ('my-forge-plugin', False)
+])
+def test_is_forge_venv_name(venv_name, expected):
+    assert registry.is_forge_venv_name(venv_name) is expected
+
+
+def test_refresh_registry_skips_other_venvs_without_reading(paths):
+    plugin_path, registry_path = paths
+    make_venv(plugin_path, 'forge-plugin1')
+    make_venv(plugin_path, 'black')
+    open(os.path.join(plugin_path, 'forge-file'), 'w').close()
+
+    with patch('forge.registry.read_metadata', wraps=registry.read_metadata) as mocked_read:
+        venvs = registry.refresh_registry(plugin_path, registry_path)
+
+    mocked_read.assert_called_once_with(os.path.join(plugin_path, 'forge-plugin1'))
+    assert list(venvs) == ['forge-plugin1']
+
+
+def test_refresh_registry_isolates_unreadable_venvs(paths):
+    plugin_path, registry_path = paths
+    for index in range(20):
+        make_venv(plugin_path, f'forge-plugin{index}')
+    broken_path = os.path.join(plugin_path, 'forge-plugin7', registry.METADATA_FILE_NAME)
+    with open(broken_path, 'w') as metadata_file:
+        metadata_file.write('{')
+    errors = []
+
+    venvs = registry.refresh_registry(
+        plugin_path, registry_path, on_error=lambda name, message: errors.append(name)
+    )
+
+    assert len(venvs) == 19
+    assert 'forge-plugin7' not in venvs
+    assert errors == ['forge-plugin7']
+    assert 'forge-plugin7' not in registry.load_registry(registry_path)
+
+
+def test_refresh_registry_unchanged_does_not_rewrite(paths):
+    plugin_path, registry_path = paths
+    make_venv(plugin_path, 'forge-plugin1')
+    registry.refresh_registry(plugin_path, registry_path)
+
+    with patch('forge.registry.save_registry') as mocked_save:
+        registry.refresh_registry(plugin_path, registry_path)
+
+    mocked_save.assert_not_called()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='file locks need fcntl')
+def test_refresh_registry_leaves_saving_to_a_concurrent_writer(paths):
+    plugin_path, registry_path = paths
+    make_venv(plugin_path, 'forge-plugin1')
+
+    with storage.file_lock(registry.get_registry_lock_path(registry_path)):
+        assert set(registry.refresh_registry(plugin_path, registry_path)) == {'forge-plugin1'}
+
+    assert not os.path.exists(registry_path)
+
+
+def test_refresh_registry_drops_removed_venvs(paths):
+    plugin_path, registry_path = paths
+    venv_path = make_venv(plugin_path, 'forge-plugin1')
+    registry.refresh_registry(plugin_path, registry_path)
+
+    os.remove(os.path.join(venv_path, registry.METADATA_FILE_NAME))
+    os.rmdir(venv_path)
+
+    assert registry.refresh_registry(plugin_path, registry_path) == {}
+    assert registry.load_registry(registry_path) == {}
+
+
+def test_refresh_registry_missing_plugin_path(tmp_path):
+    registry_path = str(tmp_path / 'registry.json')
+    assert registry.refresh_registry(str(tmp_path / 'missing'), registry_path) == {}
+
+
+@pytest.mark.parametrize('content', ['', 'not json', '[]', '{"version": 0, "venvs": {"a": {}}}'])
+def test_load_registry_invalid_index(tmp_path, content):
+    registry_path = tmp_path / 'registry.json'
+    registry_path.write_text(content)
+
+    assert registry.load_registry(str(registry_path)) == {}
+
+
+def test_update_registry_entry(paths):
+    plugin_path, registry_path = paths
+    venv_path = make_venv(plugin_path, 'forge-plugin1')
+
+    registry.update_registry_entry(plugin_path, registry_path, 'forge-plugin1')
+    assert list(registry.load_registry(registry_path)) == ['forge-plugin1']
+
+    os.remove(os.path.join(venv_path, registry.METADATA_FILE_NAME))
+    os.rmdir(venv_path)
+
+    registry.update_registry_entry(plugin_path, registry_path, 'forge-plugin1')
+    assert registry.load_registry(registry_path) == {}
+
+
+def test_update_registry_entry_ignores_other_venvs(paths):
+    plugin_path, registry_path = paths
+    make_venv(plugin_path, 'black')
+
+    assert registry.update_registry_entry(plugin_path, registry_path, 'black') == {}
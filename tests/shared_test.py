@@ -0,0 +1,162 @@
+import json
+import os
+
+import pytest
+from forge import forge, shared, util
+from forge.exceptions import PluginManagementFatalException
+from mock import patch
+
+from .conftest import make_venv
+
+
+def add_distribution(venv_path, name, version, size=100, python='python3.9'):
+    """ Fake installed distribution, a dist-info with a RECORD and one module file """
+    site_packages = os.path.join(str(venv_path), 'lib', python, 'site-packages')
+    dist_info = os.path.join(site_packages, f'{name}-{version}.dist-info')
+    os.makedirs(dist_info, exist_ok=True)
+    with open(os.path.join(site_packages, f'{name}.py'), 'w') as module_file:
+        module_file.write('x' * size)
+    with open(os.path.join(dist_info, 'RECORD'), 'w') as record_file:
+        record_file.write(f'{name}.py,sha256=abc,{size}\n')
+    return site_packages
+
+
+def fake_pip(venv_path, pip_args, pip_env=None):
+    """ pip stand-in that installs pinned requirements and uninstalls by name """
+    if pip_args[0] == 'install':
+        for requirement in pip_args[2:]:
+            add_distribution(venv_path, *requirement.split('=='))
+    else:
+        site_packages = util.get_site_packages(venv_path)
+        for name in pip_args[2:]:
+            distribution = shared.read_distributions(site_packages)[name]
+            os.remove(os.path.join(site_packages, f'{name}.py'))
+            os.remove(os.path.join(distribution.dist_info, 'RECORD'))
+            os.rmdir(distribution.dist_info)
+    return ''
+
+
+def test_read_distributions(tmp_path):
+    site_packages = add_distribution(tmp_path, 'Typing_Extensions', '4.0.0')
+
+    distributions = shared.read_distributions(site_packages)
+
+    assert list(distributions) == ['typing-extensions']
+    assert distributions['typing-extensions'].version == '4.0.0'
+    assert shared.get_distribution_size(site_packages, distributions['typing-extensions']) == 100
+
+
+def test_find_common_distributions():
+    def dists(**versions):
+        return {name: shared.Distribution(name, version, '') for name, version in versions.items()}
+
+    common = shared.find_common_distributions([
+        dists(click='8.0', pip='21', requests='2.0', six='1.0'),
+        dists(click='8.0', pip='21', requests='2.1'),
+        dists(click='8.0', six='1.0')
+    ], min_plugins=2)
+
+    assert common == {'click': '8.0', 'six': '1.0'}
+
+
+def test_is_enabled(tmp_path, monkeypatch):
+    assert not shared.is_enabled(str(tmp_path))
+
+    add_distribution(tmp_path, 'pip', '21')
+    assert shared.is_enabled(str(tmp_path))
+
+    monkeypatch.setenv('FORGE_SHARED', '0')
+    assert not shared.is_enabled(str(tmp_path))
+
+
+@patch('forge.shared.run_pip', side_effect=fake_pip)
+def test_sync_layer(_, forge_home):
+    alpha = make_venv(forge.PLUGIN_PATH, 'forge-alpha')
+    beta = make_venv(forge.PLUGIN_PATH, 'forge-beta')
+    for venv_path in (alpha, beta):
+        add_distribution(venv_path, 'click', '8.0', size=1000)
+        add_distribution(venv_path, 'pip', '21')
+    add_distribution(alpha, 'requests', '2.0')
+    add_distribution(beta, 'requests', '2.1')
+    shared_path = forge.get_shared_path()
+    add_distribution(shared_path, 'pip', '22')
+
+    assert forge.sync_shared_layer(min_plugins=2) == ['click']
+
+    for venv_path in (alpha, beta):
+        site_packages = util.get_site_packages(venv_path)
+        assert sorted(shared.read_distributions(site_packages)) == ['pip', 'requests']
+        with open(os.path.join(site_packages, shared.PTH_FILE_NAME)) as pth_file:
+            assert pth_file.read() == util.get_site_packages(shared_path) + '\n'
+    savings = shared.load_savings(shared_path)
+    assert savings['plugins']['forge-alpha']['bytes'] == 1000
+    assert savings['plugins']['forge-beta']['packages'] == ['click']
+
+
+@patch('forge.shared.run_pip', side_effect=fake_pip)
+def test_sync_layer_keeps_shared_versions(mock_pip, tmp_path):
+    shared_path = str(tmp_path / 'shared')
+    add_distribution(shared_path, 'click', '7.0')
+    venvs = {name: str(tmp_path / name) for name in ('forge-alpha', 'forge-beta')}
+    for venv_path in venvs.values():
+        add_distribution(venv_path, 'click', '8.0')
+
+    assert shared.sync_layer(shared_path, venvs) == []
+
+    mock_pip.assert_not_called()
+    assert shared.read_distributions(util.get_site_packages(shared_path))['click'].version == '7.0'
+
+
+@patch('forge.shared.run_pip', side_effect=fake_pip)
+def test_sync_layer_skips_other_python_versions(_, tmp_path):
+    shared_path = str(tmp_path / 'shared')
+    add_distribution(shared_path, 'pip', '21')
+    venvs = {'forge-alpha': str(tmp_path / 'forge-alpha'), 'forge-beta': str(tmp_path / 'beta')}
+    add_distribution(venvs['forge-alpha'], 'click', '8.0', python='python3.8')
+    add_distribution(venvs['forge-beta'], 'click', '8.0')
+
+    assert shared.sync_layer(shared_path, venvs) == []
+
+    assert not os.path.exists(os.path.join(
+        util.get_site_packages(venvs['forge-alpha']), shared.PTH_FILE_NAME
+    ))
+
+
+@patch('forge.shared.run_pip')
+def test_finish_install(mock_pip, tmp_path):
+    shared_path = str(tmp_path / 'shared')
+    shared_site_packages = add_distribution(shared_path, 'click', '8.0', size=2000)
+    venv_path = str(tmp_path / 'forge-alpha')
+    site_packages = add_distribution(venv_path, 'forge-alpha', '1.0')
+    mock_pip.return_value = (
+        f'Requirement already satisfied: click>=7 in {shared_site_packages} (from forge-alpha) (8.0)\n'
+        f'Requirement already satisfied: forge-alpha in {site_packages} (1.0)\n'
+        'Collecting requests\n'
+    )
+
+    shared.finish_install(shared_path, venv_path, 'forge-alpha', {'PIP_FIND_LINKS': '/wheels'})
+
+    mock_pip.assert_called_once_with(venv_path, ['install', 'forge-alpha'],
+                                     {'PIP_FIND_LINKS': '/wheels'})
+    assert os.path.exists(os.path.join(site_packages, shared.PTH_FILE_NAME))
+    assert shared.load_savings(shared_path)['plugins']['forge-alpha'] == {
+        'bytes': 2000, 'packages': ['click'], 'seconds': 0.0
+    }
+
+
+def test_run_pip_failure(tmp_path):
+    with pytest.raises(PluginManagementFatalException):
+        shared.run_pip(str(tmp_path), ['install', 'nothing'])
+
+
+def test_format_savings(tmp_path):
+    with open(tmp_path / shared.SAVINGS_FILE_NAME, 'w') as savings_file:
+        savings_file.write(json.dumps({'plugins': {
+            'forge-alpha': {'bytes': 2500000, 'packages': ['click', 'six'], 'seconds': 1.5},
+            'forge-beta': {'bytes': 500000, 'packages': ['click'], 'seconds': 0.5}
+        }}))
+
+    table = shared.format_savings(shared.load_savings(str(tmp_path)))
+
+    assert 'alpha' in table and '2.5 MB' in table
+    assert table.splitlines()[-1].split() == ['total', '3', '3.0', 'MB', '2.0', 's']
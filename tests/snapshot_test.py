@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+from forge import forge, registry, snapshot
+from forge.cli import forge_cli
+from mock import patch
+
+from .conftest import make_plugin_venv, make_venv
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='snapshots POSIX venv layouts')
+
+
+def get_module_path(venv_path):
+    python = f'python{sys.version_info[0]}.{sys.version_info[1]}'
+    return os.path.join(venv_path, 'lib', python, 'site-packages', 'forge_inprocess_hello.py')
+
+
+def make_snapshotted_venv(forge_home):
+    venv_path = os.path.dirname(os.path.dirname(make_plugin_venv(forge_home / 'venvs')))
+    os.makedirs(os.path.join(venv_path, 'bin'))
+    os.symlink(sys.executable, os.path.join(venv_path, 'bin', 'python'))
+    return venv_path, forge.take_plugin_snapshot('forge-hello')
+
+
+def upgrade(venv_path, version='2.0.0'):
+    """ Changes a venv the way pip and pipx do: new module files, metadata rewritten in place """
+    os.remove(get_module_path(venv_path))
+    with open(get_module_path(venv_path), 'w') as module_file:
+        module_file.write('def main():\n    return 0\n')
+    make_venv(os.path.dirname(venv_path), 'forge-hello', apps=['hello'], package_version=version)
+
+
+def test_take_links_files_and_copies_top_level(forge_home):
+    venv_path, snapshot_path = make_snapshotted_venv(forge_home)
+
+    assert snapshot.get_version(snapshot_path) == '1.0.0'
+    assert os.path.samefile(get_module_path(venv_path), get_module_path(snapshot_path))
+    assert not os.path.samefile(os.path.join(venv_path, registry.METADATA_FILE_NAME),
+                                os.path.join(snapshot_path, registry.METADATA_FILE_NAME))
+    assert os.readlink(os.path.join(snapshot_path, 'bin', 'python')) == sys.executable
+
+
+def test_keep_plugin_snapshot_drops_unchanged_and_prunes(forge_home, monkeypatch):
+    venv_path, unchanged = make_snapshotted_venv(forge_home)
+    forge.keep_plugin_snapshot('forge-hello', unchanged)
+    assert forge.list_plugin_snapshots('forge-hello') == []
+
+    monkeypatch.setenv(snapshot.KEEP_ENV_VAR, '1')
+    for version in ('2.0.0', '3.0.0'):
+        snapshot_path = forge.take_plugin_snapshot('forge-hello')
+        upgrade(venv_path, version)
+        forge.keep_plugin_snapshot('forge-hello', snapshot_path)
+
+    assert forge.list_plugin_snapshots('forge-hello') == ['2.0.0']
+
+
+def test_cli_rollback(forge_home, capsys):
+    venv_path, snapshot_path = make_snapshotted_venv(forge_home)
+    upgrade(venv_path)
+    forge.update_plugin_index('forge-hello')
+    forge.keep_plugin_snapshot('forge-hello', snapshot_path)
+
+    with patch('sys.argv', ['forge', 'rollback', '-n', 'hello']), pytest.raises(SystemExit):
+        forge_cli()
+
+    assert 'Rolled back forge-hello to 1.0.0' in capsys.readouterr().out
+    with open(get_module_path(venv_path)) as module_file:
+        assert 'return 3' in module_file.read()
+    assert forge.find_plugin('hello')['main_package']['package_version'] == '1.0.0'
+    assert forge.list_plugin_snapshots('forge-hello') == []
+    assert os.listdir(forge.get_snapshots_path('forge-hello')) == []
+
+
+def test_cli_rollback_without_snapshot(forge_home, capsys):
+    make_plugin_venv(forge_home / 'venvs')
+
+    with patch('sys.argv', ['forge', 'rollback', '-n', 'hello']), pytest.raises(SystemExit) as err:
+        forge_cli()
+
+    assert err.value.code == 1
+    assert 'No snapshot of forge-hello to roll back to' in capsys.readouterr().err
@@ -0,0 +1,73 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+
+IMPORT_TIME_BUDGET_US = 500000
+HEAVY_MODULES = ('pkg_resources', 'halo', 'tabulate', 'forge.pipx_wrapper')
+
+
+def parse_import_times(stderr):
+    """ Map imported module names to their self import time in microseconds """
+    import_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_time, _, module = line[len('import time:'):].split('|')
+        import_times[module.strip()] = int(self_time)
+    return import_times
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='plugin stub is a shell script')
+def test_plugin_dispatch_import_time(tmp_path):
+    venv_path = tmp_path / '.forge' / 'venvs' / 'forge-hello'
+    venv_path.mkdir(parents=True)
+    (venv_path / 'pipx_metadata.json').write_text(json.dumps({'main_package': {
+        'package': 'forge-hello', 'apps': ['hello'], 'package_version': '1.0.0'
+    }}))
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    plugin = bin_path / 'hello'
+    plugin.write_text('#!/bin/sh\nexit 0\n')
+    plugin.chmod(plugin.stat().st_mode | stat.S_IEXEC)
+
+    env = dict(os.environ, HOME=str(tmp_path), PATH=f'{bin_path}{os.pathsep}{os.environ["PATH"]}')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'forge', 'hello'],
+        env=env, cwd=str(tmp_path), stderr=subprocess.PIPE, universal_newlines=True, check=False
+    )
+
+    assert result.returncode == 0, result.stderr
+    import_times = parse_import_times(result.stderr)
+    assert 'forge.cli' in import_times
+    assert not set(HEAVY_MODULES) & set(import_times)
+    assert sum(import_times.values()) < IMPORT_TIME_BUDGET_US
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='plugin stub is a shell script')
+def test_dispatch_table_skips_click(tmp_path):
+    venv_path = tmp_path / '.forge' / 'venvs' / 'forge-hello'
+    (venv_path / 'bin').mkdir(parents=True)
+    (venv_path / 'pipx_metadata.json').write_text(json.dumps({'main_package': {
+        'package': 'forge-hello', 'apps': ['hello'], 'package_version': '1.0.0'
+    }}))
+    plugin = venv_path / 'bin' / 'hello'
+    plugin.write_text('#!/bin/sh\necho "$1"\n')
+    plugin.chmod(plugin.stat().st_mode | stat.S_IEXEC)
+    env = dict(os.environ, HOME=str(tmp_path))
+    subprocess.run([sys.executable, '-m', 'forge', 'list'], env=env, cwd=str(tmp_path), check=True,
+                   stdout=subprocess.PIPE)
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'forge', 'hello', 'world'], env=env,
+        cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+        check=False
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == 'world\n'
+    assert not {'click', 'forge.cli', 'forge.daemon', 'socketserver', 'concurrent.futures'} \
+        & set(parse_import_times(result.stderr))
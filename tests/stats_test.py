@@ -0,0 +1,112 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+from forge import dispatch, forge, stats
+from forge.cli import forge_cli
+from mock import patch
+
+
+def make_run(name='hello', version='1.0', wall_time=1.0, exit_code=0, started_at=1000.0):
+    return stats.Run(started_at, name, version, wall_time, 0.5, 20480, exit_code)
+
+
+@pytest.fixture
+def versioned_table(forge_home):
+    dispatch.write_table(forge.get_dispatch_table_path(), forge.PLUGIN_PATH, {},
+                         {'hello': '2.1.0'})
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='exec dispatch is POSIX only')
+@patch('forge.dispatch.get_dispatch_mode', return_value=dispatch.EXEC_MODE)
+def test_run_plugin_records_exec_run_when_measuring_all(mock_mode, versioned_table, monkeypatch):
+    monkeypatch.setenv(stats.STATS_ENV_VAR, '1')
+    command = ['hello', '-c', 'import sys; sys.exit(3)']
+
+    with pytest.raises(SystemExit) as err:
+        dispatch.run_plugin(command, sys.executable, stats_path=forge.get_stats_path())
+
+    assert err.value.code == 3
+    [run] = forge.get_plugin_runs()
+    assert (run.name, run.version, run.exit_code) == ('hello', '2.1.0', 3)
+    assert run.wall_time > 0 and run.max_rss_kb > 0
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='exec dispatch is POSIX only')
+def test_exec_dispatched_runs_record_their_launch(tmp_path):
+    venv_path = tmp_path / '.forge' / 'venvs' / 'forge-hello'
+    (venv_path / 'bin').mkdir(parents=True)
+    (venv_path / 'pipx_metadata.json').write_text(json.dumps({'main_package': {
+        'package': 'forge-hello', 'apps': ['hello'], 'package_version': '1.0.0'
+    }}))
+    plugin = venv_path / 'bin' / 'hello'
+    plugin.write_text('#!/bin/sh\nexit 0\n')
+    plugin.chmod(plugin.stat().st_mode | stat.S_IEXEC)
+    env = dict(os.environ, HOME=str(tmp_path))
+    env.pop(stats.STATS_ENV_VAR, None)
+    subprocess.run([sys.executable, '-m', 'forge', 'list'], env=env, check=True, stdout=subprocess.PIPE)
+
+    subprocess.run([sys.executable, '-m', 'forge', 'hello'], env=env, check=True)
+
+    [run] = stats.read_runs(str(tmp_path / '.forge' / stats.STATS_FILE_NAME))
+    assert (run.name, run.version, run.exit_code) == ('hello', '1.0.0', stats.EXEC_EXIT_CODE)
+    assert 0 < run.wall_time < 60
+
+
+def test_summarize_counts_exec_launches_apart():
+    runs = [make_run(wall_time=2.0), make_run(wall_time=0.02, exit_code=stats.EXEC_EXIT_CODE)]
+
+    [row] = stats.summarize(runs)
+
+    assert row[2:9] == ['2', '0', '2.00s', '2.00s', '0.50s', '20 MB', '0.02s']
+    assert stats.summarize(runs[1:])[0][2:10] == ['1', '0', '-', '-', '-', '-', '0.02s', '']
+
+
+@patch('forge.dispatch.get_dispatch_mode', return_value=dispatch.SPAWN_MODE)
+@patch('forge.dispatch.Popen')
+def test_run_plugin_records_nothing_when_disabled(mock_popen, mock_mode, monkeypatch):
+    monkeypatch.setenv(stats.STATS_ENV_VAR, '0')
+    mock_popen.return_value.returncode = 0
+
+    with pytest.raises(SystemExit):
+        dispatch.run_plugin(['hello'], stats_path=forge.get_stats_path())
+
+    assert not os.path.exists(forge.get_stats_path())
+
+
+def test_append_keeps_the_most_recent_runs(tmp_path):
+    stats_path = str(tmp_path / stats.STATS_FILE_NAME)
+
+    for index in range(7):
+        stats.append(stats_path, make_run(started_at=index), capacity=3)
+
+    assert os.path.getsize(stats_path) == 4 * stats.RECORD.size
+    assert [run.started_at for run in stats.read_runs(stats_path, capacity=3)] == [4, 5, 6]
+
+
+def test_summarize_shows_trend_across_versions():
+    runs = [make_run(wall_time=wall_time, started_at=index)
+            for index, wall_time in enumerate([1.0, 1.0, 3.0])] + \
+        [make_run(version='1.1', wall_time=2.0, exit_code=1, started_at=10)]
+
+    rows = stats.summarize(runs)
+
+    assert [row[:6] for row in rows] == [
+        ['hello', '1.0', '3', '0', '1.00s', '3.00s'],
+        ['hello', '1.1', '1', '1', '2.00s', '2.00s']
+    ]
+    assert [row[9] for row in rows] == ['', '+100%']
+
+
+def test_cli_stats(forge_home, capsys):
+    for name in ('hello', 'other'):
+        stats.append(forge.get_stats_path(), make_run(name=name))
+
+    with patch('sys.argv', ['forge', 'stats', '-n', 'forge-hello']), pytest.raises(SystemExit):
+        forge_cli()
+
+    output = capsys.readouterr().out
+    assert 'hello' in output and 'other' not in output
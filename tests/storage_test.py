@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+import pytest
+from forge import storage
+from mock import patch
+
+
+class FakeMsvcrt:
+    """ msvcrt byte range locks, shared by every descriptor of a file like on Windows """
+    LK_NBLCK = 2
+    LK_UNLCK = 0
+
+    def __init__(self):
+        self.held = {}
+
+    def locking(self, descriptor, mode, length):
+        start = os.lseek(descriptor, 0, os.SEEK_CUR)
+        held = self.held.setdefault(os.fstat(descriptor).st_ino, set())
+        locked_range = set(range(start, start + length))
+        if mode == self.LK_UNLCK:
+            held -= locked_range
+        elif held & locked_range:
+            raise OSError('locked')
+        else:
+            held |= locked_range
+
+
+@pytest.fixture(params=['fcntl', 'msvcrt'])
+def lock_backend(request):
+    if request.param == 'fcntl':
+        if storage.fcntl is None:
+            pytest.skip('flock needs fcntl')
+        yield
+        return
+    with patch.object(storage, 'fcntl', None), patch('sys.platform', 'win32'), \
+            patch.object(storage, 'msvcrt', FakeMsvcrt(), create=True):
+        yield
+
+
+def is_free(lock_path, shared=False):
+    with storage.file_lock(lock_path, shared=shared, blocking=False) as locked:
+        return locked
+
+
+def test_file_lock_shared_and_exclusive(tmp_path, lock_backend):
+    lock_path = storage.get_lock_path(str(tmp_path), 'plugin')
+
+    with storage.file_lock(lock_path, shared=True) as locked:
+        assert locked
+        assert is_free(lock_path, shared=True)
+        assert not is_free(lock_path)
+
+    with storage.file_lock(lock_path):
+        assert not is_free(lock_path, shared=True)
+        assert is_free(storage.get_lock_path(str(tmp_path), 'other'))
+
+    assert is_free(lock_path)
+
+
+def test_file_lock_waits_for_the_holder(tmp_path, lock_backend):
+    lock_path = storage.get_lock_path(str(tmp_path), 'plugin')
+    waits = []
+    releasing = threading.Event()
+
+    def hold():
+        with storage.file_lock(lock_path):
+            holding.set()
+            time.sleep(0.2)
+            releasing.set()
+
+    holding = threading.Event()
+    holder = threading.Thread(target=hold)
+    holder.start()
+    holding.wait(5)
+    with storage.file_lock(lock_path, on_wait=lambda: waits.append(time.time())) as locked:
+        assert locked and releasing.is_set()
+    holder.join()
+
+    assert len(waits) == 1
+
+
+def test_file_lock_readers_take_separate_slots(tmp_path, lock_backend):
+    lock_path = storage.get_lock_path(str(tmp_path), 'plugin')
+
+    with storage.file_lock(lock_path, shared=True), storage.file_lock(lock_path, shared=True):
+        assert is_free(lock_path, shared=True)
+        assert not is_free(lock_path)
+
+    assert is_free(lock_path)
+
+
+def test_atomic_write_bytes(tmp_path):
+    path = str(tmp_path / 'cache' / 'data.bin')
+
+    storage.atomic_write(path, b'\x00\x01')
+
+    with open(path, 'rb') as written_file:
+        assert written_file.read() == b'\x00\x01'
+    assert os.listdir(str(tmp_path / 'cache')) == ['data.bin']
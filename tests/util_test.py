@@ -0,0 +1,20 @@
+import pytest
+from forge import util
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('forge-demo', True),
+    ('Forge_Demo[extra]>=1.0,<2', True),
+    ('forge-demo==1.0', True),
+    ('git+https://example.com/forge-demo.git', False),
+    ('forge-demo @ https://example.com/forge_demo-1.0.tar.gz', False),
+    ('/home/me/forge-demo', False),
+    ('./forge-demo', False),
+    ('forge_demo-1.0-py3-none-any.whl', False)
+])
+def test_is_plain_requirement(source, expected):
+    assert util.is_plain_requirement(source) == expected
+
+
+def test_normalize_name():
+    assert util.normalize_name('Forge_Demo.Plugin') == 'forge-demo-plugin'
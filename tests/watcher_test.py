@@ -0,0 +1,60 @@
+import sys
+import threading
+
+import pytest
+from forge import watcher
+from mock import patch
+
+
+def run_watcher(get_paths):
+    """ Starts a watcher thread and waits until it is watching """
+    changed = threading.Event()
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.watch, args=(get_paths, changed.set, stop), daemon=True)
+    thread.start()
+    assert changed.wait(5)
+    changed.clear()
+    return changed, stop, thread
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_watch_notices_new_venv(tmp_path):
+    changed, stop, thread = run_watcher(lambda: [str(tmp_path)])
+
+    try:
+        assert not changed.wait(0.2)
+        (tmp_path / 'forge-plugin1').mkdir()
+        assert changed.wait(5)
+    finally:
+        stop.set()
+        thread.join(5)
+    assert not thread.is_alive()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_watch_rewatches_after_change(tmp_path):
+    venv_path = tmp_path / 'forge-plugin1'
+    changed, stop, thread = run_watcher(
+        lambda: [str(tmp_path)] + [str(path) for path in tmp_path.iterdir()]
+    )
+
+    try:
+        venv_path.mkdir()
+        assert changed.wait(5)
+        changed.clear()
+        (venv_path / 'pipx_metadata.json').write_text('{}')
+        assert changed.wait(5)
+    finally:
+        stop.set()
+        thread.join(5)
+
+
+@patch('forge.watcher.POLL_INTERVAL', 0.01)
+@patch('forge.watcher.load_inotify', return_value=None)
+def test_watch_polls_without_inotify(_, tmp_path):
+    changed, stop, thread = run_watcher(lambda: [str(tmp_path)])
+
+    assert changed.wait(5)
+    stop.set()
+    thread.join(5)
+    assert not thread.is_alive()
@@ -0,0 +1,200 @@
+import os
+import sys
+import threading
+import time
+from subprocess import CompletedProcess, TimeoutExpired
+
+import pytest
+from forge import forge, wheelhouse
+from forge.exceptions import PluginManagementFatalException
+from forge.util import get_python_path
+from mock import patch
+
+from .conftest import make_venv
+
+GIT_SOURCE = 'git+https://example.com/forge-demo.git'
+PINNED_SOURCE = f'{GIT_SOURCE}@{"a" * 40}'
+
+
+def fake_pip_wheel(wheel_names):
+    """ pip wheel stand-in that writes the given wheels into --wheel-dir and reports them """
+    def run(command, **kwargs):
+        wheel_dir = command[command.index('--wheel-dir') + 1]
+        for wheel_name in wheel_names:
+            with open(os.path.join(wheel_dir, wheel_name), 'w') as wheel_file:
+                wheel_file.write('wheel')
+        output = ''.join(f'Saved {os.path.join(wheel_dir, name)}\n' for name in wheel_names)
+        return CompletedProcess(command, 0, stdout=output)
+    return run
+
+
+def add_wheel(wheel_dir, name, size, age):
+    """ Wheel of a given size last used age seconds ago """
+    path = os.path.join(str(wheel_dir), name)
+    with open(path, 'w') as wheel_file:
+        wheel_file.write('x' * size)
+    os.utime(path, (time.time() - age, time.time() - age))
+    return path
+
+
+def test_get_pip_env():
+    assert wheelhouse.get_pip_env('/wheels', offline=False) == {'PIP_FIND_LINKS': '/wheels'}
+    assert wheelhouse.get_pip_env('/wheels', offline=True) == {
+        'PIP_FIND_LINKS': '/wheels', 'PIP_NO_INDEX': '1'
+    }
+
+
+@pytest.mark.parametrize('source, expected', [
+    (GIT_SOURCE, True),
+    ('hg+https://example.com/forge-demo', True),
+    ('forge-demo==1.0', False),
+    ('./forge-demo', False)
+])
+def test_is_vcs_source(source, expected):
+    assert wheelhouse.is_vcs_source(source) == expected
+
+
+@patch('forge.wheelhouse.run')
+def test_prepare_index_source(mock_run, tmp_path):
+    mock_run.side_effect = fake_pip_wheel(
+        ['forge_demo-1.0-py3-none-any.whl', 'click-8.0-py3-none-any.whl']
+    )
+
+    install_spec, pip_env = wheelhouse.prepare(str(tmp_path), 'forge-demo')
+
+    assert install_spec == 'forge-demo'
+    assert pip_env == {'PIP_FIND_LINKS': str(tmp_path)}
+    assert mock_run.call_args.args[0][0] == sys.executable
+    assert mock_run.call_args.args[0][-1] == 'forge-demo'
+    assert os.path.exists(tmp_path / 'click-8.0-py3-none-any.whl')
+
+
+@patch('forge.wheelhouse.run')
+def test_prepare_vcs_source_builds_once_when_pinned(mock_run, tmp_path):
+    mock_run.side_effect = fake_pip_wheel(['forge_demo-1.0-py3-none-any.whl'])
+
+    first, _ = wheelhouse.prepare(str(tmp_path), PINNED_SOURCE)
+    calls = mock_run.call_count
+    second, _ = wheelhouse.prepare(str(tmp_path), PINNED_SOURCE)
+
+    assert first == second == PINNED_SOURCE
+    assert os.path.exists(tmp_path / 'forge_demo-1.0-py3-none-any.whl')
+    assert calls == 2
+    assert mock_run.call_count == 3
+    assert PINNED_SOURCE not in mock_run.call_args.args[0]
+
+
+@patch('forge.wheelhouse.run')
+def test_prepare_falls_back_to_source_when_build_fails(mock_run, tmp_path):
+    mock_run.return_value = CompletedProcess([], 1, stdout='no wheel package')
+
+    assert wheelhouse.prepare(str(tmp_path), GIT_SOURCE)[0] == GIT_SOURCE
+
+
+@patch('forge.wheelhouse.run')
+def test_run_pip_wheel_times_out(mock_run, tmp_path, monkeypatch):
+    monkeypatch.setenv('FORGE_BUILD_TIMEOUT', '5')
+    mock_run.side_effect = TimeoutExpired(['pip'], 5.0)
+
+    with pytest.raises(PluginManagementFatalException, match='timed out after 5 seconds'):
+        wheelhouse.run_pip_wheel(str(tmp_path), ['forge-demo'], [], sys.executable)
+    assert mock_run.call_args.kwargs['timeout'] == 5.0
+
+
+@patch('forge.wheelhouse.run')
+def test_prepare_offline(mock_run, tmp_path):
+    mock_run.side_effect = fake_pip_wheel(['forge_demo-1.0-py3-none-any.whl'])
+    wheelhouse.prepare(str(tmp_path), GIT_SOURCE)
+    mock_run.reset_mock()
+
+    install_spec, pip_env = wheelhouse.prepare(str(tmp_path), GIT_SOURCE, offline=True)
+
+    mock_run.assert_not_called()
+    assert install_spec == str(tmp_path / 'forge_demo-1.0-py3-none-any.whl')
+    assert pip_env['PIP_NO_INDEX'] == '1'
+    assert wheelhouse.prepare(str(tmp_path), 'forge-other', offline=True)[0] == 'forge-other'
+    with pytest.raises(PluginManagementFatalException):
+        wheelhouse.prepare(str(tmp_path), f'{GIT_SOURCE}@main', offline=True)
+
+
+def test_prepare_builds_different_requirements_side_by_side(tmp_path):
+    barrier = threading.Barrier(2, timeout=5)
+    build = fake_pip_wheel(['click-8.0-py3-none-any.whl'])
+
+    def run(command, **kwargs):
+        barrier.wait()
+        return build(command, **kwargs)
+
+    with patch('forge.wheelhouse.run', side_effect=run):
+        threads = [threading.Thread(target=wheelhouse.prepare, args=(str(tmp_path), requirement))
+                   for requirement in ('forge-demo', 'forge-other')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert not barrier.broken
+
+
+def test_evict_least_recently_used(tmp_path):
+    wheel_dir = tmp_path / 'wheels'
+    wheel_dir.mkdir()
+    add_wheel(wheel_dir, 'old-1.0-py3-none-any.whl', 100, age=300)
+    add_wheel(wheel_dir, 'plugin-1.0-py3-none-any.whl', 100, age=200)
+    add_wheel(wheel_dir, 'recent-1.0-py3-none-any.whl', 100, age=100)
+    add_wheel(wheel_dir, 'new-1.0-py3-none-any.whl', 100, age=0)
+    with open(wheel_dir / wheelhouse.SOURCES_FILE_NAME, 'w') as sources_file:
+        sources_file.write(f'{{"{GIT_SOURCE}": "plugin-1.0-py3-none-any.whl"}}')
+
+    removed = wheelhouse.evict(str(wheel_dir), max_bytes=250)
+
+    assert removed == ['old-1.0-py3-none-any.whl', 'recent-1.0-py3-none-any.whl']
+    assert sorted(os.listdir(wheel_dir)) == [
+        'new-1.0-py3-none-any.whl', 'plugin-1.0-py3-none-any.whl', wheelhouse.SOURCES_FILE_NAME
+    ]
+
+
+@patch('forge.wheelhouse.prepare')
+def test_prepare_wheelhouse_disabled(mock_prepare):
+    assert forge.prepare_wheelhouse('forge-demo', '/usr/bin/python3') == ('forge-demo', {})
+    mock_prepare.assert_not_called()
+
+
+@patch('forge.wheelhouse.prepare', return_value=('forge-demo', {}))
+def test_prepare_wheelhouse_offline(mock_prepare, monkeypatch):
+    monkeypatch.delenv('FORGE_WHEELHOUSE')
+    monkeypatch.setenv('FORGE_OFFLINE', '1')
+
+    forge.prepare_wheelhouse('forge-demo', '/usr/bin/python3')
+
+    mock_prepare.assert_called_once_with(
+        forge.get_wheelhouse_path(), 'forge-demo', True, '/usr/bin/python3'
+    )
+
+
+def test_prepare_upgrade_wheelhouse_builds_index_installs(forge_home, wheelhouse_builds):
+    make_venv(forge_home / 'venvs', 'forge-demo', source='forge-demo')
+
+    pip_env = forge.prepare_upgrade_wheelhouse('forge-demo')
+
+    assert pip_env == {'PIP_FIND_LINKS': forge.get_wheelhouse_path()}
+    assert [command[-1] for command in wheelhouse_builds] == ['forge-demo']
+    assert wheelhouse_builds[0][0] == get_python_path(str(forge_home / 'venvs' / 'forge-demo'))
+
+
+def test_prepare_upgrade_wheelhouse_skips_other_sources(forge_home, wheelhouse_builds):
+    make_venv(forge_home / 'venvs', 'forge-demo', source=GIT_SOURCE)
+    make_venv(forge_home / 'venvs', 'forge-local', source='/src/forge-local')
+
+    assert forge.prepare_upgrade_wheelhouse('forge-demo') == {
+        'PIP_FIND_LINKS': forge.get_wheelhouse_path()
+    }
+    assert forge.prepare_upgrade_wheelhouse('forge-local')['PIP_FIND_LINKS']
+    assert forge.prepare_upgrade_wheelhouse('forge-missing')['PIP_FIND_LINKS']
+    assert not wheelhouse_builds
+
+
+def test_prepare_upgrade_wheelhouse_disabled(forge_home):
+    make_venv(forge_home / 'venvs', 'forge-demo')
+
+    assert forge.prepare_upgrade_wheelhouse('forge-demo') == {}
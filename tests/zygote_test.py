@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from forge import registry, stats, zygote
+
+from .conftest import make_plugin_venv
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='zygotes need fork')
+
+ENTRY_POINTS = '[forge.inprocess]\nhello = forge_inprocess_hello:main\n'
+
+
+def start_zygote(executable, socket_path):
+    """ Serves a plugin from a separate process that, like the forge CLI, already imported click """
+    watch_path = os.path.join(os.path.dirname(os.path.dirname(executable)),
+                              registry.METADATA_FILE_NAME)
+    process = subprocess.Popen(
+        [sys.executable, '-c',
+         'import sys; from forge import cli, zygote; zygote.serve(*sys.argv[1:])',
+         socket_path, 'hello', executable, watch_path],
+        env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(zygote.__file__)))
+    )
+    deadline = time.time() + 10
+    while zygote.send_request(socket_path, {'op': 'ping'}) is None and time.time() < deadline:
+        time.sleep(0.05)
+    return process, watch_path
+
+
+@pytest.fixture
+def running_zygote(forge_home, tmp_path):
+    """ A zygote for the fake hello plugin """
+    socket_path = str(tmp_path / 'z.sock')
+    process, watch_path = start_zygote(
+        make_plugin_venv(forge_home / 'venvs', ENTRY_POINTS), socket_path
+    )
+    yield socket_path, watch_path
+    process.terminate()
+    process.wait(10)
+
+
+def test_run_client(running_zygote, capfd):
+    socket_path, _ = running_zygote
+
+    assert zygote.run_client(socket_path, ['hello', 'world']) == 3
+    assert stats.REPORTED_USAGE['max_rss_kb'] > 0
+    assert zygote.run_client(socket_path, ['hello', 'again']) == 3
+
+    assert capfd.readouterr().out == 'hello world\nhello again\n'
+    assert zygote.send_request(socket_path, {'op': 'ping'})['runs'] == 2
+
+
+def test_plugin_imports_its_own_dependencies(forge_home, tmp_path, capfd):
+    executable = make_plugin_venv(forge_home / 'venvs', ENTRY_POINTS)
+    site_packages = os.path.join(os.path.dirname(os.path.dirname(executable)), 'lib',
+                                 f'python{sys.version_info[0]}.{sys.version_info[1]}',
+                                 'site-packages')
+    with open(os.path.join(site_packages, 'click.py'), 'w') as click_file:
+        click_file.write('ORIGIN = "plugin venv"\n')
+    with open(os.path.join(site_packages, 'forge_inprocess_hello.py'), 'w') as module_file:
+        module_file.write('import click\n\ndef main():\n'
+                          '    print(getattr(click, "ORIGIN", "forge"))\n')
+    socket_path = str(tmp_path / 'z.sock')
+    process, _ = start_zygote(executable, socket_path)
+
+    try:
+        assert zygote.run_client(socket_path, ['hello']) == 0
+    finally:
+        process.terminate()
+        process.wait(10)
+
+    assert capfd.readouterr().out == 'plugin venv\n'
+
+
+def test_stop(running_zygote):
+    socket_path, _ = running_zygote
+
+    assert zygote.send_request(socket_path, {'op': 'stop'})['ok']
+
+    deadline = time.time() + 10
+    while os.path.exists(socket_path) and time.time() < deadline:
+        time.sleep(0.05)
+    assert zygote.run_client(socket_path, ['hello']) is None
+
+
+def test_stale_zygote_hands_runs_back(running_zygote):
+    socket_path, watch_path = running_zygote
+    os.utime(watch_path, ns=(0, 0))
+
+    assert zygote.run_client(socket_path, ['hello']) is None
+
+
+def test_run_client_without_zygote(tmp_path, monkeypatch):
+    assert zygote.run_client(str(tmp_path / 'missing.sock'), ['hello']) is None
+
+    monkeypatch.setenv(zygote.ZYGOTE_ENV_VAR, '0')
+    (tmp_path / 'z.sock').write_text('')
+    assert zygote.run_client(str(tmp_path / 'z.sock'), ['hello']) is None
+
+
+@pytest.mark.parametrize('value, code', [(None, 0), (4, 4), ('failed', 1)])
+def test_get_exit_code(value, code):
+    assert zygote.get_exit_code(value) == code